@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AIRecommendation, AIHealthReport
+from .models import AIRecommendation, AIHealthReport, AIJob
 
 @admin.register(AIRecommendation)
 class AIRecommendationAdmin(admin.ModelAdmin):
@@ -19,3 +19,10 @@ class AIHealthReportAdmin(admin.ModelAdmin):
     def get_user(self, obj):
         return obj.pet.user if hasattr(obj.pet, 'user') else None
     get_user.short_description = 'User'
+
+@admin.register(AIJob)
+class AIJobAdmin(admin.ModelAdmin):
+    list_display = ('pet', 'user', 'kind', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'created_at')
+    search_fields = ('pet__name', 'user__email', 'error')
+    readonly_fields = ('recommendation', 'health_report', 'started_at', 'finished_at', 'attempts', 'error')
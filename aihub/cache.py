@@ -0,0 +1,65 @@
+"""
+Reuse of recent AI answers for an unchanged pet profile.
+
+A stored AIRecommendation / AIHealthReport is served again when it was
+generated from the same fingerprint (canonical get_full_profile_for_ai()
+text, prompt template version and model name) less than
+AIHUB_RESPONSE_CACHE_MAX_AGE seconds ago. Reuse is counted in
+AIUsage.meal_cache_hits / health_cache_hits, never in the billable
+meal_used / health_used counters.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils.timezone import now
+
+from subscription.models import AIUsage, first_day_of_current_month
+from .models import AIRecommendation, AIHealthReport
+
+
+def profile_fingerprint(pet_profile, prompt_version, model):
+    """sha256 over the whitespace-normalized profile, the prompt version and the model."""
+    canonical = "\n".join(" ".join(line.split()) for line in pet_profile.strip().splitlines())
+    return hashlib.sha256(f"{prompt_version}\0{model}\0{canonical}".encode()).hexdigest()
+
+
+def _fresh_since():
+    max_age = getattr(settings, 'AIHUB_RESPONSE_CACHE_MAX_AGE', 3600)
+    if max_age <= 0:
+        return None
+    return now() - timedelta(seconds=max_age)
+
+
+def find_cached_recommendation(pet, recommendation_type, fingerprint):
+    """Newest fresh recommendation of this type generated from `fingerprint`, or None."""
+    since = _fresh_since()
+    if since is None:
+        return None
+    return AIRecommendation.objects.filter(
+        pet=pet,
+        type=recommendation_type,
+        profile_fingerprint=fingerprint,
+        content_json__isnull=False,
+        created_at__gte=since,
+    ).order_by('-created_at').first()
+
+
+def find_cached_health_report(pet, fingerprint):
+    """Newest fresh health report generated from `fingerprint`, or None."""
+    since = _fresh_since()
+    if since is None:
+        return None
+    return AIHealthReport.objects.filter(
+        pet=pet,
+        profile_fingerprint=fingerprint,
+        summary_json__isnull=False,
+        created_at__gte=since,
+    ).order_by('-created_at').first()
+
+
+def record_cache_hit(user, field):
+    """Count one reused answer in this month's AIUsage (`meal_cache_hits` or `health_cache_hits`)."""
+    usage, _ = AIUsage.objects.get_or_create(user=user, month=first_day_of_current_month())
+    AIUsage.objects.filter(pk=usage.pk).update(**{field: F(field) + 1})
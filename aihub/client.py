@@ -0,0 +1,141 @@
+"""
+Shared OpenAI client for the AI hub and the chat assistant.
+
+Each worker process builds one client on first use (after Passenger or
+gunicorn forked it) and reuses its httpx connection pool, so keep-alive
+connections to the API survive between requests instead of paying a new
+TLS handshake per call. Calls go through openai_slot(), which caps the
+number of simultaneous API calls per worker at AIHUB_OPENAI_MAX_CONCURRENCY
+and raises AIClientBusy when no slot frees up within
+AIHUB_OPENAI_QUEUE_TIMEOUT seconds.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+from django.conf import settings
+from openai import OpenAI
+
+
+class AIClientBusy(Exception):
+    """Every API slot of this worker stayed taken for AIHUB_OPENAI_QUEUE_TIMEOUT seconds."""
+
+
+_client = None
+_http_client = None
+_client_lock = threading.Lock()
+_semaphore = None
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'calls': 0,
+    'errors': 0,
+    'waited': 0,
+    'rejected': 0,
+    'in_flight': 0,
+    'peak_in_flight': 0,
+    'total_seconds': 0.0,
+}
+
+
+def _build_client():
+    global _http_client
+    timeout = httpx.Timeout(
+        getattr(settings, 'AIHUB_OPENAI_READ_TIMEOUT', 120),
+        connect=getattr(settings, 'AIHUB_OPENAI_CONNECT_TIMEOUT', 5),
+    )
+    _http_client = httpx.Client(
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=getattr(settings, 'AIHUB_OPENAI_MAX_CONNECTIONS', 10),
+            max_keepalive_connections=getattr(settings, 'AIHUB_OPENAI_MAX_KEEPALIVE', 5),
+            keepalive_expiry=getattr(settings, 'AIHUB_OPENAI_KEEPALIVE_EXPIRY', 60),
+        ),
+    )
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        http_client=_http_client,
+        timeout=timeout,
+        max_retries=getattr(settings, 'AIHUB_OPENAI_MAX_RETRIES', 2),
+    )
+
+
+def get_openai_client():
+    """This worker's OpenAI client, created on first use."""
+    global _client, _semaphore
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _semaphore = threading.BoundedSemaphore(getattr(settings, 'AIHUB_OPENAI_MAX_CONCURRENCY', 4))
+                _client = _build_client()
+    return _client
+
+
+def worst_case_call_seconds():
+    """
+    How long one call through openai_slot() can take before it fails: the
+    wait for a slot, then the first try and every retry running into the
+    connect and read timeouts.
+    """
+    attempts = getattr(settings, 'AIHUB_OPENAI_MAX_RETRIES', 2) + 1
+    per_attempt = getattr(settings, 'AIHUB_OPENAI_CONNECT_TIMEOUT', 5) + getattr(settings, 'AIHUB_OPENAI_READ_TIMEOUT', 120)
+    return getattr(settings, 'AIHUB_OPENAI_QUEUE_TIMEOUT', 30) + attempts * per_attempt
+
+
+def _count(**deltas):
+    with _metrics_lock:
+        for key, value in deltas.items():
+            _metrics[key] += value
+        _metrics['peak_in_flight'] = max(_metrics['peak_in_flight'], _metrics['in_flight'])
+
+
+@contextmanager
+def openai_slot():
+    """
+    Yield the shared client while holding one of this worker's API slots:
+
+        with openai_slot() as client:
+            client.responses.create(...)
+    """
+    client = get_openai_client()
+    if not _semaphore.acquire(blocking=False):
+        _count(waited=1)
+        if not _semaphore.acquire(timeout=getattr(settings, 'AIHUB_OPENAI_QUEUE_TIMEOUT', 30)):
+            _count(rejected=1)
+            raise AIClientBusy("No free OpenAI slot in this worker")
+    _count(calls=1, in_flight=1)
+    started = time.monotonic()
+    try:
+        yield client
+    except Exception:
+        _count(errors=1)
+        raise
+    finally:
+        _count(in_flight=-1, total_seconds=time.monotonic() - started)
+        _semaphore.release()
+
+
+def _pool_stats():
+    """Connections held by the httpx pool (httpcore internals, hence defensive)."""
+    if _http_client is None:
+        return None
+    try:
+        connections = list(_http_client._transport._pool.connections)
+    except AttributeError:
+        return None
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {'connections': len(connections), 'idle': idle, 'active': len(connections) - idle}
+
+
+def get_openai_client_stats():
+    """Call counters and connection pool state of this worker (not of the whole site)."""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats['avg_seconds'] = round(stats['total_seconds'] / stats['calls'], 3) if stats['calls'] else None
+    stats['total_seconds'] = round(stats['total_seconds'], 3)
+    stats['max_concurrency'] = getattr(settings, 'AIHUB_OPENAI_MAX_CONCURRENCY', 4)
+    stats['pool'] = _pool_stats()
+    stats['pid'] = os.getpid()
+    return stats
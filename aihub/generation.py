@@ -0,0 +1,83 @@
+"""
+Structured AI generations for the AI hub: prompts, output schemas and the
+Responses API calls. Used by the job worker (see jobs.py).
+"""
+from pydantic import BaseModel
+
+from .client import openai_slot
+
+
+AI_MODEL = "gpt-4o-2024-08-06"
+
+# Bump a version whenever its prompt or output schema changes, so cached answers are not reused
+MEAL_PROMPT_VERSION = "1"
+MEAL_PROMPT = (
+    "You are a professional pet nutritionist. Based on the pet profile below, generate a detailed one-day meal plan. "
+    "Provide practical, safe, and nutritionally appropriate recommendations.\n\n"
+    "Pet Profile:\n{pet_profile}"
+)
+
+HEALTH_PROMPT_VERSION = "1"
+HEALTH_PROMPT = (
+    "You are a professional pet health consultant. Based on the pet profile below, generate a comprehensive health insight report. "
+    "Be informative, concise, and provide actionable recommendations.\n\n"
+    "Pet Profile:\n{pet_profile}"
+)
+
+# Pydantic models for Structured Outputs
+class NutrientTargets(BaseModel):
+    protein_percent: str
+    fat_percent: str
+    carbs_percent: str
+
+class MealSection(BaseModel):
+    title: str
+    items: list[str]
+
+class MealOption(BaseModel):
+    name: str
+    overview: str
+    sections: list[MealSection]
+
+class FeedingSchedule(BaseModel):
+    time: str
+    note: str
+
+class MealPlan(BaseModel):
+    der_kcal: int
+    nutrient_targets: NutrientTargets
+    options: list[MealOption]
+    feeding_schedule: list[FeedingSchedule]
+    safety_notes: list[str]
+
+class HealthReport(BaseModel):
+    health_summary: str
+    breed_risks: list[str]
+    weight_and_diet: str
+    feeding_tips: list[str]
+    activity: str
+    alerts: list[str]
+
+
+def request_meal_plan(pet_profile):
+    """Structured one-day meal plan for `pet_profile` as a dict (None if nothing was parsed)."""
+    with openai_slot() as client:
+        response = client.responses.parse(
+            model=AI_MODEL,
+            input=MEAL_PROMPT.format(pet_profile=pet_profile),
+            text_format=MealPlan,
+        )
+    meal_plan = response.output_parsed
+    return meal_plan.model_dump() if meal_plan else None
+
+
+def request_health_report(pet_profile):
+    """Structured health report for `pet_profile` as a dict (None if nothing was parsed)."""
+    with openai_slot() as client:
+        response = client.responses.parse(
+            model=AI_MODEL,
+            input=HEALTH_PROMPT.format(pet_profile=pet_profile),
+            text_format=HealthReport,
+        )
+    health_data = response.output_parsed
+    return health_data.model_dump() if health_data else None
@@ -0,0 +1,213 @@
+"""
+Background generation of meal plans and health reports.
+
+The views only enqueue an AIJob and return; the process_ai_jobs worker
+claims queued jobs one at a time (a conditional UPDATE, so several workers
+never run the same job), calls the Responses API outside any request and
+transaction, stores the AIRecommendation / AIHealthReport and counts it in
+AIUsage. The final write only applies while the worker still holds its claim
+(same RUNNING status, start time and attempt), so a job re-queued as stale
+and picked up again is finished by exactly one run. The result page polls
+ai_job_status until the job is done or failed.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from subscription.models import AIUsage, first_day_of_current_month
+from .cache import profile_fingerprint
+from .client import AIClientBusy, worst_case_call_seconds
+from .generation import (
+    AI_MODEL, HEALTH_PROMPT_VERSION, MEAL_PROMPT_VERSION, request_health_report, request_meal_plan
+)
+from .models import AIHealthReport, AIJob, AIRecommendation, JobStatus, RecommendationType
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+# Added to the API call's worst case for retry backoff and the result writes
+JOB_TIMEOUT_MARGIN = 60  # seconds
+
+USAGE_FIELDS = {
+    RecommendationType.MEAL: 'meal_used',
+    RecommendationType.HEALTH: 'health_used',
+}
+
+
+@dataclass
+class JobsResult:
+    done: int = 0
+    failed: int = 0
+    requeued: int = 0
+    lost: int = 0
+
+
+def find_active_job(pet, kind, fingerprint):
+    """A queued or running job that will answer this exact profile, or None."""
+    return AIJob.objects.filter(
+        pet=pet, kind=kind, profile_fingerprint=fingerprint, status__in=ACTIVE_STATUSES
+    ).order_by('created_at').first()
+
+
+def active_job_count(user, kind):
+    """Jobs of `kind` still on their way; they count against the monthly limit."""
+    return AIJob.objects.filter(user=user, kind=kind, status__in=ACTIVE_STATUSES).count()
+
+
+def enqueue_generation(user, pet, kind, fingerprint, ip_address=None):
+    return AIJob.objects.create(
+        user=user, pet=pet, kind=kind, profile_fingerprint=fingerprint, ip_address=ip_address
+    )
+
+
+def claim_next_job():
+    """Oldest queued job, switched to RUNNING by this worker; None if the queue is empty."""
+    while True:
+        job = AIJob.objects.filter(status=JobStatus.QUEUED).order_by('created_at').first()
+        if job is None:
+            return None
+        claimed = AIJob.objects.filter(pk=job.pk, status=JobStatus.QUEUED).update(
+            status=JobStatus.RUNNING, started_at=now(), attempts=F('attempts') + 1
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Another worker took it first
+
+
+def _count_usage(user, field):
+    usage, _ = AIUsage.objects.get_or_create(user=user, month=first_day_of_current_month())
+    AIUsage.objects.filter(pk=usage.pk).update(**{field: F(field) + 1})
+
+
+def job_timeout():
+    """
+    Age after which a RUNNING job counts as orphaned: AIHUB_JOB_TIMEOUT, but
+    never less than its API call can still legitimately take.
+    """
+    return max(getattr(settings, 'AIHUB_JOB_TIMEOUT', 300), worst_case_call_seconds() + JOB_TIMEOUT_MARGIN)
+
+
+def _claimed(job):
+    """`job` as long as this run still owns it (not re-queued or claimed again since)."""
+    return AIJob.objects.filter(
+        pk=job.pk, status=JobStatus.RUNNING, started_at=job.started_at, attempts=job.attempts
+    )
+
+
+def _request(job):
+    """Call the API for `job`; returns the profile it was asked about and the answer."""
+    # Re-read the profile: the stored answer must match the profile it was generated from
+    pet_profile = job.pet.get_full_profile_for_ai()
+    if job.kind == RecommendationType.MEAL:
+        return pet_profile, request_meal_plan(pet_profile)
+    return pet_profile, request_health_report(pet_profile)
+
+
+def _store_result(job, pet_profile, content_json):
+    """Create the result row for `job` (not saved on the job yet)."""
+    if job.kind == RecommendationType.MEAL:
+        job.recommendation = AIRecommendation.objects.create(
+            pet=job.pet,
+            type=RecommendationType.MEAL,
+            content=json.dumps(content_json, indent=2) if content_json else "",
+            content_json=content_json,
+            profile_fingerprint=profile_fingerprint(pet_profile, MEAL_PROMPT_VERSION, AI_MODEL),
+            ip_address=job.ip_address,
+        )
+    else:
+        job.health_report = AIHealthReport.objects.create(
+            pet=job.pet,
+            summary=json.dumps(content_json, indent=2) if content_json else "",
+            summary_json=content_json,
+            profile_fingerprint=profile_fingerprint(pet_profile, HEALTH_PROMPT_VERSION, AI_MODEL),
+            ip_address=job.ip_address,
+        )
+
+
+def _lose(job):
+    logger.warning(f"AI job {job.pk} was re-queued while this run was working on it; result dropped")
+    job.claim_lost = True
+    return job
+
+
+def _finish(job, status, error=""):
+    """Write the final state, if this run still holds the claim."""
+    finished_at = now()
+    updated = _claimed(job).update(
+        status=status, error=error, finished_at=finished_at,
+        recommendation=job.recommendation, health_report=job.health_report,
+    )
+    if not updated:
+        return _lose(job)
+    job.status, job.error, job.finished_at = status, error, finished_at
+    return job
+
+
+def run_job(job):
+    """
+    Run a claimed job to DONE or FAILED; returns the job, with `claim_lost`
+    set if it was re-queued meanwhile and this run's outcome was dropped.
+    """
+    job.claim_lost = False
+    try:
+        # No transaction (or row lock) is held during the API call
+        pet_profile, content_json = _request(job)
+        with transaction.atomic():
+            # Lock the claim so the stale-job sweep cannot re-queue it mid-write
+            if not _claimed(job).select_for_update().exists():
+                return _lose(job)
+            _store_result(job, pet_profile, content_json)
+            # Only track usage for normal users
+            if not job.user.is_superuser:
+                _count_usage(job.user, USAGE_FIELDS[job.kind])
+            return _finish(job, JobStatus.DONE)
+    except AIClientBusy:
+        # Not the job's fault: hand it back to the queue without using up an attempt
+        if not _claimed(job).update(status=JobStatus.QUEUED, attempts=F('attempts') - 1):
+            return _lose(job)
+        job.status = JobStatus.QUEUED
+        return job
+    except Exception as e:
+        logger.exception(f"AI job {job.pk} failed")
+        return _finish(job, JobStatus.FAILED, error=str(e)[:1000])
+
+
+def requeue_stale_jobs():
+    """
+    Put RUNNING jobs older than job_timeout() back in the queue (their
+    worker died), or fail them once AIHUB_JOB_MAX_ATTEMPTS is used up.
+    """
+    cutoff = now() - timedelta(seconds=job_timeout())
+    max_attempts = getattr(settings, 'AIHUB_JOB_MAX_ATTEMPTS', 2)
+    stale = AIJob.objects.filter(status=JobStatus.RUNNING, started_at__lt=cutoff)
+    stale.filter(attempts__gte=max_attempts).update(
+        status=JobStatus.FAILED, error="Generation timed out", finished_at=now()
+    )
+    return stale.filter(attempts__lt=max_attempts).update(status=JobStatus.QUEUED)
+
+
+def process_ai_jobs(limit=10):
+    """Run up to `limit` queued jobs."""
+    result = JobsResult(requeued=requeue_stale_jobs())
+    for _ in range(limit):
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        if job.claim_lost:
+            result.lost += 1
+        elif job.status == JobStatus.QUEUED:
+            break
+        if job.status == JobStatus.DONE:
+            result.done += 1
+        else:
+            result.failed += 1
+    return result
@@ -0,0 +1,59 @@
+"""
+Management command that runs the meal plan / health report generations
+queued by the AI hub views.
+Usage: python manage.py process_ai_jobs [--batch-size 10] [--loop]
+
+Keep one instance running with --loop (or run it every minute from cron).
+Several instances may run at once: each job is claimed by exactly one of them.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from aihub.jobs import process_ai_jobs
+from aihub.models import AIJob, JobStatus
+
+
+class Command(BaseCommand):
+    help = 'Run queued AI meal plan and health report generations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Maximum number of jobs to run per batch',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the queue instead of exiting when it is empty',
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=2,
+            help='Seconds to wait between polls when the queue is empty (with --loop)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            result = process_ai_jobs(limit=options['batch_size'])
+            processed = result.done + result.failed
+
+            if result.requeued:
+                self.stdout.write(f'Re-queued {result.requeued} stalled job(s)')
+            if result.lost:
+                self.stdout.write(f'Dropped {result.lost} result(s) of job(s) re-queued while running')
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f'✓ Generated: {result.done}'))
+                if result.failed:
+                    self.stdout.write(self.style.ERROR(f'✗ Failed: {result.failed}'))
+
+            if processed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['idle_sleep'])
+
+        remaining = AIJob.objects.filter(status=JobStatus.QUEUED).count()
+        self.stdout.write(f'{remaining} job(s) still queued')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aihub', '0003_aihealthreport_summary_json_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aihealthreport',
+            name='profile_fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='airecommendation',
+            name='profile_fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from pet.models import Pet
 from django.utils.translation import gettext_lazy as _
@@ -12,6 +13,8 @@ class AIRecommendation(models.Model):
     content = models.TextField()
     # Optional structured payload for Responses API
     content_json = models.JSONField(null=True, blank=True)
+    # Hash of the pet profile, prompt version and model this answer was generated from
+    profile_fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)  # Add this field
 
@@ -24,9 +27,43 @@ class AIHealthReport(models.Model):
     suggestions = models.TextField(blank=True, null=True)
     # Optional structured payload for Responses API
     summary_json = models.JSONField(null=True, blank=True)
+    # Hash of the pet profile, prompt version and model this answer was generated from
+    profile_fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)  # Add this field
 
     def __str__(self):
         return f"{self.pet.name} - Health Report - {self.created_at.strftime('%Y-%m-%d')}"
 
+class JobStatus(models.TextChoices):
+    QUEUED = 'queued', _('Queued')
+    RUNNING = 'running', _('Running')
+    DONE = 'done', _('Done')
+    FAILED = 'failed', _('Failed')
+
+class AIJob(models.Model):
+    """A meal plan or health report generation, run by the process_ai_jobs worker."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_jobs')
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='ai_jobs')
+    kind = models.CharField(max_length=20, choices=RecommendationType.choices)
+    status = models.CharField(max_length=20, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    profile_fingerprint = models.CharField(max_length=64, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Set once the job is done, depending on kind
+    recommendation = models.ForeignKey(AIRecommendation, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    health_report = models.ForeignKey(AIHealthReport, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    @property
+    def is_active(self):
+        return self.status in (JobStatus.QUEUED, JobStatus.RUNNING)
+
+    def __str__(self):
+        return f"{self.pet.name} - {self.get_kind_display()} - {self.get_status_display()}"
@@ -1,3 +1,137 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from pet.models import Pet
+from subscription.models import AIUsage
+from .cache import profile_fingerprint
+from .generation import AI_MODEL, MEAL_PROMPT_VERSION
+from .jobs import claim_next_job, job_timeout, process_ai_jobs, requeue_stale_jobs, run_job
+from .models import AIJob, AIRecommendation, JobStatus, RecommendationType
+
+
+class AIJobTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner@example.com', None)
+        self.pet = Pet.objects.create(user=self.user, name='Rex')
+
+    def enqueue(self):
+        return AIJob.objects.create(user=self.user, pet=self.pet, kind=RecommendationType.MEAL)
+
+    def make_stale(self, job):
+        AIJob.objects.filter(pk=job.pk).update(started_at=now() - timedelta(seconds=job_timeout() + 1))
+
+    def test_each_job_is_claimed_once(self):
+        jobs = [self.enqueue(), self.enqueue()]
+        claimed = [claim_next_job(), claim_next_job()]
+        self.assertEqual([job.pk for job in claimed], [job.pk for job in jobs])
+        self.assertEqual({job.status for job in claimed}, {JobStatus.RUNNING})
+        self.assertIsNone(claim_next_job())
+
+    @mock.patch('aihub.jobs.request_meal_plan', return_value={'meals': []})
+    def test_requeued_job_is_finished_by_one_run(self, request):
+        self.enqueue()
+        first = claim_next_job()
+        self.make_stale(first)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        second = claim_next_job()
+        self.assertEqual((second.pk, second.attempts), (first.pk, 2))
+
+        self.assertTrue(run_job(first).claim_lost)
+        self.assertEqual(AIRecommendation.objects.count(), 0)
+        self.assertEqual(run_job(second).status, JobStatus.DONE)
+
+        job = AIJob.objects.get(pk=first.pk)
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(job.recommendation, AIRecommendation.objects.get())
+        self.assertEqual(AIUsage.objects.get(user=self.user).meal_used, 1)
+
+    @mock.patch('aihub.jobs.request_meal_plan', side_effect=RuntimeError('boom'))
+    def test_late_failure_does_not_override_the_new_run(self, request):
+        self.enqueue()
+        first = claim_next_job()
+        self.make_stale(first)
+        requeue_stale_jobs()
+        claim_next_job()
+        self.assertTrue(run_job(first).claim_lost)
+        self.assertEqual(AIJob.objects.get(pk=first.pk).status, JobStatus.RUNNING)
+
+    def test_api_call_runs_outside_a_transaction(self):
+        self.enqueue()
+        depth = len(connection.atomic_blocks)
+        seen = []
+        with mock.patch('aihub.jobs.request_meal_plan',
+                        side_effect=lambda profile: seen.append(len(connection.atomic_blocks)) or {}):
+            result = process_ai_jobs(limit=1)
+        self.assertEqual((result.done, seen), (1, [depth]))
+
+    @override_settings(AIHUB_JOB_TIMEOUT=300, AIHUB_OPENAI_QUEUE_TIMEOUT=30, AIHUB_OPENAI_CONNECT_TIMEOUT=5,
+                       AIHUB_OPENAI_READ_TIMEOUT=120, AIHUB_OPENAI_MAX_RETRIES=2)
+    def test_timeout_outlasts_the_slowest_api_call(self):
+        self.assertEqual(job_timeout(), 30 + 3 * (5 + 120) + 60)
+        with self.settings(AIHUB_JOB_TIMEOUT=900):
+            self.assertEqual(job_timeout(), 900)
+
+
+@override_settings(AIHUB_RESPONSE_CACHE_MAX_AGE=3600)
+class AIResponseReuseTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('reuse@example.com', None, is_active=True)
+        self.pet = Pet.objects.create(user=self.user, name='Milo')
+        self.client.force_login(self.user)
+        self.url = reverse('generate_meal', args=[self.pet.id])
+        self.fingerprint = profile_fingerprint(self.pet.get_full_profile_for_ai(), MEAL_PROMPT_VERSION, AI_MODEL)
+
+    def store_plan(self, **fields):
+        return AIRecommendation.objects.create(
+            pet=self.pet, type=RecommendationType.MEAL, content='{}', content_json={'meals': []},
+            profile_fingerprint=self.fingerprint, **fields
+        )
+
+    def test_fingerprint_ignores_whitespace_but_not_prompt_or_model(self):
+        base = profile_fingerprint('Name: Milo\nWeight: 4 kg', 'v1', 'model')
+        self.assertEqual(base, profile_fingerprint('  Name:  Milo \n Weight: 4   kg\n', 'v1', 'model'))
+        self.assertNotEqual(base, profile_fingerprint('Name: Milo\nWeight: 5 kg', 'v1', 'model'))
+        self.assertNotEqual(base, profile_fingerprint('Name: Milo\nWeight: 4 kg', 'v2', 'model'))
+        self.assertNotEqual(base, profile_fingerprint('Name: Milo\nWeight: 4 kg', 'v1', 'other'))
+
+    def test_fresh_answer_is_reused_without_a_job(self):
+        plan = self.store_plan()
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response.context['recommendation']), (200, plan))
+        self.assertFalse(AIJob.objects.exists())
+        usage = AIUsage.objects.get(user=self.user)
+        self.assertEqual((usage.meal_cache_hits, usage.meal_used), (1, 0))
+
+    def test_refresh_or_stale_answer_queues_a_generation(self):
+        plan = self.store_plan()
+        self.assertRedirects(self.client.get(self.url, {'refresh': '1'}), fetch_redirect_response=False,
+                             expected_url=reverse('ai_job', args=[AIJob.objects.get().id]))
+        AIJob.objects.all().delete()
+        AIRecommendation.objects.filter(pk=plan.pk).update(created_at=now() - timedelta(hours=2))
+        self.client.get(self.url)
+        self.assertEqual(AIJob.objects.count(), 1)
+
+    def test_repeated_request_follows_the_active_job(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        job = AIJob.objects.get()
+        self.assertEqual((first['Location'], second['Location']), (reverse('ai_job', args=[job.id]),) * 2)
+
+        # Finished jobs no longer absorb new requests
+        AIJob.objects.filter(pk=job.pk).update(status=JobStatus.FAILED)
+        self.client.get(self.url)
+        self.assertEqual(AIJob.objects.count(), 2)
+
+    def test_job_status_is_private(self):
+        job = AIJob.objects.create(user=self.user, pet=self.pet, kind=RecommendationType.MEAL)
+        data = self.client.get(reverse('ai_job_status', args=[job.id])).json()
+        self.assertEqual((data['status'], data['ready']), (JobStatus.QUEUED, False))
+        other = get_user_model().objects.create_user('other@example.com', None, is_active=True)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('ai_job_status', args=[job.id])).status_code, 404)
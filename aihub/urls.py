@@ -1,9 +1,12 @@
 from django.urls import path
 from . import views
-from .views import AIHistoryView
+from .views import AIHistoryView, OpenAIClientStatsAPIView
 
 urlpatterns = [
     path('recommend/<int:pet_id>/', views.generate_meal_recommendation, name='generate_meal'),
     path('health-report/<int:pet_id>/', views.generate_health_report, name='generate_health'),
+    path('jobs/<int:job_id>/', views.ai_job, name='ai_job'),
+    path('jobs/<int:job_id>/status/', views.ai_job_status, name='ai_job_status'),
     path('history/', AIHistoryView.as_view(), name='ai_history'),
+    path('client-stats/', OpenAIClientStatsAPIView.as_view(), name='openai_client_stats'),
 ]
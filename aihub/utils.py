@@ -1,13 +1,8 @@
-import geoip2.database
-import os
+from core.geoip import lookup_ip
 
-GEOIP_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GeoLite2-Country.mmdb')
 
 def get_country_from_ip(ip_address):
-    print("GeoIP lookup for:", ip_address)
-    try:
-        with geoip2.database.Reader(GEOIP_DB_PATH) as reader:
-            response = reader.country(ip_address)
-            return response.country.name or "Unknown"
-    except Exception:
-        return "Unknown"
\ No newline at end of file
+    location = lookup_ip(ip_address)
+    if location and location['country']:
+        return location['country']
+    return "Unknown"
@@ -1,66 +1,53 @@
-import openai
-import json
-from openai import OpenAI
-from pydantic import BaseModel
 from django.conf import settings
-from django.shortcuts import render, get_object_or_404
+from django.http import JsonResponse
+from django.shortcuts import redirect, render, get_object_or_404
+from django.urls import reverse
 from pet.models import Pet
-from .models import AIRecommendation, RecommendationType, AIHealthReport
-from django.contrib.auth.decorators import login_required
+from .models import AIRecommendation, RecommendationType, AIHealthReport, AIJob, JobStatus
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils.decorators import method_decorator
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 from datetime import datetime, timedelta
 from django.utils.timezone import now
-from subscription.models import AIUsage, first_day_of_current_month
 from django.utils.translation import gettext_lazy as _
+from .client import get_openai_client_stats
+from .cache import (
+    find_cached_health_report, find_cached_recommendation, profile_fingerprint, record_cache_hit
+)
+from .generation import AI_MODEL, HEALTH_PROMPT_VERSION, MEAL_PROMPT_VERSION
+from .jobs import active_job_count, enqueue_generation, find_active_job
 
 
-openai.api_key = settings.OPENAI_API_KEY
-
-# Pydantic models for Structured Outputs
-class NutrientTargets(BaseModel):
-    protein_percent: str
-    fat_percent: str
-    carbs_percent: str
-
-class MealSection(BaseModel):
-    title: str
-    items: list[str]
-
-class MealOption(BaseModel):
-    name: str
-    overview: str
-    sections: list[MealSection]
-
-class FeedingSchedule(BaseModel):
-    time: str
-    note: str
-
-class MealPlan(BaseModel):
-    der_kcal: int
-    nutrient_targets: NutrientTargets
-    options: list[MealOption]
-    feeding_schedule: list[FeedingSchedule]
-    safety_notes: list[str]
-
-class HealthReport(BaseModel):
-    health_summary: str
-    breed_risks: list[str]
-    weight_and_diet: str
-    feeding_tips: list[str]
-    activity: str
-    alerts: list[str]
-
 def generate_meal_recommendation(request, pet_id):
     pet = get_object_or_404(Pet, id=pet_id, user=request.user)
 
-    # Limit: 3 per user per month
+    pet_profile = pet.get_full_profile_for_ai()
+    fingerprint = profile_fingerprint(pet_profile, MEAL_PROMPT_VERSION, AI_MODEL)
+
+    # Unchanged profile: serve the recent plan without an API call or quota (?refresh=1 skips this)
+    if request.GET.get('refresh') != '1':
+        cached = find_cached_recommendation(pet, RecommendationType.MEAL, fingerprint)
+        if cached:
+            if not request.user.is_superuser:
+                record_cache_hit(request.user, 'meal_cache_hits')
+            return render(request, 'aihub/meal_result.html', {
+                'recommendation': cached,
+                'pet': pet,
+                'cached': True,
+            })
+
+    # Same profile already being generated (double click, reload): follow that job
+    job = find_active_job(pet, RecommendationType.MEAL, fingerprint)
+    if job:
+        return redirect('ai_job', job_id=job.id)
+
+    # Limit: 3 per user per month (queued and running jobs included)
     start_of_month = datetime(now().year, now().month, 1)
     used_count = AIRecommendation.objects.filter(
         pet__user=request.user,
         type=RecommendationType.MEAL,
         created_at__gte=start_of_month
-    ).count()
+    ).count() + active_job_count(request.user, RecommendationType.MEAL)
 
     # Get the user's assigned plan from profile
     user_profile = request.user.profile
@@ -71,62 +58,37 @@ def generate_meal_recommendation(request, pet_id):
             'message': _("You’ve reached your monthly limit of %(limit)s AI meal suggestions.") % {"limit": meal_limit}
         })
 
-    pet_profile = pet.get_full_profile_for_ai()
-    # Ask for structured meal plan
-    prompt = (
-        "You are a professional pet nutritionist. Based on the pet profile below, generate a detailed one-day meal plan. "
-        "Provide practical, safe, and nutritionally appropriate recommendations.\n\n"
-        f"Pet Profile:\n{pet_profile}"
-    )
-    
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-    response = client.responses.parse(
-        model="gpt-4o-2024-08-06",
-        input=prompt,
-        text_format=MealPlan,
-    )
-
-    # Get parsed output
-    meal_plan = response.output_parsed
-    # Convert to dict for JSON storage
-    content_json = meal_plan.model_dump() if meal_plan else None
-    # Also keep text representation
-    result = json.dumps(content_json, indent=2) if content_json else ""
-
-    ip_address = get_client_ip(request)
-    recommendation = AIRecommendation.objects.create(
-        pet=pet,
-        type=RecommendationType.MEAL,
-        content=result,
-        content_json=content_json,
-        ip_address=ip_address  # Save IP
-    )
-
-    # Only track usage for normal users
-    if not request.user.is_superuser:
-        from subscription.models import AIUsage, first_day_of_current_month
-
-        usage, created = AIUsage.objects.get_or_create(
-            user=request.user,
-            month=first_day_of_current_month()
-        )
-        usage.meal_used += 1
-        usage.save()
-
-    return render(request, 'aihub/meal_result.html', {
-        'recommendation': recommendation,
-        'pet': pet
-    })
+    # Generated by the process_ai_jobs worker; the job page polls for the result
+    job = enqueue_generation(request.user, pet, RecommendationType.MEAL, fingerprint, get_client_ip(request))
+    return redirect('ai_job', job_id=job.id)
 
 def generate_health_report(request, pet_id):
     pet = get_object_or_404(Pet, id=pet_id, user=request.user)
 
+    pet_profile = pet.get_full_profile_for_ai()
+    fingerprint = profile_fingerprint(pet_profile, HEALTH_PROMPT_VERSION, AI_MODEL)
+
+    # Unchanged profile: serve the recent report without an API call or quota (?refresh=1 skips this)
+    if request.GET.get('refresh') != '1':
+        cached = find_cached_health_report(pet, fingerprint)
+        if cached:
+            if not request.user.is_superuser:
+                record_cache_hit(request.user, 'health_cache_hits')
+            return render(request, 'aihub/health_report.html', {
+                'report': cached,
+                'pet': pet,
+                'cached': True,
+            })
+
+    job = find_active_job(pet, RecommendationType.HEALTH, fingerprint)
+    if job:
+        return redirect('ai_job', job_id=job.id)
+
     start_of_month = datetime(now().year, now().month, 1)
     used_count = AIHealthReport.objects.filter(
         pet__user=request.user,
         created_at__gte=start_of_month
-    ).count()
+    ).count() + active_job_count(request.user, RecommendationType.HEALTH)
 
     user_profile = request.user.profile
     health_limit = user_profile.subscription_plan.monthly_health_limit if user_profile.subscription_plan else 1
@@ -136,48 +98,45 @@ def generate_health_report(request, pet_id):
             'message': _("You’ve reached your monthly limit of %(limit)s AI health reports.") % {"limit": health_limit}
         })
 
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    job = enqueue_generation(request.user, pet, RecommendationType.HEALTH, fingerprint, get_client_ip(request))
+    return redirect('ai_job', job_id=job.id)
 
-    pet_profile = pet.get_full_profile_for_ai()
-    prompt = (
-        "You are a professional pet health consultant. Based on the pet profile below, generate a comprehensive health insight report. "
-        "Be informative, concise, and provide actionable recommendations.\n\n"
-        f"Pet Profile:\n{pet_profile}"
+@login_required
+def ai_job(request, job_id):
+    """Result page of a generation job: the result once done, a pending or failed panel before."""
+    job = get_object_or_404(
+        AIJob.objects.select_related('pet', 'recommendation', 'health_report'), id=job_id, user=request.user
     )
+    context = {'job': job, 'pet': job.pet, 'poll_interval': getattr(settings, 'AIHUB_JOB_POLL_INTERVAL', 2)}
+    if job.kind == RecommendationType.MEAL:
+        context['recommendation'] = job.recommendation
+        return render(request, 'aihub/meal_result.html', context)
+    context['report'] = job.health_report
+    return render(request, 'aihub/health_report.html', context)
+
+@login_required
+def ai_job_status(request, job_id):
+    """Polled by the job page until `ready` (done or failed)."""
+    job = get_object_or_404(AIJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'ready': not job.is_active,
+        'error': _("The generation failed. Please try again.") if job.status == JobStatus.FAILED else None,
+        'result_url': reverse('ai_job', args=[job.id]),
+        'poll_after': getattr(settings, 'AIHUB_JOB_POLL_INTERVAL', 2),
+    })
 
-    response = client.responses.parse(
-        model="gpt-4o-2024-08-06",
-        input=prompt,
-        text_format=HealthReport,
-    )
+@method_decorator(user_passes_test(lambda u: u.is_staff or u.is_superuser), name='dispatch')
+class OpenAIClientStatsAPIView(View):
+    """Admin-only: API call counters and connection pool of the worker that serves the request"""
 
-    # Get parsed output
-    health_data = response.output_parsed
-    # Convert to dict for JSON storage
-    summary_json = health_data.model_dump() if health_data else None
-    # Also keep text representation
-    result = json.dumps(summary_json, indent=2) if summary_json else ""
-
-    ip_address = get_client_ip(request)
-    report = AIHealthReport.objects.create(
-        pet=pet,
-        summary=result,
-        summary_json=summary_json,
-        ip_address=ip_address  # Save IP
-    )
-
-    if not request.user.is_superuser:
-        usage, created = AIUsage.objects.get_or_create(
-            user=request.user,
-            month=first_day_of_current_month()
-        )
-        usage.health_used += 1
-        usage.save()
-
-    return render(request, 'aihub/health_report.html', {
-        'report': report,
-        'pet': pet
-    })
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({
+            'success': True,
+            'stats': get_openai_client_stats(),
+        })
 
 @method_decorator(login_required, name='dispatch')
 class AIHistoryView(TemplateView):
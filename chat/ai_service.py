@@ -1,10 +1,4 @@
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from aihub.client import AIClientBusy, openai_slot
 
 BASE_SYSTEM_PROMPT = (
     "You are a helpful veterinary-style assistant that ONLY answers questions about PETS: dogs and cats.\n"
@@ -69,13 +63,17 @@ def pet_answer(user_text: str, user_name: str | None = None, pet_profiles: str |
     if not user_content:
         user_content.append({"type": "input_text", "text": "Hello"})
 
-    resp = client.responses.create(
-        model="gpt-5",
-        input=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content},
-        ]
-    )
+    try:
+        with openai_slot() as client:
+            resp = client.responses.create(
+                model="gpt-5",
+                input=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content},
+                ]
+            )
+    except AIClientBusy:
+        return "I'm answering a lot of questions right now. Please try again in a moment."
     # Safe read
     return resp.output_text.strip() if getattr(resp, "output_text", None) else "Sorry, I couldn't generate a reply."
     system_parts = [BASE_SYSTEM_PROMPT]
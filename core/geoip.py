@@ -0,0 +1,117 @@
+"""
+Process-wide GeoIP lookups shared by every app.
+
+MaxMind databases are opened once per worker in MMAP mode and results are
+kept in a bounded LRU cache. IPv4 addresses are cached per /24 and IPv6
+per /48 (GEOIP_CACHE_BY_PREFIX), since GeoLite2 rarely resolves finer than
+that and visitors from one network then share a single lookup.
+"""
+import ipaddress
+import logging
+import os
+import threading
+from typing import Optional, Union
+
+import geoip2.database
+from cachetools import LRUCache
+from django.conf import settings
+from geoip2.errors import AddressNotFoundError
+from maxminddb import MODE_MMAP
+
+logger = logging.getLogger(__name__)
+
+_readers = {}
+_readers_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_reader(kind: str):
+    """Return the shared Reader for 'city' or 'country', or None if the database is missing."""
+    if kind in _readers:
+        return _readers[kind]
+    with _readers_lock:
+        if kind not in _readers:
+            if kind == 'city':
+                path = getattr(settings, 'GEOIP_CITY_DB', os.path.join(settings.BASE_DIR, 'GeoLite2-City.mmdb'))
+            else:
+                path = getattr(settings, 'GEOIP_COUNTRY_DB', os.path.join(settings.BASE_DIR, 'GeoLite2-Country.mmdb'))
+            try:
+                _readers[kind] = geoip2.database.Reader(str(path), mode=MODE_MMAP)
+            except (OSError, ValueError) as e:
+                logger.warning(f"GeoIP {kind} database not available ({path}): {e}")
+                _readers[kind] = None
+        return _readers[kind]
+
+
+def _get_cache() -> LRUCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LRUCache(maxsize=getattr(settings, 'GEOIP_CACHE_SIZE', 10000))
+    return _cache
+
+
+def _cache_key(ip: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> str:
+    if not getattr(settings, 'GEOIP_CACHE_BY_PREFIX', True):
+        return str(ip)
+    prefix = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+
+def _resolve(ip: str) -> Optional[dict]:
+    city_reader = _get_reader('city')
+    if city_reader is not None:
+        response = city_reader.city(ip)
+        return {
+            'latitude': response.location.latitude,
+            'longitude': response.location.longitude,
+            'city': response.city.name,
+            'country': response.country.name,
+            'country_code': response.country.iso_code,
+        }
+
+    country_reader = _get_reader('country')
+    if country_reader is not None:
+        response = country_reader.country(ip)
+        return {
+            'latitude': None,
+            'longitude': None,
+            'city': None,
+            'country': response.country.name,
+            'country_code': response.country.iso_code,
+        }
+    return None
+
+
+def lookup_ip(ip_address: str) -> Optional[dict]:
+    """
+    Resolve an IP address to a dict with latitude, longitude, city, country
+    and country_code (coordinates and city need the City database).
+    Returns None for private/invalid addresses or unknown networks.
+    """
+    try:
+        ip = ipaddress.ip_address((ip_address or '').strip())
+    except ValueError:
+        return None
+    if not ip.is_global:
+        return None
+
+    key = _cache_key(ip)
+    cache = _get_cache()
+    with _cache_lock:
+        if key in cache:
+            return cache[key]
+
+    try:
+        result = _resolve(str(ip))
+    except AddressNotFoundError:
+        result = None
+    except Exception as e:
+        logger.warning(f"GeoIP lookup failed for {ip}: {e}")
+        return None
+
+    with _cache_lock:
+        cache[key] = result
+    return result
@@ -104,6 +104,22 @@ DATABASES = {
     }
 }
 
+# CACHE
+# Shared by every worker process on the host, so version bumps (clinic set,
+# referral codes) and cached responses are seen by all of them, including
+# those written from cron management commands. A per-process LocMemCache
+# would leave each worker with its own copy.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_DIR', default=str(BASE_DIR / '.django_cache')),
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
 # AUTH
 AUTH_USER_MODEL = 'userapp.CustomUser'
 LOGIN_URL = '/login/'
@@ -189,9 +205,85 @@ MARKDOWNX_MARKDOWN_EXTENSIONS = [
 
 # OPENAI KEY
 OPENAI_API_KEY = config("OPENAI_API_KEY")
+# Meal plans / health reports generated from an unchanged pet profile within
+# this many seconds are reused instead of calling the API (0 disables reuse)
+AIHUB_RESPONSE_CACHE_MAX_AGE = 60 * 60  # seconds
+# Generations run in the process_ai_jobs worker. A RUNNING job older than
+# AIHUB_JOB_TIMEOUT is assumed orphaned and re-queued, at most
+# AIHUB_JOB_MAX_ATTEMPTS runs in total; the result page polls every
+# AIHUB_JOB_POLL_INTERVAL seconds. The timeout is raised to the OpenAI
+# client's worst case (queue timeout + (connect + read timeout) x (retries + 1),
+# plus a minute) when that is longer, see aihub.jobs.job_timeout().
+AIHUB_JOB_TIMEOUT = 300  # seconds
+AIHUB_JOB_MAX_ATTEMPTS = 2
+AIHUB_JOB_POLL_INTERVAL = 2  # seconds
+# Shared OpenAI client (aihub.client), one per worker process. Connections
+# are kept alive for reuse; at most AIHUB_OPENAI_MAX_CONCURRENCY API calls run
+# at once per worker, a call waits up to AIHUB_OPENAI_QUEUE_TIMEOUT seconds
+# for a slot before giving up.
+AIHUB_OPENAI_CONNECT_TIMEOUT = 5  # seconds
+AIHUB_OPENAI_READ_TIMEOUT = 120  # seconds
+AIHUB_OPENAI_MAX_RETRIES = 2
+AIHUB_OPENAI_MAX_CONNECTIONS = 10
+AIHUB_OPENAI_MAX_KEEPALIVE = 5
+AIHUB_OPENAI_KEEPALIVE_EXPIRY = 60  # seconds
+AIHUB_OPENAI_MAX_CONCURRENCY = 4
+AIHUB_OPENAI_QUEUE_TIMEOUT = 30  # seconds
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# CLINIC FINDER
+# Per-worker in-memory clinic index. It is rebuilt when the clinic-set version
+# stored in the shared default cache changes, and at the latest after the max age.
+VETS_CLINIC_INDEX_ENABLED = True
+VETS_CLINIC_INDEX_MAX_AGE = 300  # seconds
+# Nearby clinics API response cache: grid cell size in degrees (~5.5 km) and entry lifetime
+VETS_NEARBY_CACHE_CELL_DEG = 0.05
+VETS_NEARBY_CACHE_TIMEOUT = 600  # seconds
+# Upper bounds for the nearby clinics API (radius in km, results per page)
+VETS_NEARBY_MAX_RADIUS_KM = 100
+VETS_NEARBY_MAX_LIMIT = 100
+# Clinic search: MySQL uses FULLTEXT, other databases an in-process inverted index.
+# Set VETS_SEARCH_BACKEND to a dotted backend path to override the choice.
+VETS_SEARCH_MAX_RESULTS = 500
+# Specialization facet counts are cached per clinic-set version
+VETS_FACET_CACHE_TIMEOUT = 600  # seconds
+# Referral link visits are buffered per worker and written in batches
+VETS_REFERRAL_VISIT_BUFFER_SIZE = 50
+VETS_REFERRAL_VISIT_FLUSH_INTERVAL = 10  # seconds
+# Per-worker cache of resolved referral codes (misses are cached for less)
+VETS_REFERRAL_CODE_CACHE_TTL = 300  # seconds
+VETS_REFERRAL_CODE_NEGATIVE_TTL = 60  # seconds
+VETS_REFERRAL_CODE_CACHE_SIZE = 1000
+# Most conversions accepted in one track-referral batch request
+VETS_REFERRAL_BATCH_MAX_SIZE = 500
+
+# GEOIP
+# MaxMind GeoLite2 databases, opened once per worker (see core/geoip.py).
+# Coordinates for the clinic finder need the City database.
+GEOIP_CITY_DB = os.path.join(BASE_DIR, 'GeoLite2-City.mmdb')
+GEOIP_COUNTRY_DB = os.path.join(BASE_DIR, 'GeoLite2-Country.mmdb')
+GEOIP_CACHE_SIZE = 10000
+GEOIP_CACHE_BY_PREFIX = True  # cache per /24 (IPv4) or /48 (IPv6)
+
+# GEOCODING
+# Street-level lookups go to Nominatim; city-level lookups are answered offline
+# from a local gazetteer CSV/TSV (name, country, latitude, longitude, population),
+# created with `manage.py fetch_gazetteer`; the gazetteer backend refuses to run without it.
+# Set GEOCODER_BACKEND to the gazetteer too for fully offline tests.
+GEOCODER_BACKEND = "vets.services.geocoders.NominatimBackend"
+CITY_GEOCODER_BACKEND = "vets.services.geocoders.GazetteerBackend"
+GAZETTEER_FILE = os.path.join(BASE_DIR, 'cities.csv')
+# "deferred": Clinic.save() only consults the geocode cache and queues the clinic;
+# run `manage.py process_geocode_queue` from cron to resolve coordinates.
+# "sync": Clinic.save() calls Nominatim inline.
+GEOCODE_MODE = "deferred"
+# Host-wide spacing between Nominatim requests (policy: max 1 request/second)
+GEOCODE_MIN_INTERVAL = 1.1
+GEOCODE_RATE_BURST = 1
+# Cached geocoding misses are retried after this many seconds
+GEOCODE_NEGATIVE_CACHE_TTL = 7 * 24 * 3600
+
 # EMAIL
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
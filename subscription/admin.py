@@ -11,6 +11,6 @@ class SubscriptionPlanAdmin(MarkdownxModelAdmin):
 
 @admin.register(AIUsage)
 class AIUsageAdmin(admin.ModelAdmin):
-    list_display = ('user', 'month', 'meal_used', 'health_used')
+    list_display = ('user', 'month', 'meal_used', 'health_used', 'meal_cache_hits', 'health_cache_hits')
     list_filter = ('month', 'user')
     search_fields = ('user__email',)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscription', '0004_alter_subscriptionplan_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusage',
+            name='health_cache_hits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='aiusage',
+            name='meal_cache_hits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
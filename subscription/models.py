@@ -42,6 +42,9 @@ class AIUsage(models.Model):
     month = models.DateField(default=first_day_of_current_month)
     meal_used = models.PositiveIntegerField(default=0)
     health_used = models.PositiveIntegerField(default=0)
+    # Answers reused from the AI response cache; not billed against the limits
+    meal_cache_hits = models.PositiveIntegerField(default=0)
+    health_cache_hits = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ('user', 'month')
@@ -56,4 +59,6 @@ class AIUsage(models.Model):
         self.month = now().replace(day=1)
         self.meal_used = 0
         self.health_used = 0
+        self.meal_cache_hits = 0
+        self.health_cache_hits = 0
         self.save()
\ No newline at end of file
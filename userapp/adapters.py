@@ -1,6 +1,8 @@
 from allauth.account.adapter import DefaultAccountAdapter
 from allauth.socialaccount.adapter import DefaultSocialAccountAdapter
 
+from vets.services.referrals import resolve_referral_code
+
 class CustomAccountAdapter(DefaultAccountAdapter):
     def is_open_for_signup(self, request):
         return True
@@ -11,21 +13,17 @@ class CustomAccountAdapter(DefaultAccountAdapter):
         if ref_code:
             request.session['referral_code'] = ref_code
             # Track the referral visit
-            try:
-                from vets.models import ReferralCode, ReferredUser, ReferralStatus
-                ref_code_obj = ReferralCode.objects.get(code=ref_code, is_active=True)
-                
-                # Create a tracking record for the visit (before registration)
-                ReferredUser.objects.get_or_create(
-                    clinic=ref_code_obj.clinic,
-                    email_capture='',  # Will be filled when user registers
-                    referral_code=ref_code_obj,
-                    defaults={'status': ReferralStatus.NEW}
-                )
-                print(f"Referral tracking: Captured visit for clinic {ref_code_obj.clinic.name}")
-                
-            except Exception as e:
-                print(f"Error tracking referral visit: {e}")
+            ref_code_obj = resolve_referral_code(ref_code)
+            if ref_code_obj:
+                try:
+                    from vets.models import ReferralVisitSource
+                    from vets.services.referral_visits import record_referral_visit
+                    
+                    # Log the visit (buffered); ReferredUser is created in save_user
+                    record_referral_visit(ref_code_obj, ReferralVisitSource.SIGNUP)
+                    
+                except Exception as e:
+                    print(f"Error tracking referral visit: {e}")
         
         return super().get_signup_redirect_url(request)
 
@@ -35,11 +33,10 @@ class CustomAccountAdapter(DefaultAccountAdapter):
         print("CustomAccountAdapter: Activated user on save_user")
         
         # Handle referral tracking after user registration
-        referral_code = request.session.get('referral_code')
-        if referral_code:
+        ref_code_obj = resolve_referral_code(request.session.get('referral_code'))
+        if ref_code_obj:
             try:
-                from vets.models import ReferralCode, ReferredUser, ReferralStatus
-                ref_code_obj = ReferralCode.objects.get(code=referral_code, is_active=True)
+                from vets.models import ReferredUser, ReferralStatus
                 
                 # Create or update referral tracking
                 referred_user, created = ReferredUser.objects.get_or_create(
@@ -82,11 +79,10 @@ class CustomSocialAccountAdapter(DefaultSocialAccountAdapter):
         user.save()
         
         # Handle referral tracking for social signup
-        referral_code = request.session.get('referral_code')
-        if referral_code:
+        ref_code_obj = resolve_referral_code(request.session.get('referral_code'))
+        if ref_code_obj:
             try:
-                from vets.models import ReferralCode, ReferredUser, ReferralStatus
-                ref_code_obj = ReferralCode.objects.get(code=referral_code, is_active=True)
+                from vets.models import ReferredUser, ReferralStatus
                 
                 # Create referral tracking for social signup
                 referred_user, created = ReferredUser.objects.get_or_create(
@@ -16,6 +16,7 @@ from collections import Counter
 from pet.models import Pet
 from aihub.models import AIRecommendation, AIHealthReport
 from aihub.utils import get_country_from_ip
+from vets.services.referrals import resolve_referral_code
 import csv
 from django.http import HttpResponse, JsonResponse
 from django.db.models import Count
@@ -59,10 +60,10 @@ def register_view(request):
             
             # Handle referral tracking
             referral_code = request.session.get('referral_code')
-            if referral_code:
+            ref_code_obj = resolve_referral_code(referral_code)
+            if ref_code_obj:
                 try:
-                    from vets.models import ReferralCode, ReferredUser, ReferralStatus
-                    ref_code_obj = ReferralCode.objects.get(code=referral_code, is_active=True)
+                    from vets.models import ReferredUser, ReferralStatus
                     
                     # Create or update referral tracking
                     referred_user, created = ReferredUser.objects.get_or_create(
@@ -113,36 +114,21 @@ def register_view(request):
         if ref_code:
             request.session['referral_code'] = ref_code
             # Also track the referral visit
-            try:
-                from vets.models import ReferralCode, ReferredUser, ReferralStatus
-                ref_code_obj = ReferralCode.objects.get(code=ref_code, is_active=True)
-                
-                # Create a tracking record for the visit (before registration)
-                ReferredUser.objects.get_or_create(
-                    clinic=ref_code_obj.clinic,
-                    email_capture='',  # Will be filled when user registers
-                    referral_code=ref_code_obj,
-                    defaults={'status': ReferralStatus.NEW}
-                )
-                
-                # Add clinic info to context for the registration form
-                request.referring_clinic = ref_code_obj.clinic
-                
-            except Exception as e:
-                print(f"Error tracking referral visit: {e}")
+            ref_code_obj = resolve_referral_code(ref_code)
+            if ref_code_obj:
+                try:
+                    from vets.models import ReferralVisitSource
+                    from vets.services.referral_visits import record_referral_visit
+                    
+                    # Log the visit (buffered); ReferredUser is created on registration
+                    record_referral_visit(ref_code_obj, ReferralVisitSource.REGISTER)
+                    
+                except Exception as e:
+                    print(f"Error tracking referral visit: {e}")
     
     # Get referring clinic info if available
-    referring_clinic = getattr(request, 'referring_clinic', None)
-    if not referring_clinic and request.session.get('referral_code'):
-        try:
-            from vets.models import ReferralCode
-            ref_code_obj = ReferralCode.objects.get(
-                code=request.session['referral_code'], 
-                is_active=True
-            )
-            referring_clinic = ref_code_obj.clinic
-        except:
-            pass
+    ref_code_obj = resolve_referral_code(request.session.get('referral_code'))
+    referring_clinic = ref_code_obj.clinic if ref_code_obj else None
     
     return render(request, 'userapp/register.html', {
         'form': form,
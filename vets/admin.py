@@ -1,5 +1,14 @@
 from django.contrib import admin
-from .models import Clinic, VetProfile, ReferralCode, ReferredUser, ReferralStatus
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import (
+    Clinic, VetProfile, ReferralCode, ReferredUser, ReferralStatus, GeocodeCache, Specialization,
+    ClinicReferralStats,
+)
+from .services.clinic_state import approve_clinics, disapprove_clinics
+from .services.referral_stats import recompute_referral_stats
+from .services.referrals import create_default_referral_codes
 
 
 @admin.register(Clinic)
@@ -10,7 +19,7 @@ class ClinicAdmin(admin.ModelAdmin):
     )
     list_filter = (
         "email_confirmed", "admin_approved", "is_verified", 
-        "city", "created_at"
+        "geocode_status", "specialization_tags", "city", "created_at"
     )
     search_fields = (
         "name", "city", "address", "email", 
@@ -78,16 +87,12 @@ class ClinicAdmin(admin.ModelAdmin):
 
     @admin.action(description="Approve selected clinics (admin approval)")
     def approve_clinics(self, request, queryset):
-        updated = 0
-        for clinic in queryset:
-            clinic.admin_approved = True
-            clinic.save()
-            updated += 1
+        updated = approve_clinics(queryset)
         self.message_user(request, f"{updated} clinic(s) approved by admin.")
 
     @admin.action(description="Disapprove selected clinics")
     def disapprove_clinics(self, request, queryset):
-        updated = queryset.update(admin_approved=False, is_verified=False)
+        updated = disapprove_clinics(queryset)
         self.message_user(request, f"{updated} clinic(s) disapproved.")
 
     @admin.action(description="Mark selected clinics as Verified (public listing)")
@@ -102,11 +107,8 @@ class ClinicAdmin(admin.ModelAdmin):
 
     @admin.action(description="Create default referral code (if none) or refresh (add new active)")
     def create_or_refresh_referral_code(self, request, queryset):
-        created = 0
-        for clinic in queryset:
-            # create a new active code (you may want to deactivate old ones)
-            ReferralCode.create_default_for_clinic(clinic)
-            created += 1
+        # create a new active code per clinic (you may want to deactivate old ones)
+        created = len(create_default_referral_codes(queryset))
         self.message_user(request, f"Created new referral codes for {created} clinic(s).")
 
     @admin.action(description="Generate proximity user report for selected clinic (single)")
@@ -117,7 +119,18 @@ class ClinicAdmin(admin.ModelAdmin):
         clinic = queryset.first()
         from django.urls import reverse
         report_url = reverse('vets:clinic_nearby_users_report', kwargs={'clinic_id': clinic.id})
-        self.message_user(request, f"Proximity report: {report_url}")
+        if clinic.latitude is None or clinic.longitude is None:
+            self.message_user(request, f"Proximity report: {report_url} (clinic has no coordinates)")
+            return
+        from .services.distances import profile_distances_within_radius
+        radius_km = 10.0
+        ids, _ = profile_distances_within_radius(
+            float(clinic.latitude), float(clinic.longitude), radius_km
+        )
+        self.message_user(
+            request,
+            f"Proximity report: {report_url} ({len(ids)} user(s) within {radius_km:g} km)"
+        )
 
 
 @admin.register(VetProfile)
@@ -139,17 +152,47 @@ class ReferredUserAdmin(admin.ModelAdmin):
     list_display = ("__str__", "clinic", "status", "created_at")
     list_filter = ("status", "created_at", "clinic")
     search_fields = ("user__email", "email_capture", "clinic__name", "referral_code__code")
-    readonly_fields = ("created_at", "updated_at")
+    readonly_fields = ("created_at", "updated_at", "activated_at")
     autocomplete_fields = ("clinic", "referral_code", "user")
 
     actions = ["mark_active", "mark_inactive"]
 
     @admin.action(description="Mark selected referrals as ACTIVE")
     def mark_active(self, request, queryset):
-        updated = queryset.update(status=ReferralStatus.ACTIVE)
+        clinic_ids = set(queryset.values_list("clinic_id", flat=True))
+        now = timezone.now()
+        # update() skips save(): stamp the rollup fields here
+        updated = queryset.update(
+            status=ReferralStatus.ACTIVE, activated_at=Coalesce("activated_at", Value(now)), updated_at=now
+        )
+        # update() also skips the signals that maintain the counters
+        recompute_referral_stats(clinic_ids)
         self.message_user(request, f"{updated} referral(s) set to ACTIVE.")
 
     @admin.action(description="Mark selected referrals as INACTIVE")
     def mark_inactive(self, request, queryset):
-        updated = queryset.update(status=ReferralStatus.INACTIVE)
+        clinic_ids = set(queryset.values_list("clinic_id", flat=True))
+        updated = queryset.update(status=ReferralStatus.INACTIVE, updated_at=timezone.now())
+        recompute_referral_stats(clinic_ids)
         self.message_user(request, f"{updated} referral(s) set to INACTIVE.")
+
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ("address", "city", "latitude", "longitude", "looked_up_at")
+    search_fields = ("address", "city", "fingerprint")
+    readonly_fields = ("fingerprint", "created_at", "updated_at")
+
+
+@admin.register(Specialization)
+class SpecializationAdmin(admin.ModelAdmin):
+    list_display = ("name", "slug")
+    search_fields = ("name", "slug")
+    readonly_fields = ("slug",)
+
+
+@admin.register(ClinicReferralStats)
+class ClinicReferralStatsAdmin(admin.ModelAdmin):
+    list_display = ("clinic", "total_referrals", "new_referrals", "active_referrals", "inactive_referrals", "updated_at")
+    readonly_fields = ("clinic", "total_referrals", "new_referrals", "active_referrals", "inactive_referrals", "updated_at")
+    search_fields = ("clinic__name",)
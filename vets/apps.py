@@ -8,3 +8,4 @@ class VetsConfig(AppConfig):
     def ready(self):
         # Import signals so Django registers them
         from . import signals  # noqa: F401
+        from . import checks  # noqa: F401
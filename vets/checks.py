@@ -0,0 +1,19 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def gazetteer_file_check(app_configs, **kwargs):
+    """City geocoding raises ImproperlyConfigured without its gazetteer; say so at startup."""
+    from .services.geocoders import uses_gazetteer
+
+    path = getattr(settings, "GAZETTEER_FILE", None)
+    if not uses_gazetteer() or (path and os.path.isfile(path)):
+        return []
+    return [Warning(
+        f"Gazetteer file {path!r} not found; city geocoding will fail.",
+        hint="Run `python manage.py fetch_gazetteer`, or point CITY_GEOCODER_BACKEND elsewhere.",
+        id="vets.W001",
+    )]
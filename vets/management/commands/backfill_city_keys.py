@@ -0,0 +1,27 @@
+"""
+Management command to recompute Clinic.city_key.
+Usage: python manage.py backfill_city_keys [--batch-size 500]
+
+Clinic.save() keeps the key current; run this after importing clinics with
+bulk_create()/update() or after changing vets.utils.normalize_city.
+"""
+from django.core.management.base import BaseCommand
+
+from vets.models import Clinic
+from vets.services.cities import backfill_city_keys
+
+
+class Command(BaseCommand):
+    help = 'Recompute the normalized city lookup key of every clinic'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of clinics written per bulk_update',
+        )
+
+    def handle(self, *args, **options):
+        updated = backfill_city_keys(Clinic, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Updated city key of {updated} clinics'))
@@ -0,0 +1,108 @@
+"""
+Management command to benchmark nearby clinic lookups on synthetic data.
+Usage: python manage.py benchmark_clinic_radius [--sizes 1000 10000 100000] [--radius 50]
+
+Three paths are compared: the original full table scan, the SQL bounding-box
+prefilter and the per-worker in-memory clinic index.
+
+Synthetic clinics are created inside a transaction that is rolled back at the
+end, so the command never leaves data behind.
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from vets.models import Clinic
+from vets.services.clinic_index import bump_clinic_set_version, get_clinic_index
+from vets.utils import get_clinics_within_radius
+
+
+class Command(BaseCommand):
+    help = 'Compare full-scan, bounding-box and in-memory index nearby clinic queries on synthetic clinics'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Numbers of synthetic clinics to benchmark against',
+        )
+        parser.add_argument(
+            '--radius',
+            type=float,
+            default=50,
+            help='Search radius in kilometers',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=20,
+            help='Number of random lookups per size',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for reproducible data',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        radius = options['radius']
+
+        self.stdout.write(f'Radius: {radius} km, {options["queries"]} queries per size\n')
+        self.stdout.write(
+            f'{"clinics":>10} {"full scan (ms)":>16} {"bbox (ms)":>12} '
+            f'{"index (ms)":>12} {"index build (ms)":>18}'
+        )
+
+        for size in options['sizes']:
+            with transaction.atomic():
+                self._create_clinics(size, rng)
+                points = [self._random_point(rng) for _ in range(options['queries'])]
+
+                full_ms = self._time_queries(points, radius, use_bbox=False, use_index=False)
+                bbox_ms = self._time_queries(points, radius, use_bbox=True, use_index=False)
+
+                bump_clinic_set_version()
+                started = time.perf_counter()
+                get_clinic_index()
+                build_ms = (time.perf_counter() - started) * 1000
+                index_ms = self._time_queries(points, radius, use_bbox=False, use_index=True)
+
+                transaction.set_rollback(True)
+            # Drop the index built from rolled-back rows
+            bump_clinic_set_version()
+
+            self.stdout.write(
+                f'{size:>10} {full_ms:>16.2f} {bbox_ms:>12.2f} {index_ms:>12.2f} {build_ms:>18.2f}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('\n✓ Benchmark finished (synthetic data rolled back)'))
+
+    def _random_point(self, rng):
+        return rng.uniform(-60, 70), rng.uniform(-180, 180)
+
+    def _create_clinics(self, size, rng):
+        clinics = []
+        for i in range(size):
+            lat, lng = self._random_point(rng)
+            clinics.append(Clinic(
+                name=f'Benchmark Clinic {i}',
+                slug=f'benchmark-clinic-{i}',
+                latitude=round(lat, 6),
+                longitude=round(lng, 6),
+                email_confirmed=True,
+                admin_approved=True,
+            ))
+        # bulk_create skips Clinic.save(), so no slug lookups or geocoding happen
+        Clinic.objects.bulk_create(clinics, batch_size=1000)
+
+    def _time_queries(self, points, radius, use_bbox, use_index):
+        started = time.perf_counter()
+        for lat, lng in points:
+            get_clinics_within_radius(lat, lng, radius, use_bbox=use_bbox, use_index=use_index)
+        return (time.perf_counter() - started) * 1000 / len(points)
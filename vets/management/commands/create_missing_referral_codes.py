@@ -1,17 +1,16 @@
 from django.core.management.base import BaseCommand
-from vets.models import Clinic, ReferralCode
+from vets.models import Clinic
+from vets.services.referrals import create_default_referral_codes
 
 
 class Command(BaseCommand):
     help = 'Create referral codes for email-confirmed clinics that do not have them'
 
     def handle(self, *args, **options):
-        # Find email-confirmed clinics without active referral codes
-        clinics_without_codes = []
-        
-        for clinic in Clinic.objects.filter(email_confirmed=True):
-            if not clinic.referral_codes.filter(is_active=True).exists():
-                clinics_without_codes.append(clinic)
+        # Find email-confirmed clinics without active referral codes (one query)
+        clinics_without_codes = list(
+            Clinic.objects.filter(email_confirmed=True).exclude(referral_codes__is_active=True)
+        )
         
         if not clinics_without_codes:
             self.stdout.write(
@@ -21,24 +20,24 @@ class Command(BaseCommand):
             )
             return
         
-        # Create referral codes for these clinics
-        created_count = 0
-        for clinic in clinics_without_codes:
-            try:
-                ReferralCode.create_default_for_clinic(clinic)
-                created_count += 1
-                self.stdout.write(
-                    f'Created referral code for clinic: {clinic.name}'
-                )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'Failed to create referral code for {clinic.name}: {e}'
-                    )
+        # Allocate every code at once and insert them in bulk
+        try:
+            codes = create_default_referral_codes(clinics_without_codes)
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(
+                    f'Failed to create referral codes: {e}'
                 )
+            )
+            return
+        
+        for clinic, code in zip(clinics_without_codes, codes):
+            self.stdout.write(
+                f'Created referral code {code.code} for clinic: {clinic.name}'
+            )
         
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully created {created_count} referral codes for email-confirmed clinics.'
+                f'Successfully created {len(codes)} referral codes for email-confirmed clinics.'
             )
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,86 @@
+"""
+Management command that downloads the GeoNames city dump and writes the
+gazetteer CSV read by GazetteerBackend (GAZETTEER_FILE).
+Usage: python manage.py fetch_gazetteer [--dataset cities15000] [--output path]
+
+The file is written next to itself and moved into place, so workers never
+read a half-written gazetteer. Restart the workers afterwards: each one loads
+the gazetteer once. GeoNames data is CC BY 4.0 (https://www.geonames.org/).
+"""
+import csv
+import io
+import os
+import zipfile
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+GEONAMES_URL = 'https://download.geonames.org/export/dump/{dataset}.zip'
+
+# Columns of the GeoNames "geoname" table used here
+NAME, ASCII_NAME, LATITUDE, LONGITUDE, COUNTRY, POPULATION = 1, 2, 4, 5, 8, 14
+
+
+def write_gazetteer(lines, fh) -> int:
+    """Write GeoNames dump `lines` as gazetteer CSV rows to `fh`; returns the row count."""
+    writer = csv.writer(fh)
+    writer.writerow(['name', 'country', 'latitude', 'longitude', 'population'])
+    count = 0
+    for line in lines:
+        cols = line.rstrip('\n').split('\t')
+        if len(cols) <= POPULATION:
+            continue
+        names = [cols[NAME]]
+        if cols[ASCII_NAME] and cols[ASCII_NAME] != cols[NAME]:
+            # e.g. "København" / "Kobenhavn": not every letter folds to ASCII on lookup
+            names.append(cols[ASCII_NAME])
+        for name in names:
+            writer.writerow([name, cols[COUNTRY], cols[LATITUDE], cols[LONGITUDE], cols[POPULATION] or 0])
+            count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = 'Download the GeoNames city list and write the offline gazetteer'
+    # Runs before the gazetteer exists, which the vets.W001 check warns about
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            default='cities15000',
+            choices=['cities500', 'cities1000', 'cities5000', 'cities15000'],
+            help='GeoNames dump: cities with at least this many inhabitants',
+        )
+        parser.add_argument(
+            '--output',
+            default=getattr(settings, 'GAZETTEER_FILE', None),
+            help='Where to write the gazetteer (default: GAZETTEER_FILE)',
+        )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if not output:
+            raise CommandError('Set GAZETTEER_FILE or pass --output')
+
+        url = GEONAMES_URL.format(dataset=options['dataset'])
+        self.stdout.write(f'Downloading {url}')
+        try:
+            response = requests.get(url, timeout=60)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise CommandError(f'Download failed: {e}')
+
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            with archive.open(f"{options['dataset']}.txt") as raw:
+                lines = io.TextIOWrapper(raw, encoding='utf-8')
+                tmp_path = f'{output}.tmp'
+                with open(tmp_path, 'w', newline='', encoding='utf-8') as fh:
+                    count = write_gazetteer(lines, fh)
+
+        if not count:
+            os.remove(tmp_path)
+            raise CommandError('The download contained no cities; the gazetteer was left unchanged')
+        os.replace(tmp_path, output)
+        self.stdout.write(self.style.SUCCESS(f'✓ Wrote {count} gazetteer rows to {output}'))
@@ -1,11 +1,20 @@
 """
 Management command to geocode existing clinics that don't have coordinates.
-Usage: python manage.py geocode_clinics [--all] [--force]
+Usage: python manage.py geocode_clinics [--all] [--force] [--no-cache] [--resume] [--workers N]
+
+Clinics are streamed in id order and written back in batches with bulk_update.
+After every batch the last written id is checkpointed, so a run that crashes or
+is killed by cron can continue with --resume. Every Nominatim request from all
+workers (and other processes on the host) takes a token from one shared bucket.
 """
+import os
+import tempfile
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from vets.models import Clinic
-from vets.utils import geocode_address
-import time
+from vets.services.geocoding import ClinicGeocodePipeline, FileCheckpoint
 
 
 class Command(BaseCommand):
@@ -22,91 +31,94 @@ class Command(BaseCommand):
             action='store_true',
             help='Force re-geocode even if coordinates exist',
         )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Ignore cached geocoding results and query the geocoder again',
+        )
         parser.add_argument(
             '--limit',
             type=int,
             default=None,
             help='Limit number of clinics to process',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of clinics written per bulk_update',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Concurrent geocoding workers (they share the rate limit)',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue after the last clinic id written by a previous run',
+        )
+        parser.add_argument(
+            '--checkpoint-file',
+            default=getattr(
+                settings,
+                'GEOCODE_CHECKPOINT_FILE',
+                os.path.join(tempfile.gettempdir(), 'fammo_geocode_clinics.checkpoint'),
+            ),
+            help='Where the last processed clinic id is stored',
+        )
 
     def handle(self, *args, **options):
         # Build queryset
-        if options['force']:
+        if options['force'] or options['all']:
             clinics = Clinic.objects.all()
             self.stdout.write(self.style.WARNING('Force mode: Re-geocoding ALL clinics'))
         else:
             clinics = Clinic.objects.filter(
-                latitude__isnull=True,
-            ) | Clinic.objects.filter(
-                longitude__isnull=True,
+                Q(latitude__isnull=True) | Q(longitude__isnull=True)
             )
-            self.stdout.write(f'Processing clinics without coordinates')
-        
-        # Apply limit
-        if options['limit']:
-            clinics = clinics[:options['limit']]
-        
-        total = clinics.count()
-        self.stdout.write(f'Found {total} clinic(s) to process\n')
-        
-        if total == 0:
+            self.stdout.write('Processing clinics without coordinates')
+
+        checkpoint = FileCheckpoint(options['checkpoint_file'])
+        start_after = checkpoint.load() if options['resume'] else 0
+        if start_after:
+            self.stdout.write(f'Resuming after clinic id {start_after}')
+
+        pipeline = ClinicGeocodePipeline(
+            clinics,
+            checkpoint=checkpoint,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            use_cache=not options['no_cache'],
+            on_batch=self._report_progress,
+        )
+        stats = pipeline.run(start_after=start_after, limit=options['limit'])
+
+        if stats.total == 0:
             self.stdout.write(self.style.SUCCESS('✓ All clinics already have coordinates!'))
+            checkpoint.clear()
             return
-        
-        success_count = 0
-        fail_count = 0
-        skip_count = 0
-        
-        for i, clinic in enumerate(clinics, 1):
-            # Skip if no address info
-            if not clinic.address and not clinic.city:
-                self.stdout.write(
-                    self.style.WARNING(f'[{i}/{total}] ⊘ {clinic.name}: No address or city')
-                )
-                skip_count += 1
-                continue
-            
-            self.stdout.write(f'[{i}/{total}] Processing: {clinic.name}')
-            
-            try:
-                # Build address string
-                full_address = f"{clinic.address}, {clinic.city}" if clinic.address and clinic.city else (clinic.address or clinic.city)
-                self.stdout.write(f'  Address: {full_address}')
-                
-                # Geocode
-                coords = geocode_address(clinic.address, clinic.city)
-                
-                if coords:
-                    lat, lng = coords
-                    clinic.latitude = lat
-                    clinic.longitude = lng
-                    clinic.save(update_fields=['latitude', 'longitude'])
-                    
-                    self.stdout.write(
-                        self.style.SUCCESS(f'  ✓ Success: {lat:.6f}, {lng:.6f}')
-                    )
-                    success_count += 1
-                else:
-                    self.stdout.write(
-                        self.style.ERROR(f'  ✗ Failed: Could not geocode address')
-                    )
-                    fail_count += 1
-                
-                # Rate limiting (Nominatim requires 1 request per second)
-                if i < total:
-                    time.sleep(1.1)
-                    
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'  ✗ Error: {str(e)}')
-                )
-                fail_count += 1
-        
+
+        # Finished without interruption: the next run starts from the beginning
+        if stats.processed >= stats.total and options['limit'] is None:
+            checkpoint.clear()
+
         # Summary
         self.stdout.write('\n' + '='*50)
-        self.stdout.write(self.style.SUCCESS(f'✓ Successfully geocoded: {success_count}'))
-        if fail_count:
-            self.stdout.write(self.style.ERROR(f'✗ Failed: {fail_count}'))
-        if skip_count:
-            self.stdout.write(self.style.WARNING(f'⊘ Skipped (no address): {skip_count}'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Successfully geocoded: {stats.success} ({stats.cached} from cache)'))
+        if stats.failed:
+            self.stdout.write(self.style.ERROR(f'✗ Failed: {stats.failed}'))
+        if stats.skipped:
+            self.stdout.write(self.style.WARNING(f'⊘ Skipped (no address): {stats.skipped}'))
+        self.stdout.write(f'Throughput: {stats.rate:.2f} clinics/s')
         self.stdout.write('='*50)
+
+    def _report_progress(self, stats):
+        eta = stats.eta_seconds
+        eta_text = f'{int(eta // 60)}m{int(eta % 60):02d}s' if eta is not None else '?'
+        self.stdout.write(
+            f'[{stats.processed}/{stats.total}] '
+            f'✓ {stats.success} ✗ {stats.failed} ⊘ {stats.skipped} | '
+            f'{stats.rate:.2f} clinics/s | ETA {eta_text}'
+        )
@@ -0,0 +1,68 @@
+"""
+Management command that resolves coordinates for clinics queued by Clinic.save()
+when GEOCODE_MODE = "deferred".
+Usage: python manage.py process_geocode_queue [--batch-size 50] [--loop] [--retry-failed]
+
+Run it from cron (or keep one instance running with --loop). Several instances
+may run at once: Nominatim requests are serialized through a host-wide rate limiter.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from vets.models import Clinic, GeocodeStatus
+from vets.services.geocoding import process_pending_geocodes
+
+
+class Command(BaseCommand):
+    help = 'Geocode clinics whose coordinates were deferred on save'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Maximum number of clinics to process per batch',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the queue instead of exiting when it is empty',
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=30,
+            help='Seconds to wait between polls when the queue is empty (with --loop)',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Re-queue clinics whose previous geocoding attempt failed',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            requeued = Clinic.objects.filter(
+                geocode_status=GeocodeStatus.FAILED
+            ).update(geocode_status=GeocodeStatus.PENDING)
+            self.stdout.write(f'Re-queued {requeued} failed clinic(s)')
+
+        while True:
+            result = process_pending_geocodes(limit=options['batch_size'])
+            processed = result.done + result.failed
+
+            if processed:
+                self.stdout.write(
+                    self.style.SUCCESS(f'✓ Geocoded: {result.done} ({result.cached} from cache)')
+                )
+                if result.failed:
+                    self.stdout.write(self.style.ERROR(f'✗ Failed: {result.failed}'))
+
+            if processed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['idle_sleep'])
+
+        remaining = Clinic.objects.filter(geocode_status=GeocodeStatus.PENDING).count()
+        self.stdout.write(f'{remaining} clinic(s) still pending')
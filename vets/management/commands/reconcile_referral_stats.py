@@ -0,0 +1,27 @@
+"""
+Management command to rebuild the denormalized clinic referral counters.
+Usage: python manage.py reconcile_referral_stats [--clinic ID ...]
+
+The counters are kept current by ReferredUser signals; run this after bulk
+imports or manual SQL changes to ReferredUser, or from cron as a safety net.
+"""
+from django.core.management.base import BaseCommand
+
+from vets.services.referral_stats import recompute_referral_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute ClinicReferralStats from the ReferredUser table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clinic',
+            type=int,
+            action='append',
+            dest='clinic_ids',
+            help='Only recompute this clinic id (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        written = recompute_referral_stats(options['clinic_ids'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Recomputed referral stats for {written} clinics'))
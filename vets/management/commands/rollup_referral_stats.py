@@ -0,0 +1,31 @@
+"""
+Management command to update the daily referral rollups used by the clinic
+analytics dashboard.
+Usage: python manage.py rollup_referral_stats [--full]
+
+Logged referral visits are folded into the daily counters and removed, then
+only days touched by referrals changed since the last run are recounted, so
+it is cheap to run from cron every few minutes. Use --full after deleting
+referrals or changing the rollup definitions.
+"""
+from django.core.management.base import BaseCommand
+
+from vets.services.referral_rollups import rollup_referral_stats
+
+
+class Command(BaseCommand):
+    help = 'Roll up referral activity into per-day, per-code counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Ignore the watermark and rebuild every day',
+        )
+
+    def handle(self, *args, **options):
+        result = rollup_referral_stats(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Folded {result.visits} visit(s); rebuilt {result.days} day(s), {result.rows} row(s); '
+            f'watermark {result.watermark:%Y-%m-%d %H:%M:%S}'
+        ))
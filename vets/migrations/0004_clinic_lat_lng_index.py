@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0003_clinic_latitude_clinic_longitude'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clinic',
+            index=models.Index(fields=['latitude', 'longitude'], name='vets_clinic_latitud_c68c64_idx'),
+        ),
+    ]
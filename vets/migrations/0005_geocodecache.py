@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0004_clinic_lat_lng_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('address', models.CharField(blank=True, max_length=220)),
+                ('city', models.CharField(blank=True, max_length=80)),
+                ('latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('looked_up_at', models.DateTimeField(help_text='When the geocoder was last queried for this address')),
+            ],
+            options={
+                'verbose_name_plural': 'geocode cache',
+            },
+        ),
+    ]
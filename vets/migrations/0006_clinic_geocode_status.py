@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:35
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def queue_clinics_without_coordinates(apps, schema_editor):
+    Clinic = apps.get_model('vets', 'Clinic')
+    Clinic.objects.filter(
+        Q(latitude__isnull=True) | Q(longitude__isnull=True)
+    ).exclude(address='', city='').update(geocode_status='PENDING')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0005_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinic',
+            name='geocode_status',
+            field=models.CharField(blank=True, choices=[('PENDING', 'Pending'), ('DONE', 'Done'), ('FAILED', 'Failed')], db_index=True, help_text='Deferred geocoding state; PENDING clinics are resolved by process_geocode_queue', max_length=10),
+        ),
+        migrations.RunPython(queue_clinics_without_coordinates, migrations.RunPython.noop),
+    ]
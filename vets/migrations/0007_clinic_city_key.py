@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:42
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Frozen copy of vets.utils.normalize_city as of this migration; later changes
+# to the live helper must not change what this migration writes.
+def normalize_city(value):
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return ' '.join(value.casefold().replace(',', ' ').split())[:80]
+
+
+def fill_city_keys(apps, schema_editor):
+    Clinic = apps.get_model('vets', 'Clinic')
+    last_id = 0
+    while True:
+        batch = list(Clinic.objects.filter(id__gt=last_id).order_by('id').only('id', 'city', 'city_key')[:500])
+        if not batch:
+            return
+        last_id = batch[-1].id
+        for clinic in batch:
+            clinic.city_key = normalize_city(clinic.city)
+        Clinic.objects.bulk_update(batch, ['city_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0006_clinic_geocode_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinic',
+            name='city_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Normalized city (casefolded, accent-stripped) used for indexed city lookups', max_length=80),
+        ),
+        migrations.RunPython(fill_city_keys, migrations.RunPython.noop),
+    ]
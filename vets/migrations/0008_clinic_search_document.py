@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+
+# Frozen copy of vets.services.clinic_search.build_search_document as of this
+# migration; later changes to the live helper must not change what it writes.
+def build_search_document(clinic, vet_name=''):
+    parts = (clinic.name, clinic.city, clinic.specializations, vet_name, clinic.bio)
+    return '\n'.join(part for part in parts if part)
+
+
+def fill_search_documents(apps, schema_editor):
+    Clinic = apps.get_model('vets', 'Clinic')
+    VetProfile = apps.get_model('vets', 'VetProfile')
+    vet_names = dict(VetProfile.objects.values_list('clinic_id', 'vet_name'))
+    clinics = list(Clinic.objects.only('id', 'name', 'city', 'specializations', 'bio'))
+    for clinic in clinics:
+        clinic.search_document = build_search_document(clinic, vet_names.get(clinic.id, ''))
+    Clinic.objects.bulk_update(clinics, ['search_document'], batch_size=500)
+
+
+def add_fulltext_indexes(apps, schema_editor):
+    # Django has no FULLTEXT index type; other databases use the in-process search index
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('ALTER TABLE vets_clinic ADD FULLTEXT INDEX vets_clinic_search_ft (search_document)')
+    schema_editor.execute('ALTER TABLE vets_clinic ADD FULLTEXT INDEX vets_clinic_name_ft (name)')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('ALTER TABLE vets_clinic DROP INDEX vets_clinic_search_ft')
+    schema_editor.execute('ALTER TABLE vets_clinic DROP INDEX vets_clinic_name_ft')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0007_clinic_city_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinic',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, help_text='Name, city, specializations, vet name and bio; FULLTEXT-indexed on MySQL'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(add_fulltext_indexes, drop_fulltext_indexes),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:45
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+# Frozen copy of vets.services.specializations.parse_specializations as of this
+# migration; later changes to the live parser must not change what it writes.
+def parse_specializations(value):
+    parsed = {}
+    for part in (value or '').split(','):
+        name = ' '.join(part.split())[:60]
+        slug = slugify(name)[:70]
+        if slug and slug not in parsed:
+            parsed[slug] = name
+    return parsed
+
+
+def parse_existing_specializations(apps, schema_editor):
+    Clinic = apps.get_model('vets', 'Clinic')
+    Specialization = apps.get_model('vets', 'Specialization')
+    Through = Clinic.specialization_tags.through
+
+    parsed = {pk: parse_specializations(value) for pk, value in Clinic.objects.values_list('id', 'specializations')}
+    names = {}
+    for tags in parsed.values():
+        for slug, name in tags.items():
+            names.setdefault(slug, name)
+    Specialization.objects.bulk_create([Specialization(slug=slug, name=name) for slug, name in names.items()],
+                                       batch_size=1000)
+    ids = dict(Specialization.objects.values_list('slug', 'id'))
+    Through.objects.bulk_create(
+        [Through(clinic_id=pk, specialization_id=ids[slug]) for pk, tags in parsed.items() for slug in tags],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0008_clinic_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Specialization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=60)),
+                ('slug', models.SlugField(max_length=70, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='clinic',
+            name='specialization_tags',
+            field=models.ManyToManyField(blank=True, help_text='Parsed from specializations on save', related_name='clinics', to='vets.specialization'),
+        ),
+        migrations.RunPython(parse_existing_specializations, migrations.RunPython.noop),
+    ]
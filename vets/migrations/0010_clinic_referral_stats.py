@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_existing_referrals(apps, schema_editor):
+    Clinic = apps.get_model('vets', 'Clinic')
+    ReferredUser = apps.get_model('vets', 'ReferredUser')
+    ClinicReferralStats = apps.get_model('vets', 'ClinicReferralStats')
+    counts = {
+        row['clinic_id']: row
+        for row in ReferredUser.objects.values('clinic_id').annotate(
+            total=Count('id'),
+            new=Count('id', filter=Q(status='NEW')),
+            active=Count('id', filter=Q(status='ACTIVE')),
+            inactive=Count('id', filter=Q(status='INACTIVE')),
+        ).order_by()
+    }
+    ClinicReferralStats.objects.bulk_create([
+        ClinicReferralStats(
+            clinic_id=clinic_id,
+            total_referrals=counts.get(clinic_id, {}).get('total', 0),
+            new_referrals=counts.get(clinic_id, {}).get('new', 0),
+            active_referrals=counts.get(clinic_id, {}).get('active', 0),
+            inactive_referrals=counts.get(clinic_id, {}).get('inactive', 0),
+        )
+        for clinic_id in Clinic.objects.values_list('id', flat=True)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0009_specialization_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicReferralStats',
+            fields=[
+                ('clinic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='referral_stats', serialize=False, to='vets.clinic')),
+                ('total_referrals', models.PositiveIntegerField(default=0)),
+                ('new_referrals', models.PositiveIntegerField(default=0)),
+                ('active_referrals', models.PositiveIntegerField(default=0)),
+                ('inactive_referrals', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Clinic referral stats',
+            },
+        ),
+        migrations.RunPython(count_existing_referrals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def move_anonymous_referrals(apps, schema_editor):
+    """
+    Referral link visits used to be stored as ReferredUser rows without a
+    user or email. Move them to the visit log and recount the affected
+    clinics; the daily rollups are cleared so the next rollup_referral_stats
+    run rebuilds them with the new visit definition.
+    """
+    ReferredUser = apps.get_model('vets', 'ReferredUser')
+    ReferralVisit = apps.get_model('vets', 'ReferralVisit')
+    ClinicReferralStats = apps.get_model('vets', 'ClinicReferralStats')
+    ReferralDailyStats = apps.get_model('vets', 'ReferralDailyStats')
+    RollupWatermark = apps.get_model('vets', 'RollupWatermark')
+
+    anonymous = ReferredUser.objects.filter(user__isnull=True, email_capture='')
+    rows = list(anonymous.values_list('clinic_id', 'referral_code_id', 'created_at'))
+    ReferralVisit.objects.bulk_create([
+        ReferralVisit(clinic_id=clinic_id, referral_code_id=code_id, source='REGISTER', created_at=created_at)
+        for clinic_id, code_id, created_at in rows
+    ], batch_size=1000)
+    anonymous.delete()
+
+    clinic_ids = {clinic_id for clinic_id, _, _ in rows}
+    counts = {
+        row['clinic_id']: row
+        for row in ReferredUser.objects.filter(clinic_id__in=clinic_ids).values('clinic_id').annotate(
+            total=Count('id'),
+            new=Count('id', filter=Q(status='NEW')),
+            active=Count('id', filter=Q(status='ACTIVE')),
+            inactive=Count('id', filter=Q(status='INACTIVE')),
+        ).order_by()
+    }
+    for clinic_id in clinic_ids:
+        row = counts.get(clinic_id, {})
+        ClinicReferralStats.objects.filter(clinic_id=clinic_id).update(
+            total_referrals=row.get('total', 0),
+            new_referrals=row.get('new', 0),
+            active_referrals=row.get('active', 0),
+            inactive_referrals=row.get('inactive', 0),
+        )
+
+    ReferralDailyStats.objects.all().delete()
+    RollupWatermark.objects.filter(name='referral_daily_stats').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0011_referral_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralVisit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('REGISTER', 'Registration page'), ('SIGNUP', 'Account signup'), ('LANDING', 'Landing page')], max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='referral_visits', to='vets.clinic')),
+                ('referral_code', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='visits', to='vets.referralcode')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(move_anonymous_referrals, migrations.RunPython.noop),
+    ]
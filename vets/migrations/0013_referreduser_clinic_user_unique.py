@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+STATUS_RANK = {'ACTIVE': 0, 'NEW': 1, 'INACTIVE': 2}
+
+
+def merge_duplicate_referrals(apps, schema_editor):
+    """
+    Keep one referral per (clinic, user) before the constraint is added: the
+    most advanced status wins, then the oldest row. Recount the clinics that
+    lost rows.
+    """
+    ReferredUser = apps.get_model('vets', 'ReferredUser')
+    ClinicReferralStats = apps.get_model('vets', 'ClinicReferralStats')
+
+    duplicated = (
+        ReferredUser.objects.filter(user__isnull=False)
+        .values('clinic_id', 'user_id')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    doomed, clinic_ids = [], set()
+    for group in duplicated:
+        rows = sorted(
+            ReferredUser.objects.filter(clinic_id=group['clinic_id'], user_id=group['user_id'])
+            .values_list('id', 'status'),
+            key=lambda row: (STATUS_RANK.get(row[1], 3), row[0]),
+        )
+        doomed.extend(pk for pk, _ in rows[1:])
+        clinic_ids.add(group['clinic_id'])
+    if not doomed:
+        return
+    ReferredUser.objects.filter(id__in=doomed).delete()
+
+    counts = {
+        row['clinic_id']: row
+        for row in ReferredUser.objects.filter(clinic_id__in=clinic_ids).values('clinic_id').annotate(
+            total=Count('id'),
+            new=Count('id', filter=Q(status='NEW')),
+            active=Count('id', filter=Q(status='ACTIVE')),
+            inactive=Count('id', filter=Q(status='INACTIVE')),
+        ).order_by()
+    }
+    for clinic_id in clinic_ids:
+        row = counts.get(clinic_id, {})
+        ClinicReferralStats.objects.filter(clinic_id=clinic_id).update(
+            total_referrals=row.get('total', 0),
+            new_referrals=row.get('new', 0),
+            active_referrals=row.get('active', 0),
+            inactive_referrals=row.get('inactive', 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0012_referral_visit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_referrals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='referreduser',
+            constraint=models.UniqueConstraint(fields=('clinic', 'user'), name='vets_referreduser_clinic_user_uniq'),
+        ),
+    ]
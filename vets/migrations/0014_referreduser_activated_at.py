@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 09:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_activated_at(apps, schema_editor):
+    """
+    Referrals that are already ACTIVE: their last update is the best
+    available activation time (what the rollups used so far).
+    """
+    ReferredUser = apps.get_model('vets', 'ReferredUser')
+    ReferredUser.objects.filter(status='ACTIVE', activated_at__isnull=True).update(activated_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vets', '0013_referreduser_clinic_user_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='referreduser',
+            name='activated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_activated_at, migrations.RunPython.noop),
+    ]
@@ -4,9 +4,10 @@ import secrets
 import string
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.template.defaultfilters import slugify
 from django.urls import reverse
+from django.utils import timezone
 
 # ---------- helpers ----------
 def _rand_suffix(n: int = 5) -> str:
@@ -24,7 +25,40 @@ class TimeStampedModel(models.Model):
     class Meta:
         abstract = True
 
+class GeocodeStatus(models.TextChoices):
+    PENDING = "PENDING", "Pending"
+    DONE = "DONE", "Done"
+    FAILED = "FAILED", "Failed"
+
+
 # ---------- core models ----------
+class Specialization(models.Model):
+    """
+    Normalized specialization tag ("Cats", "Dogs", "Nutrition").
+    Clinic.specializations stays the editable text; tags are derived from it on save.
+    """
+    name = models.CharField(max_length=60)
+    slug = models.SlugField(max_length=70, unique=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class ClinicQuerySet(models.QuerySet):
+    def with_active_referral_code(self):
+        """
+        Annotate the oldest active referral code in the same query, so
+        Clinic.active_referral_code needs no query per clinic.
+        """
+        oldest_active = ReferralCode.objects.filter(
+            clinic=models.OuterRef("pk"), is_active=True
+        ).order_by("created_at").values("code")[:1]
+        return self.annotate(_active_referral_code=models.Subquery(oldest_active))
+
+
 class Clinic(TimeStampedModel):
     """
     A veterinarian or clinic with a public page on FAMMO.
@@ -40,6 +74,13 @@ class Clinic(TimeStampedModel):
     name = models.CharField(max_length=160, unique=True)
     slug = models.SlugField(max_length=190, unique=True, blank=True)
     city = models.CharField(max_length=80, blank=True)
+    city_key = models.CharField(
+        max_length=80,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text="Normalized city (casefolded, accent-stripped) used for indexed city lookups",
+    )
     address = models.CharField(max_length=220, blank=True)
     latitude = models.DecimalField(
         max_digits=9, 
@@ -64,12 +105,30 @@ class Clinic(TimeStampedModel):
         blank=True,
         help_text="Comma-separated (e.g., Cats, Dogs, Nutrition)",
     )
+    specialization_tags = models.ManyToManyField(
+        Specialization,
+        blank=True,
+        related_name="clinics",
+        help_text="Parsed from specializations on save",
+    )
     working_hours = models.CharField(
         max_length=160, blank=True, help_text="e.g., Mon–Sat 09:00–18:00"
     )
     bio = models.TextField(blank=True)
     logo = models.ImageField(upload_to="clinic_logos/", blank=True, null=True)
     is_verified = models.BooleanField(default=False)
+    search_document = models.TextField(
+        blank=True,
+        editable=False,
+        help_text="Name, city, specializations, vet name and bio; FULLTEXT-indexed on MySQL",
+    )
+    geocode_status = models.CharField(
+        max_length=10,
+        choices=GeocodeStatus.choices,
+        blank=True,
+        db_index=True,
+        help_text="Deferred geocoding state; PENDING clinics are resolved by process_geocode_queue",
+    )
     
     # Email confirmation and approval fields
     email_confirmed = models.BooleanField(default=False, help_text="Email address has been confirmed")
@@ -82,37 +141,121 @@ class Clinic(TimeStampedModel):
         """Clinic is active only if both email confirmed and admin approved"""
         return self.email_confirmed and self.admin_approved
 
+    objects = ClinicQuerySet.as_manager()
+
+    # Fields Clinic.search_document is built from (plus the vet name)
+    SEARCH_SOURCE_FIELDS = ("name", "city", "specializations", "bio")
+
     class Meta:
         ordering = ["name"]
+        indexes = [models.Index(fields=["latitude", "longitude"])]
 
     def __str__(self) -> str:
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored state, so save() knows which workflow transitions it performs
+        # and which derived data it has to rebuild
+        instance._remember_stored_state()
+        return instance
+
+    def _loaded_values(self, fields):
+        # Deferred fields are absent from __dict__; they cannot have changed
+        return tuple(self.__dict__.get(f) for f in fields)
+
+    def _remember_stored_state(self, update_fields=None):
+        self._stored_email_confirmed = self.__dict__.get("email_confirmed")
+        current = self._loaded_values(self.SEARCH_SOURCE_FIELDS)
+        if update_fields is not None and hasattr(self, "_stored_search_sources"):
+            # fields left out of a partial save still differ from the row
+            current = tuple(
+                value if field in update_fields else stored
+                for field, value, stored in zip(self.SEARCH_SOURCE_FIELDS, current, self._stored_search_sources)
+            )
+        self._stored_search_sources = current
+
+    def _changed_since_load(self, fields, update_fields) -> bool:
+        """
+        True when any of `fields` differs from the stored row (always for a
+        new clinic) and is part of this save.
+        """
+        if update_fields is not None and not set(fields) & set(update_fields):
+            return False
+        if self._state.adding or not hasattr(self, "_stored_search_sources"):
+            return True
+        stored = dict(zip(self.SEARCH_SOURCE_FIELDS, self._stored_search_sources))
+        return any(self.__dict__.get(f) != stored[f] for f in fields)
+
     def save(self, *args, **kwargs):
-        # auto-generate a unique slug
-        if not self.slug:
-            base = slugify(self.name) or "clinic"
-            slug_candidate = base
-            i = 1
-            while Clinic.objects.filter(slug=slug_candidate).exclude(pk=self.pk).exists():
-                i += 1
-                slug_candidate = f"{base}-{i}"
-            self.slug = slug_candidate
+        from .services.clinic_state import apply_saved_transitions, is_verified_state
+        
+        # verification follows email confirmation + admin approval
+        self.is_verified = is_verified_state(self)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"email_confirmed", "admin_approved"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "is_verified"}
+        
+        # keep the indexed city lookup key in sync
+        from .utils import normalize_city
+        self.city_key = normalize_city(self.city)
+        
+        # denormalized text for the search backend (see services/clinic_search.py);
+        # vet name changes are handled by a VetProfile signal
+        if self._changed_since_load(self.SEARCH_SOURCE_FIELDS, update_fields):
+            from .services.clinic_search import build_search_document
+            vet_name = ""
+            if self.pk:
+                vet_name = VetProfile.objects.filter(clinic_id=self.pk).values_list("vet_name", flat=True).first() or ""
+            self.search_document = build_search_document(self, vet_name)
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "search_document"}
+        # tags are parsed from specializations (see services/specializations.py)
+        specializations_changed = self._changed_since_load(("specializations",), update_fields)
         
         # Auto-geocode if coordinates are missing but address exists
         if (not self.latitude or not self.longitude) and (self.address or self.city):
-            from .utils import geocode_address
+            from .utils import geocode_address, get_cached_geocode
             import logging
             logger = logging.getLogger(__name__)
             
-            coords = geocode_address(self.address, self.city)
+            if getattr(settings, "GEOCODE_MODE", "sync") == "deferred":
+                # Only a cache lookup here; the geocoder is queried by process_geocode_queue
+                cached = get_cached_geocode(self.address, self.city)
+                coords = cached.coords if cached else None
+                if not coords and not self.address:
+                    # City-only clinics resolve offline from the gazetteer, if there is one
+                    from .services.geocoders import get_city_geocoder
+                    city_geocoder = get_city_geocoder()
+                    coords = city_geocoder.geocode("", self.city) if city_geocoder else None
+                if not coords:
+                    self.geocode_status = GeocodeStatus.PENDING
+            else:
+                coords = geocode_address(self.address, self.city)
             if coords:
                 self.latitude, self.longitude = coords
+                self.geocode_status = GeocodeStatus.DONE
                 # Use logger instead of print to avoid encoding issues
                 logger.info(f"Auto-geocoded {self.name}: {self.latitude}, {self.longitude}")
         
-        
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if self.slug:
+                super().save(*args, **kwargs)
+            else:
+                # auto-generate a unique slug (see services/slugs.py)
+                from .services.slugs import save_with_unique_value
+                save_with_unique_value(
+                    self, "slug", slugify(self.name) or "clinic", lambda: super(Clinic, self).save(*args, **kwargs)
+                )
+            
+            # e.g. the first referral code once the email is confirmed
+            apply_saved_transitions(self, bool(getattr(self, "_stored_email_confirmed", False)))
+            
+            if specializations_changed:
+                from .services.specializations import sync_specialization_tags
+                sync_specialization_tags(self)
+            self._remember_stored_state(update_fields)
 
     def get_absolute_url(self):
         return reverse("vets:clinic_detail", kwargs={"slug": self.slug})
@@ -122,8 +265,15 @@ class Clinic(TimeStampedModel):
         """Return referral code if clinic has confirmed email (even if not admin approved)"""
         if not self.email_confirmed:
             return None
-        code = self.referral_codes.filter(is_active=True).order_by("created_at").first()
-        return code.code if code else None
+        # Set by ClinicQuerySet.with_active_referral_code() or by a previous access
+        if "_active_referral_code" not in self.__dict__:
+            code = self.referral_codes.filter(is_active=True).order_by("created_at").first()
+            self._active_referral_code = code.code if code else None
+        return self._active_referral_code
+
+    def forget_active_referral_code(self) -> None:
+        """Drop the memoized code after this clinic's referral codes change."""
+        self.__dict__.pop("_active_referral_code", None)
 
 
 class VetProfile(TimeStampedModel):
@@ -154,20 +304,25 @@ class ReferralCode(TimeStampedModel):
     def __str__(self) -> str:
         return f"{self.code} → {self.clinic.name}"
 
+    @staticmethod
+    def default_code_base(clinic: Clinic) -> str:
+        """Readable code based on clinic slug; fall back to random."""
+        if clinic.slug:
+            base = clinic.slug.replace("-", "")[:10]
+            return f"vet-{base or _rand_suffix(4)}"
+        return _gen_ref_code()
+
     @staticmethod
     def create_default_for_clinic(clinic: Clinic) -> "ReferralCode":
         """
-        Create a readable, unique code based on clinic slug; fall back to random.
+        Create a readable, unique code for the clinic; a taken code gets a
+        numeric suffix (vet-name-2, ...).
         """
-        if clinic.slug:
-            base = clinic.slug.replace("-", "")[:10]
-            candidate = f"vet-{base or _rand_suffix(4)}"
-        else:
-            candidate = _gen_ref_code()
-        # ensure uniqueness
-        while ReferralCode.objects.filter(code=candidate).exists():
-            candidate = _gen_ref_code()
-        return ReferralCode.objects.create(clinic=clinic, code=candidate, is_active=True)
+        from .services.slugs import save_with_unique_value
+        code = ReferralCode(clinic=clinic, is_active=True)
+        save_with_unique_value(code, "code", ReferralCode.default_code_base(clinic), code.save)
+        clinic.forget_active_referral_code()
+        return code
 
 
 class ReferralStatus(models.TextChoices):
@@ -192,14 +347,151 @@ class ReferredUser(TimeStampedModel):
     )
     email_capture = models.EmailField(blank=True)
     status = models.CharField(max_length=10, choices=ReferralStatus.choices, default=ReferralStatus.NEW)
+    # First time the referral became ACTIVE; the activation day of the daily rollups
+    activated_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [
             models.Index(fields=["status", "created_at"]),
             models.Index(fields=["clinic", "created_at"]),
         ]
+        constraints = [
+            # Rows without a user (email capture only) never conflict: NULLs are distinct
+            models.UniqueConstraint(fields=["clinic", "user"], name="vets_referreduser_clinic_user_uniq"),
+        ]
         ordering = ["-created_at"]
 
     def __str__(self) -> str:
         who = getattr(self.user, "email", None) if self.user_id else (self.email_capture or "anonymous")
         return f"{who} via {self.clinic.name} ({self.status})"
+
+    def save(self, *args, **kwargs):
+        if self.status == ReferralStatus.ACTIVE and self.activated_at is None:
+            self.activated_at = timezone.now()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "activated_at"}
+        super().save(*args, **kwargs)
+
+
+class ReferralVisitSource(models.TextChoices):
+    REGISTER = "REGISTER", "Registration page"
+    SIGNUP = "SIGNUP", "Account signup"
+    LANDING = "LANDING", "Landing page"
+
+
+class ReferralVisit(models.Model):
+    """
+    Append-only log of arrivals through a referral link. Rows are written in
+    batches by services/referral_visits.py and folded into
+    ReferralDailyStats.visits (then deleted) by rollup_referral_stats, so
+    ReferredUser only holds people who actually signed up.
+    """
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name="referral_visits")
+    referral_code = models.ForeignKey(
+        ReferralCode, on_delete=models.SET_NULL, null=True, blank=True, related_name="visits"
+    )
+    source = models.CharField(max_length=10, choices=ReferralVisitSource.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        return f"{self.clinic_id} via {self.referral_code_id} ({self.source}) at {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class ClinicReferralStats(models.Model):
+    """
+    Denormalized referral counters for one clinic, maintained by the
+    ReferredUser signals (see services/referral_stats.py) so dashboards read
+    one row instead of counting the referral table.
+    Rebuild with: python manage.py reconcile_referral_stats
+    """
+    clinic = models.OneToOneField(
+        Clinic, on_delete=models.CASCADE, primary_key=True, related_name="referral_stats"
+    )
+    total_referrals = models.PositiveIntegerField(default=0)
+    new_referrals = models.PositiveIntegerField(default=0)
+    active_referrals = models.PositiveIntegerField(default=0)
+    inactive_referrals = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Clinic referral stats"
+
+    def __str__(self) -> str:
+        return f"{self.clinic_id}: {self.total_referrals} referrals"
+
+    @property
+    def conversion_rate(self) -> float:
+        """Share of referrals that became active users, in percent."""
+        if not self.total_referrals:
+            return 0
+        return round((self.active_referrals / self.total_referrals) * 100, 1)
+
+
+class ReferralDailyStats(models.Model):
+    """
+    Per-day referral rollup for one clinic and referral code, filled
+    incrementally by the rollup_referral_stats command.
+
+    visits       referral link arrivals (folded in from ReferralVisit)
+    signups      referrals created that day with an account
+    activations  referrals that first turned ACTIVE that day (activated_at)
+    """
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name="daily_referral_stats")
+    referral_code = models.ForeignKey(
+        ReferralCode, on_delete=models.CASCADE, null=True, blank=True, related_name="daily_stats"
+    )
+    day = models.DateField()
+    visits = models.PositiveIntegerField(default=0)
+    signups = models.PositiveIntegerField(default=0)
+    activations = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["clinic", "day"])]
+        ordering = ["day"]
+        verbose_name_plural = "Referral daily stats"
+
+    def __str__(self) -> str:
+        return f"{self.clinic_id} {self.day}: {self.visits}/{self.signups}/{self.activations}"
+
+
+class RollupWatermark(models.Model):
+    """Position up to which a rollup job has processed its source rows."""
+    name = models.CharField(max_length=60, unique=True)
+    position = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} @ {self.position:%Y-%m-%d %H:%M:%S}"
+
+
+class GeocodeCache(TimeStampedModel):
+    """
+    Persistent result of a geocoding lookup, keyed by a normalized address+city fingerprint.
+    A row without coordinates is a cached miss and is retried once it is older than
+    GEOCODE_NEGATIVE_CACHE_TTL.
+    """
+    fingerprint = models.CharField(max_length=64, unique=True)
+    address = models.CharField(max_length=220, blank=True)
+    city = models.CharField(max_length=80, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    looked_up_at = models.DateTimeField(help_text="When the geocoder was last queried for this address")
+
+    class Meta:
+        verbose_name_plural = "geocode cache"
+
+    def __str__(self) -> str:
+        where = ", ".join(part for part in (self.address, self.city) if part)
+        return f"{where} → {self.latitude}, {self.longitude}" if self.is_hit else f"{where} → miss"
+
+    @property
+    def is_hit(self) -> bool:
+        return self.latitude is not None and self.longitude is not None
+
+    @property
+    def coords(self):
+        """(latitude, longitude) as floats, or None for a cached miss."""
+        return (float(self.latitude), float(self.longitude)) if self.is_hit else None
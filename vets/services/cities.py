@@ -0,0 +1,58 @@
+"""
+City lookups for the clinic finder.
+
+Clinic.city_key holds the normalized city name (see vets.utils.normalize_city)
+so lookups are exact or prefix matches on an indexed column instead of
+city__icontains scans.
+"""
+from __future__ import annotations
+from typing import Optional, Tuple
+
+from django.db.models import Q
+
+from ..utils import geocode_address, normalize_city
+
+
+def city_filter(city: str, prefix: bool = True) -> Q:
+    """
+    Q matching clinics in `city`. Prefix matching lets "amst" find
+    "Amsterdam"; both forms can use the city_key index. The key is already
+    casefolded, and istartswith is a plain LIKE 'x%' on MySQL (startswith
+    is LIKE BINARY, which cannot use the case-insensitive index). A city
+    that normalizes to nothing matches no clinic.
+    """
+    key = normalize_city(city)
+    if not key:
+        return Q(pk__in=[])
+    return Q(city_key__istartswith=key) if prefix else Q(city_key=key)
+
+
+def resolve_city_centroid(city: str) -> Optional[Tuple[float, float]]:
+    """City center from the offline gazetteer, falling back to the cached Nominatim lookup."""
+    return geocode_address('', city, precision='city')
+
+
+def backfill_city_keys(model, batch_size: int = 500) -> int:
+    """
+    Recompute city_key for every row whose stored key is stale. `model` is
+    the Clinic class (or its historical version inside a migration).
+    Returns the number of rows updated.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(
+            model.objects.filter(id__gt=last_id).order_by('id').only('id', 'city', 'city_key')[:batch_size]
+        )
+        if not batch:
+            return updated
+        last_id = batch[-1].id
+        changed = []
+        for clinic in batch:
+            key = normalize_city(clinic.city)
+            if clinic.city_key != key:
+                clinic.city_key = key
+                changed.append(clinic)
+        if changed:
+            model.objects.bulk_update(changed, ['city_key'])
+            updated += len(changed)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+import heapq
+import threading
+import time
+from math import radians, cos, sin, asin, sqrt, pi
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ..models import Clinic
+from ..utils import EARTH_RADIUS_KM
+
+# Cache key holding the version stamp of the active clinic set, kept in the
+# shared default cache (see CACHES) so that every worker sees bumps.
+CLINIC_SET_VERSION_KEY = "vets:clinic_set_version"
+
+
+# ---------- clinic set version ----------
+def get_clinic_set_version() -> int:
+    """Return the current clinic-set version, initialising it if missing."""
+    version = cache.get(CLINIC_SET_VERSION_KEY)
+    if version is None:
+        cache.add(CLINIC_SET_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(CLINIC_SET_VERSION_KEY)
+    return version
+
+
+def bump_clinic_set_version() -> None:
+    """Invalidate everything derived from the set of active clinics."""
+    try:
+        cache.incr(CLINIC_SET_VERSION_KEY)
+    except ValueError:
+        # Key missing (expired or never set): start from a fresh timestamp
+        cache.set(CLINIC_SET_VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+
+# ---------- KD-tree ----------
+def _to_xyz(lat: float, lng: float) -> Tuple[float, float, float]:
+    """Project lat/lng onto the unit sphere so the antimeridian and poles need no special cases."""
+    lat_r, lng_r = radians(lat), radians(lng)
+    return (cos(lat_r) * cos(lng_r), cos(lat_r) * sin(lng_r), sin(lat_r))
+
+
+def _chord_sq(radius_km: float) -> float:
+    """Squared chord length on the unit sphere for a great-circle distance."""
+    angle = min(radius_km / EARTH_RADIUS_KM, pi)
+    return (2 * sin(angle / 2)) ** 2
+
+
+def _chord_sq_to_km(d2: float) -> float:
+    return 2 * asin(min(1.0, sqrt(d2) / 2)) * EARTH_RADIUS_KM
+
+
+class ClinicSpatialIndex:
+    """
+    Immutable KD-tree over (id, lat, lng) of active clinics.
+    Points are stored as 3D unit vectors; chord distance is monotonic in
+    great-circle distance, so radius and k-nearest pruning stay exact.
+    """
+
+    def __init__(self, points: List[Tuple[int, float, float]]):
+        self.ids = [p[0] for p in points]
+        self.xyz = [_to_xyz(p[1], p[2]) for p in points]
+        # node = (point index, split axis, left node, right node)
+        self.root = self._build(list(range(len(points))))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _build(self, indices: List[int]):
+        if not indices:
+            return None
+        xyz = self.xyz
+        spreads = [
+            max(xyz[i][axis] for i in indices) - min(xyz[i][axis] for i in indices)
+            for axis in range(3)
+        ]
+        axis = spreads.index(max(spreads))
+        indices.sort(key=lambda i: xyz[i][axis])
+        mid = len(indices) // 2
+        return (
+            indices[mid],
+            axis,
+            self._build(indices[:mid]),
+            self._build(indices[mid + 1:]),
+        )
+
+    def _dist_sq(self, q, i) -> float:
+        p = self.xyz[i]
+        return (q[0] - p[0]) ** 2 + (q[1] - p[1]) ** 2 + (q[2] - p[2]) ** 2
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[int, float]]:
+        """Return [(clinic_id, distance_km)] inside the radius, nearest first."""
+        q = _to_xyz(latitude, longitude)
+        limit = _chord_sq(radius_km)
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            i, axis, left, right = node
+            d2 = self._dist_sq(q, i)
+            if d2 <= limit:
+                found.append((d2, i))
+            diff = q[axis] - self.xyz[i][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append(near)
+            if diff * diff <= limit:
+                stack.append(far)
+        found.sort()
+        return [(self.ids[i], _chord_sq_to_km(d2)) for d2, i in found]
+
+    def nearest(self, latitude: float, longitude: float, k: int,
+                max_radius_km: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Return up to k [(clinic_id, distance_km)], nearest first."""
+        if k <= 0:
+            return []
+        q = _to_xyz(latitude, longitude)
+        limit = _chord_sq(max_radius_km) if max_radius_km is not None else float("inf")
+        heap: List[Tuple[float, int]] = []  # max-heap of (-d2, i)
+
+        def bound() -> float:
+            return -heap[0][0] if len(heap) == k else limit
+
+        def visit(node):
+            if node is None:
+                return
+            i, axis, left, right = node
+            d2 = self._dist_sq(q, i)
+            if d2 <= limit and d2 < bound():
+                if len(heap) == k:
+                    heapq.heapreplace(heap, (-d2, i))
+                else:
+                    heapq.heappush(heap, (-d2, i))
+            diff = q[axis] - self.xyz[i][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if diff * diff < bound():
+                visit(far)
+
+        visit(self.root)
+        return [(self.ids[i], _chord_sq_to_km(-neg)) for neg, i in sorted(heap, reverse=True)]
+
+
+# ---------- per-worker singleton ----------
+_lock = threading.Lock()
+_index: Optional[ClinicSpatialIndex] = None
+_index_version = None
+_index_built_at = 0.0
+
+
+def active_clinics():
+    """Clinics that are publicly listed on the clinic finder."""
+    return Clinic.objects.filter(
+        latitude__isnull=False,
+        longitude__isnull=False,
+        email_confirmed=True,
+        admin_approved=True,
+    )
+
+
+def get_clinic_index() -> ClinicSpatialIndex:
+    """
+    Return this worker's spatial index, rebuilding it when the clinic-set
+    version has changed or it is older than VETS_CLINIC_INDEX_MAX_AGE seconds.
+    """
+    global _index, _index_version, _index_built_at
+
+    version = get_clinic_set_version()
+    max_age = getattr(settings, "VETS_CLINIC_INDEX_MAX_AGE", 300)
+    if _index is not None and _index_version == version and time.monotonic() - _index_built_at < max_age:
+        return _index
+
+    with _lock:
+        if _index is None or _index_version != version or time.monotonic() - _index_built_at >= max_age:
+            points = [
+                (pk, float(lat), float(lng))
+                for pk, lat, lng in active_clinics().values_list("id", "latitude", "longitude")
+            ]
+            _index = ClinicSpatialIndex(points)
+            _index_version = version
+            _index_built_at = time.monotonic()
+        return _index
+
+
+def hydrate_clinics(matches: List[Tuple[int, float]]) -> List[Clinic]:
+    """
+    Fetch matched clinics by primary key, preserving order and setting
+    `clinic.distance`. Rows that stopped being active since the index was
+    built are dropped.
+    """
+    if not matches:
+        return []
+    by_id = active_clinics().in_bulk([pk for pk, _ in matches])
+    clinics = []
+    for pk, distance in matches:
+        clinic = by_id.get(pk)
+        if clinic is not None:
+            clinic.distance = round(distance, 1)
+            clinics.append(clinic)
+    return clinics
@@ -0,0 +1,218 @@
+"""
+Ranked clinic search.
+
+Two backends share one interface, selected by VETS_SEARCH_BACKEND (default:
+FULLTEXT on MySQL, the in-process index everywhere else):
+
+    MySQLFullTextBackend   MATCH ... AGAINST over Clinic.search_document
+                           (name, city, specializations, vet name, bio) plus
+                           a name-only FULLTEXT index for boosting
+    InvertedIndexBackend   per-worker inverted index with field weights,
+                           rebuilt when the clinic-set version changes;
+                           used on SQLite and in tests
+
+Both return (clinic_id, score) pairs, best match first.
+"""
+from __future__ import annotations
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from ..models import Clinic
+from ..utils import normalize_address
+from .clinic_index import get_clinic_set_version
+
+Ranked = List[Tuple[int, float]]
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Relative weight of a term found in each field
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "city": 2.0,
+    "specializations": 2.0,
+    "vet_name": 2.0,
+    "bio": 1.0,
+}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall(normalize_address(text))
+
+
+def build_search_document(clinic: Clinic, vet_name: str = "") -> str:
+    """Text stored in Clinic.search_document for the FULLTEXT index."""
+    parts = (clinic.name, clinic.city, clinic.specializations, vet_name, clinic.bio)
+    return "\n".join(part for part in parts if part)
+
+
+class ClinicSearchBackend:
+    """Interface: rank the clinics of a queryset against a free-text query."""
+
+    def rank(self, queryset, query: str, limit: Optional[int] = None) -> Ranked:
+        raise NotImplementedError
+
+
+class MySQLFullTextBackend(ClinicSearchBackend):
+    """
+    InnoDB FULLTEXT in boolean mode: every term is required and prefix
+    matched (``+term*``). Terms shorter than innodb_ft_min_token_size are
+    dropped, since InnoDB never indexes them.
+    """
+    min_token_size = 3
+
+    def rank(self, queryset, query: str, limit: Optional[int] = None) -> Ranked:
+        terms = [t for t in tokenize(query) if len(t) >= self.min_token_size]
+        if not terms:
+            # Nothing FULLTEXT can match on; keep short queries working
+            matches = queryset.filter(name__istartswith=query.strip()).order_by("name")
+            ids = matches.values_list("id", flat=True)
+            return [(pk, 0.0) for pk in (ids[:limit] if limit else ids)]
+
+        against = " ".join(f"+{term}*" for term in terms)
+        table = connection.ops.quote_name(Clinic._meta.db_table)
+        # Matches in the name count double on top of the whole-document score
+        relevance = RawSQL(
+            f"MATCH({table}.`search_document`) AGAINST (%s IN BOOLEAN MODE)"
+            f" + 2 * MATCH({table}.`name`) AGAINST (%s IN BOOLEAN MODE)",
+            (against, against),
+        )
+        matches = (
+            queryset.annotate(relevance=relevance)
+            .filter(relevance__gt=0)
+            .order_by("-relevance", "name")
+            .values_list("id", "relevance")
+        )
+        if limit:
+            matches = matches[:limit]
+        return [(pk, float(score)) for pk, score in matches]
+
+
+class InvertedIndex:
+    """
+    Immutable token -> {clinic_id: weight} postings with a sorted vocabulary,
+    so a query term is expanded to every token it prefixes with one bisect.
+    A clinic must match every query term; its score sums the field weights of
+    the matched tokens scaled by inverse document frequency.
+    """
+
+    def __init__(self, rows: List[Tuple[int, Dict[str, str]]]):
+        postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        for pk, fields in rows:
+            for field, text in fields.items():
+                weight = FIELD_WEIGHTS.get(field, 1.0)
+                for token in set(tokenize(text)):
+                    postings[token][pk] = postings[token].get(pk, 0.0) + weight
+        self.size = len(rows)
+        self.postings = dict(postings)
+        self.vocabulary = sorted(self.postings)
+
+    def _term_scores(self, term: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        i = bisect_left(self.vocabulary, term)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(term):
+            token = self.vocabulary[i]
+            docs = self.postings[token]
+            idf = math.log(1 + self.size / len(docs))
+            # Whole-word matches rank above prefix matches
+            boost = 1.0 if token == term else 0.5
+            for pk, weight in docs.items():
+                scores[pk] = max(scores.get(pk, 0.0), weight * idf * boost)
+            i += 1
+        return scores
+
+    def search(self, query: str) -> Ranked:
+        scores: Optional[Dict[int, float]] = None
+        for term in dict.fromkeys(tokenize(query)):
+            term_scores = self._term_scores(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {pk: s + term_scores[pk] for pk, s in scores.items() if pk in term_scores}
+            if not scores:
+                return []
+        return sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+
+
+_index: Optional[InvertedIndex] = None
+_index_version = None
+_index_built_at = 0.0
+_lock = threading.Lock()
+
+
+def get_inverted_index() -> InvertedIndex:
+    """This worker's search index over all clinics, rebuilt like get_clinic_index()."""
+    global _index, _index_version, _index_built_at
+
+    version = get_clinic_set_version()
+    max_age = getattr(settings, "VETS_CLINIC_INDEX_MAX_AGE", 300)
+    if _index is not None and _index_version == version and time.monotonic() - _index_built_at < max_age:
+        return _index
+
+    with _lock:
+        if _index is None or _index_version != version or time.monotonic() - _index_built_at >= max_age:
+            rows = [
+                (pk, {"name": name, "city": city, "specializations": specs, "vet_name": vet_name, "bio": bio})
+                for pk, name, city, specs, vet_name, bio in Clinic.objects.values_list(
+                    "id", "name", "city", "specializations", "vet_profile__vet_name", "bio"
+                )
+            ]
+            _index = InvertedIndex(rows)
+            _index_version = version
+            _index_built_at = time.monotonic()
+        return _index
+
+
+class InvertedIndexBackend(ClinicSearchBackend):
+
+    def rank(self, queryset, query: str, limit: Optional[int] = None) -> Ranked:
+        ranked = get_inverted_index().search(query)
+        if not ranked:
+            return []
+        # The index covers every clinic; keep the ones the queryset allows
+        allowed = set(queryset.filter(id__in=[pk for pk, _ in ranked]).values_list("id", flat=True))
+        ranked = [(pk, score) for pk, score in ranked if pk in allowed]
+        return ranked[:limit] if limit else ranked
+
+
+@lru_cache(maxsize=None)
+def get_search_backend() -> ClinicSearchBackend:
+    path = getattr(settings, "VETS_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == "mysql":
+        return MySQLFullTextBackend()
+    return InvertedIndexBackend()
+
+
+def search_clinics(queryset, query: str, limit: Optional[int] = None) -> List[Clinic]:
+    """
+    Clinics of `queryset` matching `query`, most relevant first, each with a
+    `relevance` attribute. `limit` defaults to VETS_SEARCH_MAX_RESULTS.
+    """
+    limit = limit or getattr(settings, "VETS_SEARCH_MAX_RESULTS", 500)
+    ranked = get_search_backend().rank(queryset, query, limit)
+    by_id = queryset.in_bulk([pk for pk, _ in ranked])
+    clinics = []
+    for pk, score in ranked:
+        clinic = by_id.get(pk)
+        if clinic is not None:
+            clinic.relevance = round(score, 3)
+            clinics.append(clinic)
+    return clinics
+
+
+def search_clinic_ids(queryset, query: str) -> List[int]:
+    """Ranked ids only, for callers that already have the rows."""
+    limit = getattr(settings, "VETS_SEARCH_MAX_RESULTS", 500)
+    return [pk for pk, _ in get_search_backend().rank(queryset, query, limit)]
@@ -0,0 +1,51 @@
+"""
+Clinic workflow transitions.
+
+A clinic is verified (public badge) exactly when its email is confirmed and
+an admin approved it, and it receives a default referral code when its email
+becomes confirmed. Clinic.save() applies both for a single clinic inside its
+own transaction; the bulk helpers below do the same for a queryset with
+set-based UPDATEs and one referral-code insert.
+"""
+from __future__ import annotations
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Clinic
+from .clinic_index import bump_clinic_set_version
+from .referrals import create_default_referral_codes
+
+
+def is_verified_state(clinic: Clinic) -> bool:
+    return bool(clinic.email_confirmed and clinic.admin_approved)
+
+
+def apply_saved_transitions(clinic: Clinic, was_email_confirmed: bool) -> None:
+    """Called by Clinic.save() after the row is written, in the same transaction."""
+    if clinic.email_confirmed and not was_email_confirmed:
+        if not clinic.referral_codes.filter(is_active=True).exists():
+            create_default_referral_codes([clinic])
+
+
+def approve_clinics(queryset) -> int:
+    """Admin-approve every clinic of `queryset`; returns the number updated."""
+    with transaction.atomic():
+        ids = list(queryset.values_list("id", flat=True))
+        updated = Clinic.objects.filter(id__in=ids).update(
+            admin_approved=True, is_verified=F("email_confirmed"), updated_at=timezone.now()
+        )
+        create_default_referral_codes(
+            Clinic.objects.filter(id__in=ids, email_confirmed=True).exclude(referral_codes__is_active=True)
+        )
+    bump_clinic_set_version()
+    return updated
+
+
+def disapprove_clinics(queryset) -> int:
+    """Withdraw admin approval (and with it verification) from `queryset`."""
+    updated = queryset.update(admin_approved=False, is_verified=False, updated_at=timezone.now())
+    # queryset.update() skips post_save, so invalidate clinic indexes here
+    bump_clinic_set_version()
+    return updated
@@ -0,0 +1,78 @@
+from __future__ import annotations
+from typing import List, Tuple
+
+import numpy as np
+
+from userapp.models import Profile
+
+from ..utils import EARTH_RADIUS_KM
+
+
+def haversine_many(latitude: float, longitude: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """
+    Vectorized great-circle distance (km) from one point to arrays of points
+    given in decimal degrees.
+    """
+    lat1, lng1 = np.radians(latitude), np.radians(longitude)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def consenting_profiles():
+    """Profiles that allowed us to store their location and have coordinates."""
+    return Profile.objects.filter(
+        location_consent=True,
+        latitude__isnull=False,
+        longitude__isnull=False,
+    )
+
+
+def profile_distances_within_radius(latitude: float, longitude: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute distances to every consenting profile in one vectorized pass.
+
+    Only (id, latitude, longitude) are fetched from the database; no model
+    instances are built. Returns (ids, distances_km) for profiles inside the
+    radius, nearest first.
+    """
+    rows = list(consenting_profiles().values_list("id", "latitude", "longitude"))
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    lats = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+    lngs = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+
+    distances = haversine_many(latitude, longitude, lats, lngs)
+    inside = distances <= radius_km
+    ids, distances = ids[inside], distances[inside]
+    order = np.argsort(distances, kind="stable")
+    return ids[order], distances[order]
+
+
+def profiles_within_radius(latitude: float, longitude: float, radius_km: float) -> List[dict]:
+    """
+    Return report rows for consenting users within radius_km, nearest first.
+    Only the profiles inside the radius are loaded (with their user).
+    """
+    ids, distances = profile_distances_within_radius(latitude, longitude, radius_km)
+    if not len(ids):
+        return []
+
+    profiles = consenting_profiles().select_related("user").in_bulk(ids.tolist())
+    users = []
+    for pk, dist in zip(ids.tolist(), distances.tolist()):
+        prof = profiles.get(pk)
+        if prof is None:
+            continue
+        users.append({
+            "profile": prof,
+            "email": getattr(prof.user, "email", ""),
+            "first_name": prof.first_name,
+            "last_name": prof.last_name,
+            "city": prof.city,
+            "distance_km": round(dist, 1),
+            "location_updated_at": prof.location_updated_at,
+        })
+    return users
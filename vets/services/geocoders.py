@@ -0,0 +1,191 @@
+"""
+Geocoder backends used by vets.utils.geocode_address.
+
+Two roles are configured in settings:
+    GEOCODER_BACKEND       street-level lookups (default: Nominatim)
+    CITY_GEOCODER_BACKEND  city-level lookups (default: offline gazetteer)
+
+Pointing both at GazetteerBackend makes geocoding fully offline and
+deterministic, which is what tests and local development should use.
+Until the gazetteer file exists (vets.W001), city lookups fall back to the
+street backend; see get_city_geocoder().
+"""
+from __future__ import annotations
+import csv
+import logging
+from array import array
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from ..utils import normalize_address
+
+logger = logging.getLogger(__name__)
+
+Coords = Tuple[float, float]
+
+
+class GeocoderBackend:
+    """Interface: turn an address and/or city into (latitude, longitude)."""
+
+    #: "street" or "city"; informational, used in logs and the admin
+    precision = "street"
+
+    def geocode(self, address: str, city: Optional[str] = None) -> Optional[Coords]:
+        raise NotImplementedError
+
+
+class NominatimBackend(GeocoderBackend):
+    """
+    OpenStreetMap Nominatim. Service errors (timeouts, 5xx) propagate so the
+    caller can decide not to cache them.
+
+    Every outbound request takes a token from the host-wide rate limiter
+    first, so the 1 req/s policy holds however many lookups one geocode
+    needs and however many processes run them.
+    """
+    precision = "street"
+
+    def __init__(self, user_agent: str = "fammo_veterinary_app", timeout: int = 10, limiter=None):
+        from geopy.geocoders import Nominatim
+        from .geocoding import get_nominatim_rate_limiter
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+        self.limiter = limiter or get_nominatim_rate_limiter()
+
+    def geocode(self, address: str, city: Optional[str] = None) -> Optional[Coords]:
+        # Build full address
+        full_address = f"{address}, {city}" if address and city else (address or city)
+        if not full_address:
+            return None
+        self.limiter.acquire()
+        location = self.geolocator.geocode(full_address)
+        if location:
+            return (location.latitude, location.longitude)
+        return None
+
+
+class GazetteerBackend(GeocoderBackend):
+    """
+    Offline city lookup backed by a local gazetteer file.
+
+    The file is CSV or TSV with a header row containing at least
+    ``name, country, latitude, longitude, population`` (``lat``/``lng`` are
+    accepted as well). Coordinates and populations are kept in flat
+    ``array('d')``/``array('q')`` columns and a dict maps normalized
+    ``name`` and ``name|country`` keys to the most populous matching row,
+    so a lookup is one hash probe.
+
+    ``city`` may carry a country suffix, e.g. "Utrecht, NL", which is
+    matched against the country column as written (code or name).
+
+    A missing, unreadable or empty file raises ImproperlyConfigured; create
+    it with ``python manage.py fetch_gazetteer``.
+    """
+    precision = "city"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or getattr(settings, "GAZETTEER_FILE", None)
+        self.lats = array("d")
+        self.lngs = array("d")
+        self.populations = array("q")
+        self.index: Dict[str, int] = {}
+        if not self.path:
+            raise ImproperlyConfigured("GazetteerBackend needs GAZETTEER_FILE to be set")
+        self._load(self.path)
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def _load(self, path: str) -> None:
+        try:
+            with open(path, newline="", encoding="utf-8") as fh:
+                sample = fh.read(4096)
+                fh.seek(0)
+                header = sample.splitlines()[0] if sample else ""
+                dialect = csv.excel_tab if "\t" in header else csv.excel
+                for row in csv.DictReader(fh, dialect=dialect):
+                    self._add(row)
+        except OSError as e:
+            raise ImproperlyConfigured(
+                f"Gazetteer file not available ({path}): {e}. Run `python manage.py fetch_gazetteer`."
+            ) from e
+        if not len(self):
+            raise ImproperlyConfigured(f"Gazetteer file {path} has no usable rows")
+        logger.info(f"Loaded {len(self)} gazetteer entries from {path}")
+
+    def _add(self, row: dict) -> None:
+        try:
+            name = normalize_address(row["name"])
+            lat = float(row.get("latitude") or row["lat"])
+            lng = float(row.get("longitude") or row["lng"])
+            population = int(float(row.get("population") or 0))
+        except (KeyError, TypeError, ValueError):
+            return
+        if not name:
+            return
+
+        pos = len(self.lats)
+        self.lats.append(lat)
+        self.lngs.append(lng)
+        self.populations.append(population)
+
+        country = normalize_address(row.get("country"))
+        keys = [name, f"{name}|{country}"] if country else [name]
+        for key in keys:
+            current = self.index.get(key)
+            # Prefer the most populous city for ambiguous names
+            if current is None or self.populations[current] < population:
+                self.index[key] = pos
+
+    def lookup(self, city: str) -> Optional[Coords]:
+        parts = [p for p in (normalize_address(x) for x in city.split(",")) if p]
+        if not parts:
+            return None
+        pos = self.index.get(f"{parts[0]}|{parts[-1]}") if len(parts) > 1 else None
+        if pos is None:
+            pos = self.index.get(parts[0])
+        if pos is None:
+            return None
+        return (self.lats[pos], self.lngs[pos])
+
+    def geocode(self, address: str, city: Optional[str] = None) -> Optional[Coords]:
+        return self.lookup(city or address or "")
+
+
+def uses_gazetteer() -> bool:
+    """True when either geocoder role is configured to use GazetteerBackend."""
+    configured = {
+        getattr(settings, "CITY_GEOCODER_BACKEND", "vets.services.geocoders.GazetteerBackend"),
+        getattr(settings, "GEOCODER_BACKEND", "vets.services.geocoders.NominatimBackend"),
+    }
+    return any(issubclass(import_string(path), GazetteerBackend) for path in configured)
+
+
+@lru_cache(maxsize=None)
+def get_geocoder(role: str = "street") -> GeocoderBackend:
+    """
+    Return the process-wide backend instance for a role ("street" or "city").
+    Backends are built once per worker; the gazetteer is loaded on first use.
+    """
+    if role == "city":
+        path = getattr(settings, "CITY_GEOCODER_BACKEND", "vets.services.geocoders.GazetteerBackend")
+    else:
+        path = getattr(settings, "GEOCODER_BACKEND", "vets.services.geocoders.NominatimBackend")
+    return import_string(path)()
+
+
+@lru_cache(maxsize=None)
+def get_city_geocoder() -> Optional[GeocoderBackend]:
+    """
+    The city backend, or None while it is not usable (typically no gazetteer
+    file yet). Callers then fall back to the street backend or the queue
+    instead of failing the save; the vets.W001 check reports the cause.
+    """
+    try:
+        return get_geocoder("city")
+    except ImproperlyConfigured as e:
+        logger.warning(f"City geocoder unavailable, using the street geocoder instead: {e}")
+        return None
@@ -0,0 +1,302 @@
+from __future__ import annotations
+import logging
+import os
+import struct
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from ..models import Clinic, GeocodeStatus
+from ..utils import geocode_address, get_cached_geocode
+from .clinic_index import bump_clinic_set_version
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- cross-process rate limiting ----------
+@contextmanager
+def _locked_file(path: str):
+    """Open `path` holding an exclusive OS-level lock for the duration of the block."""
+    with open(path, "a+b") as fh:
+        if fcntl:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield fh
+        finally:
+            if fcntl:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileTokenBucket:
+    """
+    Token-bucket rate limiter shared by every process and thread on the host.
+    The bucket state (tokens, last refill time) lives in a small file guarded
+    by an OS file lock, so concurrent workers and cron jobs draw from the same
+    budget. `rate` is tokens per second, `capacity` the allowed burst.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: float = 1.0):
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity
+
+    def acquire(self) -> None:
+        """Block until a token is available and consume it."""
+        with _locked_file(self.path) as fh:
+            fh.seek(0)
+            raw = fh.read(16)
+            now = time.time()
+            if len(raw) == 16:
+                tokens, updated = struct.unpack("dd", raw)
+                tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            else:
+                tokens = self.capacity
+            if tokens < 1:
+                # Sleep while holding the lock so waiters queue up in order
+                time.sleep((1 - tokens) / self.rate)
+                now = time.time()
+                tokens = 1.0
+            fh.seek(0)
+            fh.truncate()
+            fh.write(struct.pack("dd", tokens - 1, now))
+            fh.flush()
+
+
+def get_nominatim_rate_limiter() -> FileTokenBucket:
+    """Nominatim's usage policy allows at most one request per second per application."""
+    path = getattr(
+        settings,
+        "GEOCODE_RATE_LIMIT_FILE",
+        os.path.join(tempfile.gettempdir(), "fammo_nominatim.ratelimit"),
+    )
+    return FileTokenBucket(
+        path,
+        rate=1 / getattr(settings, "GEOCODE_MIN_INTERVAL", 1.1),
+        capacity=getattr(settings, "GEOCODE_RATE_BURST", 1),
+    )
+
+
+# ---------- deferred geocoding queue ----------
+@dataclass
+class QueueResult:
+    done: int = 0
+    failed: int = 0
+    cached: int = 0
+
+
+def process_pending_geocodes(limit: int = 50) -> QueueResult:
+    """
+    Resolve coordinates for clinics whose save() marked them PENDING.
+    Cached results are applied without touching the geocoder; Nominatim
+    requests wait on the shared rate limiter inside NominatimBackend.
+    """
+    result = QueueResult()
+
+    pending = Clinic.objects.filter(geocode_status=GeocodeStatus.PENDING).order_by("id")[:limit]
+    for clinic in pending:
+        cached = get_cached_geocode(clinic.address, clinic.city)
+        if cached:
+            coords = cached.coords
+            result.cached += 1
+        else:
+            coords = geocode_address(clinic.address, clinic.city, use_cache=False)
+
+        if coords:
+            lat, lng = round(coords[0], 6), round(coords[1], 6)
+            updates = {"latitude": lat, "longitude": lng, "geocode_status": GeocodeStatus.DONE}
+            result.done += 1
+            logger.info(f"Geocoded {clinic.name}: {lat}, {lng}")
+        else:
+            updates = {"geocode_status": GeocodeStatus.FAILED}
+            result.failed += 1
+            logger.info(f"Could not geocode {clinic.name}")
+
+        # update() keeps this out of Clinic.save() and its signals
+        Clinic.objects.filter(pk=clinic.pk, geocode_status=GeocodeStatus.PENDING).update(
+            updated_at=timezone.now(), **updates
+        )
+
+    if result.done:
+        bump_clinic_set_version()
+    return result
+
+
+# ---------- bulk geocoding pipeline ----------
+class FileCheckpoint:
+    """Remembers the last clinic id a pipeline run has fully written."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> int:
+        try:
+            with open(self.path) as fh:
+                return int(fh.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def save(self, last_id: int) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as fh:
+            fh.write(str(last_id))
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+@dataclass
+class PipelineStats:
+    total: int = 0
+    processed: int = 0
+    success: int = 0
+    failed: int = 0
+    skipped: int = 0
+    cached: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def rate(self) -> float:
+        """Clinics processed per second."""
+        elapsed = time.monotonic() - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        remaining = max(self.total - self.processed, 0)
+        return remaining / self.rate if self.rate else None
+
+
+def _nominatim_lookup(address: str, city: str) -> Optional[Tuple[float, float]]:
+    return geocode_address(address, city, use_cache=False)
+
+
+class ClinicGeocodePipeline:
+    """
+    Streams clinics in id order (keyset batches), geocodes them with up to
+    `workers` threads, writes each batch with one bulk_update and then
+    advances the checkpoint, so an interrupted run can resume after the last
+    written id.
+
+    `geocoder` is any callable (address, city) -> (lat, lng) | None; tests
+    pass a local stand-in instead of Nominatim. The default goes through
+    NominatimBackend, which rate-limits each request itself; `limiter` only
+    throttles geocoders that do not.
+    """
+
+    def __init__(
+        self,
+        queryset,
+        geocoder: Callable[[str, str], Optional[Tuple[float, float]]] = _nominatim_lookup,
+        limiter: Optional[FileTokenBucket] = None,
+        checkpoint: Optional[FileCheckpoint] = None,
+        batch_size: int = 100,
+        workers: int = 1,
+        use_cache: bool = True,
+        on_batch: Optional[Callable[[PipelineStats], None]] = None,
+    ):
+        self.queryset = queryset.order_by("id")
+        self.geocoder = geocoder
+        self.limiter = limiter
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self.use_cache = use_cache
+        self.on_batch = on_batch
+
+    def run(self, start_after: int = 0, limit: Optional[int] = None) -> PipelineStats:
+        queryset = self.queryset.filter(id__gt=start_after)
+        total = queryset.count()
+        stats = PipelineStats(total=total if limit is None else min(limit, total))
+        last_id = start_after
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while stats.processed < stats.total:
+                size = min(self.batch_size, stats.total - stats.processed)
+                batch = list(
+                    queryset.filter(id__gt=last_id).only(
+                        "id", "name", "address", "city",
+                        "latitude", "longitude", "geocode_status", "updated_at",
+                    )[:size]
+                )
+                if not batch:
+                    break
+
+                results = list(executor.map(self._resolve, batch))
+                self._write(batch, results, stats)
+
+                last_id = batch[-1].id
+                if self.checkpoint:
+                    self.checkpoint.save(last_id)
+                if self.on_batch:
+                    self.on_batch(stats)
+
+        return stats
+
+    def _resolve(self, clinic: Clinic):
+        """Return (coords, from_cache) or None when the clinic has no address."""
+        if not clinic.address and not clinic.city:
+            return None
+        try:
+            if self.use_cache:
+                cached = get_cached_geocode(clinic.address, clinic.city)
+                if cached:
+                    return cached.coords, True
+            if self.limiter:
+                self.limiter.acquire()
+            return self.geocoder(clinic.address, clinic.city), False
+        except Exception as e:
+            logger.warning(f"Geocoding failed for {clinic.name}: {e}")
+            return None, False
+        finally:
+            # Worker threads get their own DB connections; don't leak them
+            connections.close_all()
+
+    def _write(self, batch: List[Clinic], results, stats: PipelineStats) -> None:
+        now = timezone.now()
+        changed = []
+        for clinic, result in zip(batch, results):
+            stats.processed += 1
+            if result is None:
+                stats.skipped += 1
+                continue
+            coords, from_cache = result
+            stats.cached += from_cache
+            if coords:
+                clinic.latitude, clinic.longitude = round(coords[0], 6), round(coords[1], 6)
+                clinic.geocode_status = GeocodeStatus.DONE
+                stats.success += 1
+            else:
+                clinic.geocode_status = GeocodeStatus.FAILED
+                stats.failed += 1
+            clinic.updated_at = now
+            changed.append(clinic)
+
+        if changed:
+            Clinic.objects.bulk_update(
+                changed, ["latitude", "longitude", "geocode_status", "updated_at"]
+            )
+            # bulk_update skips post_save, so invalidate clinic indexes here
+            bump_clinic_set_version()
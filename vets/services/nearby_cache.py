@@ -0,0 +1,196 @@
+from __future__ import annotations
+import base64
+import heapq
+from dataclasses import dataclass
+from math import floor
+from typing import List, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from ..models import Clinic
+from ..utils import bounding_box_q, haversine_distance
+from .clinic_index import active_clinics, get_clinic_index, get_clinic_set_version
+
+HITS_KEY = "vets:nearby_cache:hits"
+MISSES_KEY = "vets:nearby_cache:misses"
+
+DEFAULT_RADIUS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Columns fetched with values() for the clinic finder payload
+VALUE_FIELDS = (
+    'id', 'name', 'slug', 'city', 'address', 'phone', 'email', 'website',
+    'working_hours', 'specializations', 'latitude', 'longitude', 'is_verified', 'logo',
+)
+# Fields a client may request with ?fields=; id and distance are always returned
+PUBLIC_FIELDS = frozenset(VALUE_FIELDS) | {'distance'}
+
+
+def serialize_clinic(clinic: Clinic) -> dict:
+    """Public JSON representation of a clinic for the clinic finder APIs."""
+    return {
+        'id': clinic.id,
+        'name': clinic.name,
+        'slug': clinic.slug,
+        'city': clinic.city,
+        'address': clinic.address,
+        'phone': clinic.phone,
+        'email': clinic.email,
+        'website': clinic.website,
+        'working_hours': clinic.working_hours,
+        'specializations': clinic.specializations,
+        'latitude': float(clinic.latitude) if clinic.latitude is not None else None,
+        'longitude': float(clinic.longitude) if clinic.longitude is not None else None,
+        'is_verified': clinic.is_verified,
+        'logo': clinic.logo.url if clinic.logo else None,
+    }
+
+
+def _radius_bucket(radius_km: float) -> float:
+    """Round the radius up to a bucket so nearby requests share cache entries."""
+    buckets = getattr(settings, "VETS_NEARBY_RADIUS_BUCKETS", DEFAULT_RADIUS_BUCKETS)
+    for bucket in buckets:
+        if radius_km <= bucket:
+            return bucket
+    return float(floor(radius_km) + 1)
+
+
+def _cell(latitude: float, longitude: float, cell_deg: float) -> Tuple[int, int, float, float, float]:
+    """
+    Quantize a point to its grid cell. Returns (row, col, center_lat,
+    center_lng, margin_km) where margin_km is the farthest distance from the
+    cell center to any point of the cell.
+    """
+    row, col = floor(latitude / cell_deg), floor(longitude / cell_deg)
+    center_lat = (row + 0.5) * cell_deg
+    center_lng = (col + 0.5) * cell_deg
+    half = cell_deg / 2
+    margin_km = max(
+        haversine_distance(center_lat, center_lng, center_lat + half, center_lng + half),
+        haversine_distance(center_lat, center_lng, center_lat - half, center_lng + half),
+    )
+    return row, col, center_lat, center_lng, margin_km
+
+
+def _record(hit: bool) -> None:
+    key = HITS_KEY if hit else MISSES_KEY
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_nearby_cache_stats() -> dict:
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 3) if total else None,
+    }
+
+
+def serialize_clinic_values(row: dict) -> dict:
+    """Same payload as serialize_clinic, built from a values() row."""
+    data = dict(row)
+    for key in ('latitude', 'longitude'):
+        data[key] = float(data[key]) if data[key] is not None else None
+    data['logo'] = default_storage.url(data['logo']) if data['logo'] else None
+    return data
+
+
+def _candidate_rows(latitude: float, longitude: float, radius_km: float) -> List[dict]:
+    """Serialized active clinics within radius_km, fetched with values() (no model instances)."""
+    if getattr(settings, "VETS_CLINIC_INDEX_ENABLED", True):
+        ids = [pk for pk, _ in get_clinic_index().within_radius(latitude, longitude, radius_km)]
+        queryset = active_clinics().filter(id__in=ids) if ids else None
+    else:
+        queryset = active_clinics().filter(bounding_box_q(latitude, longitude, radius_km))
+    if queryset is None:
+        return []
+    rows = [serialize_clinic_values(row) for row in queryset.values(*VALUE_FIELDS)]
+    return [
+        row for row in rows
+        if haversine_distance(latitude, longitude, row['latitude'], row['longitude']) <= radius_km
+    ]
+
+
+def encode_cursor(distance: float, clinic_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{distance!r}:{clinic_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        distance, clinic_id = raw.split(":")
+        return float(distance), int(clinic_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+@dataclass
+class NearbyResult:
+    clinics: List[dict]
+    cached: bool
+    next_cursor: Optional[str] = None
+
+
+def get_nearby_clinics_data(latitude: float, longitude: float, radius_km: float,
+                            limit: Optional[int] = None, cursor: Optional[str] = None,
+                            fields: Optional[Sequence[str]] = None,
+                            clinic_ids: Optional[Set[int]] = None) -> NearbyResult:
+    """
+    Serialized clinics within radius_km of the point, nearest first.
+
+    The cache holds the candidate set for the point's grid cell and radius
+    bucket (every clinic that could be in range from anywhere in the cell),
+    keyed by the clinic-set version so any Clinic change invalidates it.
+    Exact distances are recomputed for each request.
+
+    With `limit`, only the `limit` nearest clinics after `cursor` are
+    selected (heap-based, no full sort) and `next_cursor` points at the
+    following page. `fields` restricts each item to those keys (plus id and
+    distance). `clinic_ids` keeps only those clinics (e.g. search matches).
+    """
+    cell_deg = getattr(settings, "VETS_NEARBY_CACHE_CELL_DEG", 0.05)
+    bucket = _radius_bucket(radius_km)
+    row, col, center_lat, center_lng, margin_km = _cell(latitude, longitude, cell_deg)
+    key = f"vets:nearby:{get_clinic_set_version()}:{cell_deg}:{row}:{col}:{bucket}"
+
+    candidates = cache.get(key)
+    hit = candidates is not None
+    _record(hit)
+    if not hit:
+        candidates = _candidate_rows(center_lat, center_lng, bucket + margin_km)
+        cache.set(key, candidates, timeout=getattr(settings, "VETS_NEARBY_CACHE_TIMEOUT", 600))
+
+    after = decode_cursor(cursor) if cursor else None
+    in_range = []
+    for item in candidates:
+        if clinic_ids is not None and item['id'] not in clinic_ids:
+            continue
+        distance = haversine_distance(latitude, longitude, item['latitude'], item['longitude'])
+        if distance <= radius_km and (after is None or (distance, item['id']) > after):
+            in_range.append((distance, item['id'], item))
+
+    if limit is None:
+        selected = sorted(in_range, key=lambda x: (x[0], x[1]))
+        next_cursor = None
+    else:
+        selected = heapq.nsmallest(limit + 1, in_range, key=lambda x: (x[0], x[1]))
+        next_cursor = None
+        if len(selected) > limit:
+            selected = selected[:limit]
+            next_cursor = encode_cursor(selected[-1][0], selected[-1][1])
+
+    keys = None if not fields else {'id', 'distance', *fields}
+    clinics = []
+    for distance, _, item in selected:
+        data = {**item, 'distance': round(distance, 1)}
+        if keys is not None:
+            data = {k: v for k, v in data.items() if k in keys}
+        clinics.append(data)
+    return NearbyResult(clinics=clinics, cached=hit, next_cursor=next_cursor)
@@ -0,0 +1,97 @@
+"""
+Keyset pagination over (name, id) for the public clinic directory.
+
+Pages are selected with WHERE (name, id) > cursor ORDER BY name, id LIMIT n,
+so deep pages cost the same as the first one and a page does not shift when
+clinics are added or removed before it.
+"""
+from __future__ import annotations
+import base64
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+def encode_cursor(name: str, pk: int) -> str:
+    raw = json.dumps([name, pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        name, pk = json.loads(raw)
+        return str(name), int(pk)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+@dataclass
+class KeysetPage:
+    object_list: List = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+def keyset_paginate(queryset, per_page: int, after: Optional[str] = None,
+                    before: Optional[str] = None) -> KeysetPage:
+    """
+    One page of `queryset` ordered by (name, id): the first page, the page
+    after cursor `after`, or the page before cursor `before`. Fetches
+    per_page + 1 rows to know whether another page follows.
+    """
+    if before:
+        name, pk = decode_cursor(before)
+        rows = list(
+            queryset.filter(Q(name__lt=name) | Q(name=name, id__lt=pk)).order_by("-name", "-id")[:per_page + 1]
+        )
+        more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return KeysetPage(
+            object_list=rows,
+            next_cursor=encode_cursor(rows[-1].name, rows[-1].id) if rows else before,
+            previous_cursor=encode_cursor(rows[0].name, rows[0].id) if more else None,
+        )
+
+    if after:
+        name, pk = decode_cursor(after)
+        queryset = queryset.filter(Q(name__gt=name) | Q(name=name, id__gt=pk))
+    rows = list(queryset.order_by("name", "id")[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    return KeysetPage(
+        object_list=rows,
+        next_cursor=encode_cursor(rows[-1].name, rows[-1].id) if more else None,
+        previous_cursor=encode_cursor(rows[0].name, rows[0].id) if after and rows else None,
+    )
+
+
+class CountedPaginator(Paginator):
+    """Paginator that reuses a count the caller already has instead of running COUNT(*) again."""
+
+    def __init__(self, object_list, per_page, count: int, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._known_count = count
+
+    @property
+    def count(self) -> int:
+        return self._known_count
@@ -0,0 +1,232 @@
+"""
+Daily referral rollups (ReferralDailyStats).
+
+rollup_referral_stats() first folds the ReferralVisit log into the visit
+counters (compact_referral_visits), then looks at the ReferredUser rows
+changed since the stored watermark, collects the days they touch
+(created_at and activated_at, both set once) and recounts signups and
+activations for exactly those days from grouped queries, which gives the
+same counters as a --full rebuild. The recount ends by moving the watermark to the time it started, so
+rows written during a run are picked up by the next one.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from ..models import (
+    ReferralCode, ReferralDailyStats, ReferralVisit, ReferredUser, RollupWatermark
+)
+
+WATERMARK_NAME = "referral_daily_stats"
+
+Key = Tuple[int, Optional[int], date]
+
+
+@dataclass
+class RollupResult:
+    days: int = 0
+    rows: int = 0
+    visits: int = 0
+    watermark: Optional[datetime] = None
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _in_days(field: str, days: Set[date]) -> Q:
+    """Range predicates (index friendly) covering every day in `days`."""
+    q = Q()
+    for day in days:
+        start, end = _day_bounds(day)
+        q |= Q(**{f"{field}__gte": start, f"{field}__lt": end})
+    return q
+
+
+def _changed_days(since: Optional[datetime]) -> Set[date]:
+    changed = ReferredUser.objects.all()
+    if since is not None:
+        changed = changed.filter(updated_at__gte=since)
+    days = set()
+    for field in ("created_at", "activated_at"):
+        days.update(
+            changed.annotate(day=TruncDate(field)).values_list("day", flat=True).distinct().order_by()
+        )
+    days.discard(None)
+    return days
+
+
+def _locked_rows(days: Set[date]) -> Dict[Key, ReferralDailyStats]:
+    rows = ReferralDailyStats.objects.select_for_update().filter(day__in=days)
+    return {(row.clinic_id, row.referral_code_id, row.day): row for row in rows}
+
+
+def _rebuild_days(days: Set[date]) -> int:
+    """Recount signups and activations for `days`; visits are left as folded in."""
+    counters: Dict[Key, Dict[str, int]] = defaultdict(lambda: {"signups": 0, "activations": 0})
+
+    signups = (
+        ReferredUser.objects.filter(_in_days("created_at", days), user__isnull=False)
+        .annotate(day=TruncDate("created_at"))
+        .values("clinic_id", "referral_code_id", "day")
+        .annotate(signups=Count("id"))
+        .order_by()
+    )
+    for row in signups:
+        counters[(row["clinic_id"], row["referral_code_id"], row["day"])]["signups"] = row["signups"]
+
+    activations = (
+        ReferredUser.objects.filter(_in_days("activated_at", days))
+        .annotate(day=TruncDate("activated_at"))
+        .values("clinic_id", "referral_code_id", "day")
+        .annotate(activations=Count("id"))
+        .order_by()
+    )
+    for row in activations:
+        counters[(row["clinic_id"], row["referral_code_id"], row["day"])]["activations"] = row["activations"]
+
+    existing = _locked_rows(days)
+    for key, row in existing.items():
+        values = counters.pop(key, {"signups": 0, "activations": 0})
+        row.signups, row.activations = values["signups"], values["activations"]
+    ReferralDailyStats.objects.bulk_update(existing.values(), ["signups", "activations"], batch_size=1000)
+    ReferralDailyStats.objects.bulk_create(
+        [
+            ReferralDailyStats(clinic_id=clinic_id, referral_code_id=code_id, day=day, **values)
+            for (clinic_id, code_id, day), values in counters.items()
+        ],
+        batch_size=1000,
+    )
+    ReferralDailyStats.objects.filter(day__in=days, visits=0, signups=0, activations=0).delete()
+    return len(existing) + len(counters)
+
+
+def compact_referral_visits(batch_size: int = 5000) -> int:
+    """
+    Fold ReferralVisit rows into ReferralDailyStats.visits and delete them,
+    one batch per transaction. Only rows that were read are deleted, so
+    visits flushed while this runs are left for the next run. Returns the
+    number of visits folded.
+    """
+    folded = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                ReferralVisit.objects.order_by("id")
+                .values_list("id", "clinic_id", "referral_code_id", "created_at")[:batch_size]
+            )
+            if not batch:
+                return folded
+
+            counts: Dict[Key, int] = defaultdict(int)
+            for _, clinic_id, code_id, created_at in batch:
+                counts[(clinic_id, code_id, timezone.localdate(created_at))] += 1
+
+            existing = _locked_rows({day for _, _, day in counts})
+            created = []
+            for key, visits in counts.items():
+                if key in existing:
+                    existing[key].visits += visits
+                else:
+                    clinic_id, code_id, day = key
+                    created.append(
+                        ReferralDailyStats(clinic_id=clinic_id, referral_code_id=code_id, day=day, visits=visits)
+                    )
+            ReferralDailyStats.objects.bulk_update(
+                [existing[key] for key in counts if key in existing], ["visits"], batch_size=1000
+            )
+            ReferralDailyStats.objects.bulk_create(created, batch_size=1000)
+            ReferralVisit.objects.filter(id__in=[pk for pk, _, _, _ in batch]).delete()
+        folded += len(batch)
+
+
+def rollup_referral_stats(full: bool = False) -> RollupResult:
+    """
+    Fold pending visits, then bring signups and activations up to date;
+    `full` ignores the watermark and recounts every day.
+    """
+    visits = compact_referral_visits()
+    started_at = timezone.now()
+    with transaction.atomic():
+        watermark = RollupWatermark.objects.select_for_update().filter(name=WATERMARK_NAME).first()
+        since = None if full or watermark is None else watermark.position
+
+        days = _changed_days(since)
+        if full:
+            # Also zero days whose referrals have since been deleted
+            days.update(ReferralDailyStats.objects.values_list("day", flat=True).distinct().order_by())
+        rows = _rebuild_days(days) if days else 0
+
+        RollupWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={"position": started_at})
+    return RollupResult(days=len(days), rows=rows, visits=visits, watermark=started_at)
+
+
+def get_rollup_watermark() -> Optional[datetime]:
+    return RollupWatermark.objects.filter(name=WATERMARK_NAME).values_list("position", flat=True).first()
+
+
+# ---------- readers ----------
+def window_totals(clinic, days: Tuple[int, ...] = (7, 30)) -> Dict[int, Dict[str, int]]:
+    """
+    Visits, signups and activations over the last N days (today included),
+    for each N in `days`, from one aggregate query.
+    """
+    today = timezone.localdate()
+    aggregates = {}
+    for n in days:
+        since = today - timedelta(days=n - 1)
+        for field in ("visits", "signups", "activations"):
+            aggregates[f"{field}_{n}"] = Coalesce(Sum(field, filter=Q(day__gte=since)), 0)
+    totals = ReferralDailyStats.objects.filter(clinic=clinic).aggregate(**aggregates)
+    return {
+        n: {field: totals[f"{field}_{n}"] for field in ("visits", "signups", "activations")}
+        for n in days
+    }
+
+
+def code_performance(clinic) -> List[dict]:
+    """Per referral code totals, best first, from one grouped query."""
+    return list(
+        ReferralCode.objects.filter(clinic=clinic)
+        .annotate(
+            visits=Coalesce(Sum("daily_stats__visits"), 0),
+            signups=Coalesce(Sum("daily_stats__signups"), 0),
+            activations=Coalesce(Sum("daily_stats__activations"), 0),
+        )
+        .order_by("-visits", "code")
+        .values("code", "is_active", "visits", "signups", "activations")
+    )
+
+
+def daily_series(clinic, days: int = 30, code: Optional[str] = None) -> List[dict]:
+    """One point per day for the last `days` days, zero-filled, oldest first."""
+    today = timezone.localdate()
+    since = today - timedelta(days=days - 1)
+    rows = ReferralDailyStats.objects.filter(clinic=clinic, day__gte=since)
+    if code:
+        rows = rows.filter(referral_code__code=code)
+    by_day = {
+        row["day"]: row
+        for row in rows.values("day").annotate(
+            visits=Sum("visits"), signups=Sum("signups"), activations=Sum("activations")
+        ).order_by()
+    }
+    series = []
+    for offset in range(days):
+        day = since + timedelta(days=offset)
+        row = by_day.get(day, {})
+        series.append({
+            "day": day.isoformat(),
+            "visits": row.get("visits", 0),
+            "signups": row.get("signups", 0),
+            "activations": row.get("activations", 0),
+        })
+    return series
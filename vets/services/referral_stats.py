@@ -0,0 +1,118 @@
+"""
+Maintenance of ClinicReferralStats.
+
+Every ReferredUser insert, status change, clinic change or delete adjusts
+the counters with a single UPDATE ... SET x = x + 1 inside the caller's
+transaction, so concurrent signups never lose increments. Bulk changes
+(queryset.update) bypass signals; callers recompute the affected clinics.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, Optional
+
+from django.db.models import Count, F, Q
+
+from ..models import Clinic, ClinicReferralStats, ReferralStatus, ReferredUser
+from ..utils import upsert_unique_fields
+
+STATUS_FIELDS = {
+    ReferralStatus.NEW: "new_referrals",
+    ReferralStatus.ACTIVE: "active_referrals",
+    ReferralStatus.INACTIVE: "inactive_referrals",
+}
+
+
+def _apply(clinic_id: int, deltas: Dict[str, int], rebuild_missing: bool = True) -> None:
+    """Add the per-field `deltas` to the clinic's row in one UPDATE."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = ClinicReferralStats.objects.filter(clinic_id=clinic_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated and rebuild_missing:
+        # No row yet: count from scratch, which already includes this change
+        recompute_referral_stats([clinic_id])
+
+
+def _deltas(status: str, sign: int, count_total: bool = True) -> Dict[str, int]:
+    deltas = {"total_referrals": sign} if count_total else {}
+    field = STATUS_FIELDS.get(status)
+    if field:
+        deltas[field] = deltas.get(field, 0) + sign
+    return deltas
+
+
+def record_saved(referred: ReferredUser, created: bool) -> None:
+    """Apply the counter changes for a saved ReferredUser (called from post_save)."""
+    old_clinic, old_status = getattr(referred, "_stats_snapshot", (None, None))
+    if created or old_clinic is None:
+        _apply(referred.clinic_id, _deltas(referred.status, +1))
+    elif old_clinic != referred.clinic_id:
+        _apply(old_clinic, _deltas(old_status, -1))
+        _apply(referred.clinic_id, _deltas(referred.status, +1))
+    elif old_status != referred.status:
+        deltas = _deltas(old_status, -1, count_total=False)
+        for field, delta in _deltas(referred.status, +1, count_total=False).items():
+            deltas[field] = deltas.get(field, 0) + delta
+        _apply(referred.clinic_id, deltas)
+    referred._stats_snapshot = (referred.clinic_id, referred.status)
+
+
+def record_deleted(referred: ReferredUser) -> None:
+    """
+    Called from post_delete. A missing row is left missing (it is rebuilt on
+    first read), which also keeps clinic cascades from recreating it.
+    """
+    old_clinic, old_status = getattr(referred, "_stats_snapshot", (referred.clinic_id, referred.status))
+    if old_clinic is not None:
+        _apply(old_clinic, _deltas(old_status, -1), rebuild_missing=False)
+
+
+def recompute_referral_stats(clinic_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recount from ReferredUser with one grouped query and upsert the rows.
+    Without `clinic_ids` every clinic is rebuilt. Returns the rows written.
+    """
+    clinics = Clinic.objects.all()
+    if clinic_ids is not None:
+        clinics = clinics.filter(id__in=list(clinic_ids))
+
+    counts = {
+        row["clinic_id"]: row
+        for row in ReferredUser.objects.filter(clinic__in=clinics)
+        .values("clinic_id")
+        .annotate(
+            total=Count("id"),
+            new=Count("id", filter=Q(status=ReferralStatus.NEW)),
+            active=Count("id", filter=Q(status=ReferralStatus.ACTIVE)),
+            inactive=Count("id", filter=Q(status=ReferralStatus.INACTIVE)),
+        )
+        .order_by()
+    }
+    rows = []
+    for clinic_id in clinics.values_list("id", flat=True):
+        row = counts.get(clinic_id, {})
+        rows.append(ClinicReferralStats(
+            clinic_id=clinic_id,
+            total_referrals=row.get("total", 0),
+            new_referrals=row.get("new", 0),
+            active_referrals=row.get("active", 0),
+            inactive_referrals=row.get("inactive", 0),
+        ))
+    ClinicReferralStats.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=upsert_unique_fields("clinic"),
+        update_fields=["total_referrals", "new_referrals", "active_referrals", "inactive_referrals", "updated_at"],
+    )
+    return len(rows)
+
+
+def get_referral_stats(clinic) -> ClinicReferralStats:
+    """The clinic's counters, built on first access for clinics that predate the table."""
+    try:
+        return ClinicReferralStats.objects.get(clinic=clinic)
+    except ClinicReferralStats.DoesNotExist:
+        recompute_referral_stats([clinic.pk])
+        return ClinicReferralStats.objects.get(clinic=clinic)
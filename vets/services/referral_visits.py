@@ -0,0 +1,93 @@
+"""
+Buffered writes for the ReferralVisit event log.
+
+record_referral_visit() only appends to a per-worker list; the list is
+written with one bulk_create once it holds VETS_REFERRAL_VISIT_BUFFER_SIZE
+events or the oldest event is VETS_REFERRAL_VISIT_FLUSH_INTERVAL seconds
+old (checked on the next visit and when a request finishes, see
+signals.py), and when the worker exits. A worker that is
+killed loses at most one buffer of visits, which is acceptable for
+marketing counters and keeps the signup page free of referral writes.
+"""
+from __future__ import annotations
+import atexit
+import logging
+import threading
+import time
+from typing import List
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from ..models import ReferralCode, ReferralVisit
+
+logger = logging.getLogger(__name__)
+
+_buffer: List[ReferralVisit] = []
+_first_buffered_at = 0.0
+_lock = threading.Lock()
+
+
+def _take_due(force: bool) -> List[ReferralVisit]:
+    """Swap out the buffer if it is due for a flush (caller holds _lock)."""
+    global _buffer
+    if not _buffer:
+        return []
+    size = getattr(settings, "VETS_REFERRAL_VISIT_BUFFER_SIZE", 50)
+    interval = getattr(settings, "VETS_REFERRAL_VISIT_FLUSH_INTERVAL", 10)
+    if force or len(_buffer) >= size or time.monotonic() - _first_buffered_at >= interval:
+        pending, _buffer = _buffer, []
+        return pending
+    return []
+
+
+def _write(visits: List[ReferralVisit]) -> int:
+    if not visits:
+        return 0
+    try:
+        ReferralVisit.objects.bulk_create(visits, batch_size=500)
+    except DatabaseError as e:
+        # Never fail the request that happened to trigger the flush
+        logger.warning(f"Dropped {len(visits)} referral visit(s): {e}")
+        return 0
+    return len(visits)
+
+
+def record_referral_visit(code: ReferralCode, source: str) -> None:
+    """Queue one visit through `code`; written with the next flush."""
+    global _first_buffered_at
+    with _lock:
+        if not _buffer:
+            _first_buffered_at = time.monotonic()
+        _buffer.append(ReferralVisit(
+            clinic_id=code.clinic_id,
+            referral_code_id=code.id,
+            source=source,
+            created_at=timezone.now(),
+        ))
+        pending = _take_due(force=False)
+    _write(pending)
+
+
+def flush_due_referral_visits() -> int:
+    """Write the buffer if it is full or old enough; free when it is empty."""
+    if not _buffer:
+        return 0
+    with _lock:
+        pending = _take_due(force=False)
+    return _write(pending)
+
+
+def flush_referral_visits() -> int:
+    """Write every buffered visit now; returns the number written."""
+    with _lock:
+        pending = _take_due(force=True)
+    return _write(pending)
+
+
+def pending_referral_visits() -> int:
+    return len(_buffer)
+
+
+atexit.register(flush_referral_visits)
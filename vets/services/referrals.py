@@ -1,11 +1,25 @@
 from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
+from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
 
 from ..models import ReferralCode, ReferredUser, Clinic, ReferralStatus
+from ..utils import upsert_unique_fields
+from .clinic_index import CLINIC_SET_VERSION_KEY, get_clinic_set_version
+from .referral_stats import recompute_referral_stats
+from .slugs import bulk_create_with_unique_values
+
+# Bumped whenever a ReferralCode is saved or deleted (see signals.py)
+REFERRAL_CODE_VERSION_KEY = "vets:referral_code_version"
 
 
 @dataclass
@@ -26,14 +40,87 @@ def build_referral_signup_url(code: str) -> str:
     return f"{base}/signup/?ref={code}"
 
 
+# ---------- code resolution ----------
+_resolved: "OrderedDict[str, Tuple[float, tuple, Optional[ReferralCode]]]" = OrderedDict()
+_resolved_lock = threading.Lock()
+
+
+def _resolver_version() -> tuple:
+    """Referral-code and clinic-set versions; a change in either drops cached codes."""
+    versions = cache.get_many([REFERRAL_CODE_VERSION_KEY, CLINIC_SET_VERSION_KEY])
+    if CLINIC_SET_VERSION_KEY not in versions:
+        versions[CLINIC_SET_VERSION_KEY] = get_clinic_set_version()
+    return versions.get(REFERRAL_CODE_VERSION_KEY, 0), versions[CLINIC_SET_VERSION_KEY]
+
+
+def invalidate_referral_codes() -> None:
+    """Make every worker resolve referral codes from the database again."""
+    try:
+        cache.incr(REFERRAL_CODE_VERSION_KEY)
+    except ValueError:
+        cache.set(REFERRAL_CODE_VERSION_KEY, int(time.time() * 1000), timeout=None)
+    with _resolved_lock:
+        _resolved.clear()
+
+
+def resolve_referral_code(code: Optional[str]) -> Optional[ReferralCode]:
+    """
+    The active ReferralCode for `code`, with its clinic loaded, or None.
+
+    Results, including misses, are kept per worker for
+    VETS_REFERRAL_CODE_CACHE_TTL (misses for VETS_REFERRAL_CODE_NEGATIVE_TTL)
+    and dropped as soon as a ReferralCode or Clinic changes. The returned
+    instance is shared between requests: read it, never modify it.
+    """
+    code = (code or "").strip()
+    if not code:
+        return None
+    version = _resolver_version()
+    now = time.monotonic()
+    with _resolved_lock:
+        entry = _resolved.get(code)
+        if entry is not None and entry[0] > now and entry[1] == version:
+            _resolved.move_to_end(code)
+            return entry[2]
+
+    referral_code = ReferralCode.objects.select_related("clinic").filter(code=code, is_active=True).first()
+    if referral_code is not None:
+        ttl = getattr(settings, "VETS_REFERRAL_CODE_CACHE_TTL", 300)
+    else:
+        ttl = getattr(settings, "VETS_REFERRAL_CODE_NEGATIVE_TTL", 60)
+    with _resolved_lock:
+        _resolved[code] = (now + ttl, version, referral_code)
+        _resolved.move_to_end(code)
+        while len(_resolved) > getattr(settings, "VETS_REFERRAL_CODE_CACHE_SIZE", 1000):
+            _resolved.popitem(last=False)
+    return referral_code
+
+
+def create_default_referral_codes(clinics) -> List[ReferralCode]:
+    """
+    ReferralCode.create_default_for_clinic() for many clinics: one query for
+    colliding codes and one bulk insert.
+    """
+    clinics = list(clinics)
+    if not clinics:
+        return []
+    codes = [ReferralCode(clinic=clinic, is_active=True) for clinic in clinics]
+    bases = [ReferralCode.default_code_base(clinic) for clinic in clinics]
+    bulk_create_with_unique_values(ReferralCode, "code", codes, bases)
+    # bulk_create skips the post_save signal that drops resolved codes
+    invalidate_referral_codes()
+    for clinic in clinics:
+        clinic.forget_active_referral_code()
+    return codes
+
+
 def attach_referral_to_user(user, ref_code: str) -> AttachResult:
     """
     Resolve a referral code and attach the user to the clinic, creating ReferredUser.
     Idempotent per (clinic, user).
     """
-    try:
-        code = ReferralCode.objects.get(code=ref_code, is_active=True)
-    except ReferralCode.DoesNotExist:
+    code = resolve_referral_code(ref_code)
+    if code is None:
         return AttachResult(False, "invalid_or_inactive_code")
 
     clinic: Clinic = code.clinic
@@ -49,3 +136,87 @@ def attach_referral_to_user(user, ref_code: str) -> AttachResult:
             obj.referral_code = obj.referral_code or code
             obj.save(update_fields=["status", "referral_code", "updated_at"])
     return AttachResult(True)
+
+
+def track_referral_conversions(conversions: List[dict]) -> List[dict]:
+    """
+    Batch form of TrackReferralAPIView: each item is {"email", "referral_code"}.
+
+    Codes and users are resolved with one IN query each. Known users get an
+    ACTIVE referral upserted per (clinic, user); unknown emails get a NEW
+    email-capture referral unless the clinic already has one for that email.
+    Returns one {"index", "success"[, "error"]} result per item, in order.
+    """
+    items = [(item.get("email"), item.get("referral_code")) if isinstance(item, dict) else (None, None)
+             for item in conversions]
+    codes = {
+        code: (code_id, clinic_id)
+        for code, code_id, clinic_id in ReferralCode.objects.filter(
+            code__in={code for _, code in items if code}, is_active=True
+        ).values_list("code", "id", "clinic_id")
+    }
+    users = dict(
+        get_user_model().objects.filter(email__in={email for email, _ in items if email})
+        .values_list("email", "id")
+    )
+
+    results: List[dict] = []
+    with_user: Dict[Tuple[int, int], ReferredUser] = {}
+    email_only: Dict[Tuple[int, str], ReferredUser] = {}
+    for index, (email, code) in enumerate(items):
+        if not email or not code:
+            results.append({"index": index, "success": False, "error": "Missing required fields"})
+            continue
+        if code not in codes:
+            results.append({"index": index, "success": False, "error": "Invalid referral code"})
+            continue
+        code_id, clinic_id = codes[code]
+        user_id = users.get(email)
+        # Repeated pairs in one batch collapse into one row
+        if user_id is not None:
+            with_user.setdefault((clinic_id, user_id), ReferredUser(
+                clinic_id=clinic_id, referral_code_id=code_id, user_id=user_id, status=ReferralStatus.ACTIVE,
+            ))
+        else:
+            email_only.setdefault((clinic_id, email), ReferredUser(
+                clinic_id=clinic_id, referral_code_id=code_id, email_capture=email, status=ReferralStatus.NEW,
+            ))
+        results.append({"index": index, "success": True})
+
+    with transaction.atomic():
+        if with_user:
+            # Keep the first activation time of referrals that were ACTIVE before
+            now = timezone.now()
+            activated = {
+                (clinic_id, user_id): activated_at
+                for clinic_id, user_id, activated_at in ReferredUser.objects.filter(
+                    clinic_id__in={clinic_id for clinic_id, _ in with_user},
+                    user_id__in={user_id for _, user_id in with_user},
+                    activated_at__isnull=False,
+                ).values_list("clinic_id", "user_id", "activated_at")
+            }
+            for key, referral in with_user.items():
+                referral.activated_at = activated.get(key, now)
+            ReferredUser.objects.bulk_create(
+                with_user.values(),
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=upsert_unique_fields("clinic", "user"),
+                update_fields=["status", "activated_at", "updated_at"],
+            )
+        if email_only:
+            captured = set(
+                ReferredUser.objects.filter(
+                    user__isnull=True,
+                    clinic_id__in={clinic_id for clinic_id, _ in email_only},
+                    email_capture__in={email for _, email in email_only},
+                ).values_list("clinic_id", "email_capture")
+            )
+            ReferredUser.objects.bulk_create(
+                [referral for key, referral in email_only.items() if key not in captured], batch_size=500
+            )
+        # bulk_create skips the signals that maintain the counters
+        clinic_ids = {clinic_id for clinic_id, _ in with_user} | {clinic_id for clinic_id, _ in email_only}
+        if clinic_ids:
+            recompute_referral_stats(clinic_ids)
+    return results
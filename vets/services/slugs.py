@@ -0,0 +1,89 @@
+"""
+Unique slug and code allocation.
+
+Instead of probing candidates with one exists() query each, the allocator
+reads every stored value that could collide with a base ("base", "base-2",
+...) in one query and picks the next free suffix in memory. The unique index
+stays the arbiter: an insert that still loses a race raises IntegrityError
+and is retried with a fresh read.
+"""
+from __future__ import annotations
+from typing import Callable, Iterable, List, Optional, Sequence, Set
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+MAX_ATTEMPTS = 5
+# Room kept for a "-<n>" suffix when a base is cut to the column length
+SUFFIX_ROOM = 8
+
+
+def _stem(base: str, max_length: int) -> str:
+    return base[:max_length - SUFFIX_ROOM]
+
+
+def taken_values(model, field: str, stems: Iterable[str], exclude_pk=None) -> Set[str]:
+    """Stored values of `field` that start with any of `stems`, in one query."""
+    q = Q()
+    for stem in set(stems):
+        q |= Q(**{f"{field}__startswith": stem})
+    rows = model._default_manager.filter(q)
+    if exclude_pk is not None:
+        rows = rows.exclude(pk=exclude_pk)
+    return set(rows.values_list(field, flat=True))
+
+
+def next_free(base: str, max_length: int, taken: Set[str]) -> str:
+    """`base` itself if free, else the first free "base-<n>" with n >= 2."""
+    candidate = base[:max_length]
+    n = 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{_stem(base, max_length)}-{n}"
+    return candidate
+
+
+def allocate_unique(model, field: str, bases: Sequence[str], exclude_pk=None) -> List[str]:
+    """One free, mutually distinct value of `field` per base."""
+    max_length = model._meta.get_field(field).max_length
+    taken = taken_values(model, field, (_stem(base, max_length) for base in bases), exclude_pk)
+    values = []
+    for base in bases:
+        value = next_free(base, max_length, taken)
+        taken.add(value)
+        values.append(value)
+    return values
+
+
+def save_with_unique_value(instance, field: str, base: str, save: Callable[[], None]) -> None:
+    """
+    Set instance.<field> to a free value derived from `base` and call
+    `save()`, reallocating when the insert collides on that value.
+    """
+    model = type(instance)
+    for attempt in range(MAX_ATTEMPTS):
+        value, = allocate_unique(model, field, [base], exclude_pk=instance.pk)
+        setattr(instance, field, value)
+        try:
+            with transaction.atomic():
+                save()
+            return
+        except IntegrityError:
+            lost_race = model._default_manager.filter(**{field: value}).exclude(pk=instance.pk).exists()
+            if not lost_race or attempt == MAX_ATTEMPTS - 1:
+                raise
+
+
+def bulk_create_with_unique_values(model, field: str, objs: List, bases: Sequence[str],
+                                   batch_size: Optional[int] = 500) -> List:
+    """bulk_create `objs` after giving each a free `field` value from its base."""
+    for attempt in range(MAX_ATTEMPTS):
+        for obj, value in zip(objs, allocate_unique(model, field, bases)):
+            setattr(obj, field, value)
+        try:
+            with transaction.atomic():
+                return model._default_manager.bulk_create(objs, batch_size=batch_size)
+        except IntegrityError:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+    return []
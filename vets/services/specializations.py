@@ -0,0 +1,90 @@
+"""
+Specialization tags derived from the free-text Clinic.specializations field,
+and faceted counts for the public clinic directory.
+"""
+from __future__ import annotations
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.template.defaultfilters import slugify
+
+from ..models import Clinic, Specialization
+from ..utils import normalize_city
+from .cities import city_filter
+from .clinic_index import bump_clinic_set_version, get_clinic_set_version
+
+
+def parse_specializations(value: Optional[str]) -> Dict[str, str]:
+    """Map slug -> display name, e.g. "Cats, dogs ,Nutrition" -> {"cats": "Cats", "dogs": "dogs", ...}."""
+    parsed: Dict[str, str] = {}
+    for part in (value or "").split(","):
+        name = " ".join(part.split())[:60]
+        slug = slugify(name)[:70]
+        if slug and slug not in parsed:
+            parsed[slug] = name
+    return parsed
+
+
+def ensure_specializations(parsed: Dict[str, str], model=Specialization) -> Dict[str, int]:
+    """Create missing tags in one insert and return {slug: id} for all of them."""
+    if not parsed:
+        return {}
+    existing = dict(model.objects.filter(slug__in=parsed).values_list("slug", "id"))
+    missing = [model(slug=slug, name=name) for slug, name in parsed.items() if slug not in existing]
+    if missing:
+        # Concurrent saves may create the same tag; re-read instead of failing
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        existing = dict(model.objects.filter(slug__in=parsed).values_list("slug", "id"))
+    return existing
+
+
+def sync_specialization_tags(clinic: Clinic) -> None:
+    """Point clinic.specialization_tags at the tags parsed from clinic.specializations."""
+    wanted = set(ensure_specializations(parse_specializations(clinic.specializations)).values())
+    current = set(clinic.specialization_tags.values_list("id", flat=True))
+    if wanted != current:
+        clinic.specialization_tags.set(wanted)
+        # Facet counts are cached per clinic-set version
+        bump_clinic_set_version()
+
+
+def filter_by_specializations(queryset, slugs: Iterable[str]):
+    """Clinics tagged with every one of `slugs`."""
+    for slug in dict.fromkeys(slugs):
+        queryset = queryset.filter(specialization_tags__slug=slug)
+    return queryset
+
+
+def directory_clinics(city: str = "", selected: Iterable[str] = ()):
+    """The public directory (email-confirmed clinics), narrowed by city and selected tags."""
+    queryset = Clinic.objects.filter(email_confirmed=True)
+    if city:
+        queryset = queryset.filter(city_filter(city))
+    return filter_by_specializations(queryset, selected)
+
+
+def get_specialization_facets(city: str = "", selected: Iterable[str] = ()) -> List[dict]:
+    """
+    Per-tag clinic counts within the directory narrowed by `city` and the
+    `selected` tags, from one grouped query. Results are cached per
+    clinic-set version and filter signature.
+    """
+    selected = sorted(set(selected))
+    signature = hashlib.sha1(f"{normalize_city(city)}|{','.join(selected)}".encode()).hexdigest()
+    key = f"vets:specialization_facets:{get_clinic_set_version()}:{signature}"
+    facets = cache.get(key)
+    if facets is None:
+        clinics = directory_clinics(city, selected).values("id")
+        facets = list(
+            Specialization.objects.filter(clinics__in=clinics)
+            .annotate(count=Count("clinics"))
+            .order_by("-count", "name")
+            .values("slug", "name", "count")
+        )
+        for facet in facets:
+            facet["selected"] = facet["slug"] in selected
+        cache.set(key, facets, timeout=getattr(settings, "VETS_FACET_CACHE_TIMEOUT", 600))
+    return facets
@@ -1,52 +1,76 @@
-from django.db.models.signals import post_save
+from django.core.signals import request_finished
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Clinic, ReferralCode
+from .models import Clinic, ReferralCode, ReferredUser, VetProfile
+from .services.clinic_index import bump_clinic_set_version
 
 
 @receiver(post_save, sender=Clinic)
-def create_referral_code_on_clinic_create(sender, instance: Clinic, created, **kwargs):
+@receiver(post_delete, sender=Clinic)
+def invalidate_clinic_index(sender, instance: Clinic, **kwargs):
     """
-    Create referral code when clinic confirms email (even if not admin approved yet)
+    Bump the clinic-set version so every worker rebuilds its in-memory index
     """
-    if created:
-        # Don't create referral code immediately on creation
-        # It will be created when clinic confirms email
-        pass
-    else:
-        # Check if clinic has confirmed email (regardless of admin approval)
-        if instance.email_confirmed:
-            # If no active code exists, create one
-            has_active = instance.referral_codes.filter(is_active=True).exists()
-            if not has_active:
-                ReferralCode.create_default_for_clinic(instance)
+    bump_clinic_set_version()
 
 
-@receiver(post_save, sender=Clinic)
-def update_clinic_verification_status(sender, instance, **kwargs):
+@receiver(post_save, sender=ReferralCode)
+@receiver(post_delete, sender=ReferralCode)
+def invalidate_resolved_referral_codes(sender, instance: ReferralCode, **kwargs):
     """
-    Automatically update is_verified when both email_confirmed and admin_approved are True
+    Drop cached code -> clinic resolutions; Clinic changes reach the resolver
+    through the clinic-set version
     """
-    # Check if both conditions are met but is_verified is False
-    if instance.email_confirmed and instance.admin_approved and not instance.is_verified:
-        # Prevent recursive calls by using update instead of save
-        Clinic.objects.filter(pk=instance.pk).update(is_verified=True)
-    
-    # Check if either condition is not met but is_verified is True
-    elif (not instance.email_confirmed or not instance.admin_approved) and instance.is_verified:
-        # Remove verification if either condition is no longer met
-        Clinic.objects.filter(pk=instance.pk).update(is_verified=False)
+    from .services.referrals import invalidate_referral_codes
+    invalidate_referral_codes()
 
 
-@receiver(post_save, sender=Clinic)
-def update_clinic_verification_status(sender, instance: Clinic, **kwargs):
-    """
-    Automatically update is_verified when both email_confirmed and admin_approved are True
-    """
-    should_be_verified = instance.email_confirmed and instance.admin_approved
-    
-    if should_be_verified and not instance.is_verified:
-        # Update without triggering another post_save
-        Clinic.objects.filter(pk=instance.pk).update(is_verified=True)
-    elif not should_be_verified and instance.is_verified:
-        # Remove verification if either condition is no longer met
-        Clinic.objects.filter(pk=instance.pk).update(is_verified=False)
+@receiver(post_save, sender=VetProfile)
+@receiver(post_delete, sender=VetProfile)
+def refresh_clinic_search_document(sender, instance: VetProfile, **kwargs):
+    """
+    The vet name is part of the clinic's search document; rebuild it without
+    going through Clinic.save()
+    """
+    from .services.clinic_search import build_search_document
+    clinic = Clinic.objects.filter(pk=instance.clinic_id).first()
+    if clinic is None:
+        return
+    vet_name = "" if kwargs.get("signal") is post_delete else instance.vet_name
+    Clinic.objects.filter(pk=clinic.pk).update(search_document=build_search_document(clinic, vet_name))
+    bump_clinic_set_version()
+
+
+@receiver(pre_save, sender=ReferredUser)
+def remember_referral_state(sender, instance: ReferredUser, **kwargs):
+    """
+    Snapshot clinic and status as stored, so post_save knows which counters
+    moved; read from the row because the instance may have been loaded before
+    another save changed it
+    """
+    stored = None
+    if instance.pk:
+        stored = ReferredUser.objects.filter(pk=instance.pk).values_list("clinic_id", "status").first()
+    instance._stats_snapshot = stored or (None, None)
+
+
+@receiver(post_save, sender=ReferredUser)
+def update_referral_stats_on_save(sender, instance: ReferredUser, created, **kwargs):
+    from .services.referral_stats import record_saved
+    record_saved(instance, created)
+
+
+@receiver(post_delete, sender=ReferredUser)
+def update_referral_stats_on_delete(sender, instance: ReferredUser, **kwargs):
+    from .services.referral_stats import record_deleted
+    record_deleted(instance)
+
+
+@receiver(request_finished)
+def flush_referral_visits_when_due(sender, **kwargs):
+    """
+    Write buffered referral visits once the flush interval has passed, so a
+    quiet worker does not hold them until its next visit or exit
+    """
+    from .services.referral_visits import flush_due_referral_visits
+    flush_due_referral_visits()
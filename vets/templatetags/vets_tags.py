@@ -17,9 +17,10 @@ def get_item(dictionary, key):
 @register.simple_tag
 def clinic_referral_url(request, clinic):
     """Generate a referral URL for a clinic"""
-    if clinic and clinic.active_referral_code:
+    code = clinic.active_referral_code if clinic else None
+    if code:
         from django.urls import reverse
-        referral_path = reverse('vets:referral_landing', kwargs={'code': clinic.active_referral_code})
+        referral_path = reverse('vets:referral_landing', kwargs={'code': code})
         return request.build_absolute_uri(referral_path)
     return ''
 
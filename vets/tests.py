@@ -1,3 +1,882 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import IntegrityError
+from django.db.models import Sum
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import (
+    Clinic, ClinicReferralStats, GeocodeCache, GeocodeStatus, ReferralCode, ReferralDailyStats, ReferralStatus,
+    ReferralVisit, ReferredUser, VetProfile,
+)
+from .services import clinic_index, slugs
+from .services.clinic_index import ClinicSpatialIndex, bump_clinic_set_version, get_clinic_set_version
+from .services.clinic_state import approve_clinics, disapprove_clinics
+from .checks import gazetteer_file_check
+from .services.geocoders import GazetteerBackend, NominatimBackend, get_city_geocoder
+from .services.geocoding import ClinicGeocodePipeline, FileCheckpoint
+from .services.nearby_cache import get_nearby_cache_stats, get_nearby_clinics_data
+from .services.referral_rollups import rollup_referral_stats, window_totals
+from .services.referral_stats import get_referral_stats, recompute_referral_stats
+from .services.referral_visits import flush_referral_visits, pending_referral_visits, record_referral_visit
+from .services.referrals import invalidate_referral_codes, resolve_referral_code
+from .services.cities import city_filter
+from .utils import (
+    address_fingerprint, geocode_address, get_cached_geocode, get_clinics_within_radius, haversine_distance,
+    normalize_city,
+)
+
+# A private directory per run: shared between cache connections like the
+# production file cache, but never mixed with a developer's cached entries
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='fammo-test-cache-'),
+    }
+}
+
+
+def make_clinics(points, prefix='Clinic', **fields):
+    """Active clinics at `points` ((lat, lng) pairs), without Clinic.save() side effects."""
+    defaults = {'email_confirmed': True, 'admin_approved': True}
+    defaults.update(fields)
+    return Clinic.objects.bulk_create([
+        Clinic(name=f'{prefix} {i}', slug=f'{prefix.lower()}-{i}', latitude=round(lat, 6), longitude=round(lng, 6),
+               **defaults)
+        for i, (lat, lng) in enumerate(points)
+    ])
+
+
+def random_points(n, seed=1):
+    rng = random.Random(seed)
+    return [(rng.uniform(35.5, 42.0), rng.uniform(26.0, 44.5)) for _ in range(n)]
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VetsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Built per settings: a test may point GAZETTEER_FILE elsewhere
+        get_city_geocoder.cache_clear()
+        self.addCleanup(get_city_geocoder.cache_clear)
+
+
+class ClinicsWithinRadiusTests(VetsTestCase):
+    def setUp(self):
+        super().setUp()
+        make_clinics(random_points(200))
+
+    def test_bbox_prefilter_is_the_default_and_matches_full_scan(self):
+        for lat, lng, radius in [(41.0, 29.0, 50), (39.9, 32.8, 300), (37.0, 35.3, 5)]:
+            with self.assertNumQueries(1):
+                default = get_clinics_within_radius(lat, lng, radius)
+            full_scan = get_clinics_within_radius(lat, lng, radius, use_bbox=False)
+            self.assertEqual([c.id for c in default], [c.id for c in full_scan])
+            self.assertTrue(all(c.distance <= radius for c in default))
+
+    def test_index_path_is_opt_in_and_agrees(self):
+        lat, lng, radius = 39.9, 32.8, 300
+        default = get_clinics_within_radius(lat, lng, radius)
+        indexed = get_clinics_within_radius(lat, lng, radius, use_index=True)
+        self.assertEqual(sorted(c.id for c in default), sorted(c.id for c in indexed))
+        for clinic in indexed:
+            expected = haversine_distance(lat, lng, float(clinic.latitude), float(clinic.longitude))
+            self.assertAlmostEqual(clinic.distance, expected, delta=0.1)
+
+
+def brute_force(points, lat, lng, radius_km=None):
+    found = [(haversine_distance(lat, lng, p_lat, p_lng), pk) for pk, p_lat, p_lng in points]
+    return sorted((d, pk) for d, pk in found if radius_km is None or d <= radius_km)
+
+
+class ClinicSpatialIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = [(pk, rng.uniform(-80, 80), rng.uniform(-180, 180)) for pk in range(1500)]
+        # A cluster straddling the antimeridian
+        self.points += [(2000 + i, rng.uniform(-1, 1), rng.choice([-1, 1]) * rng.uniform(179.0, 180.0))
+                        for i in range(100)]
+        self.index = ClinicSpatialIndex(self.points)
+
+    def assertSameMatches(self, matches, expected):
+        self.assertEqual([pk for pk, _ in matches], [pk for _, pk in expected])
+        for (_, distance), (expected_distance, _) in zip(matches, expected):
+            self.assertAlmostEqual(distance, expected_distance, delta=1e-6)
+
+    def test_within_radius_matches_brute_force(self):
+        rng = random.Random(11)
+        for _ in range(40):
+            lat, lng, radius = rng.uniform(-80, 80), rng.uniform(-180, 180), rng.choice([50, 500, 2500])
+            self.assertSameMatches(
+                self.index.within_radius(lat, lng, radius), brute_force(self.points, lat, lng, radius)
+            )
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(13)
+        for _ in range(40):
+            lat, lng, k = rng.uniform(-80, 80), rng.uniform(-180, 180), rng.choice([1, 5, 25])
+            self.assertSameMatches(self.index.nearest(lat, lng, k), brute_force(self.points, lat, lng)[:k])
+
+    def test_nearest_respects_max_radius(self):
+        expected = brute_force(self.points, 10.0, 20.0, 300)[:10]
+        self.assertSameMatches(self.index.nearest(10.0, 20.0, 10, max_radius_km=300), expected)
+
+    def test_queries_across_the_antimeridian(self):
+        for lng in (179.9, -179.9, 180.0):
+            east_and_west = self.index.within_radius(0.0, lng, 150)
+            self.assertSameMatches(east_and_west, brute_force(self.points, 0.0, lng, 150))
+            self.assertTrue(any(pk >= 2000 and p_lng < 0 for pk, _, p_lng in self.points
+                                if pk in {m for m, _ in east_and_west}))
+            self.assertTrue(any(pk >= 2000 and p_lng > 0 for pk, _, p_lng in self.points
+                                if pk in {m for m, _ in east_and_west}))
+            self.assertSameMatches(self.index.nearest(0.0, lng, 8), brute_force(self.points, 0.0, lng)[:8])
+
+    def test_empty_index(self):
+        index = ClinicSpatialIndex([])
+        self.assertEqual(index.within_radius(0, 0, 100), [])
+        self.assertEqual(index.nearest(0, 0, 5), [])
+
+
+class ClinicSetVersionTests(VetsTestCase):
+    def test_bump_is_seen_through_another_cache_connection(self):
+        before = get_clinic_set_version()
+        # A separate connection stands in for another worker or a cron command
+        other_worker = caches.create_connection('default')
+        self.assertEqual(other_worker.get(clinic_index.CLINIC_SET_VERSION_KEY), before)
+        bump_clinic_set_version()
+        self.assertNotEqual(other_worker.get(clinic_index.CLINIC_SET_VERSION_KEY), before)
+
+    def test_index_is_rebuilt_after_a_bump(self):
+        first, = make_clinics([(41.0, 29.0)])
+        self.assertEqual([pk for pk, _ in clinic_index.get_clinic_index().within_radius(41.0, 29.0, 1)], [first.id])
+        Clinic.objects.filter(pk=first.pk).update(admin_approved=False)
+        bump_clinic_set_version()
+        self.assertEqual(clinic_index.get_clinic_index().within_radius(41.0, 29.0, 1), [])
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+
+class NominatimRateLimitTests(VetsTestCase):
+    def test_every_outbound_request_takes_a_token(self):
+        limiter = CountingLimiter()
+        street = NominatimBackend(limiter=limiter)
+        queries = []
+
+        def fake_nominatim(query):
+            queries.append(query)
+            # Only the city-only fallback is found
+            return None if ',' in query else SimpleNamespace(latitude=52.09, longitude=5.12)
+
+        street.geolocator = SimpleNamespace(geocode=fake_nominatim)
+        city = SimpleNamespace(geocode=lambda address, city=None: None)
+        geocoders = {'street': street, 'city': city}
+        with mock.patch('vets.services.geocoders.get_geocoder', side_effect=lambda role='street': geocoders[role]):
+            coords = geocode_address('1 Unknown Street', 'Utrecht', use_cache=False)
+
+        self.assertEqual(coords, (52.09, 5.12))
+        self.assertEqual(queries, ['1 Unknown Street, Utrecht', 'Utrecht'])
+        self.assertEqual(limiter.acquired, len(queries))
+
+
+class FakeGeocoder:
+    """Local stand-in for Nominatim: deterministic coordinates, misses for "nowhere"."""
+
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+
+    def __call__(self, address, city):
+        self.calls.append(address)
+        self.threads.add(threading.get_ident())
+        if 'nowhere' in address:
+            return None
+        n = int(address.split()[0])
+        return (40.0 + n / 1000, 29.0 + n / 1000)
+
+
+# Worker threads use their own DB connections, so the rows must be committed
+@override_settings(CACHES=TEST_CACHES)
+class ClinicGeocodePipelineTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        rows = []
+        for i in range(1, 31):
+            address = f'{i} nowhere road' if i % 10 == 0 else f'{i} Main Street'
+            rows.append(Clinic(name=f'Clinic {i}', slug=f'clinic-{i}', address='' if i == 5 else address,
+                               city='' if i == 5 else 'Istanbul'))
+        self.clinics = Clinic.objects.bulk_create(rows)
+        self.geocoder = FakeGeocoder()
+        self.checkpoint = FileCheckpoint(os.path.join(tempfile.mkdtemp(), 'geocode.checkpoint'))
+
+    def pipeline(self, **kwargs):
+        kwargs.setdefault('checkpoint', self.checkpoint)
+        return ClinicGeocodePipeline(Clinic.objects.all(), geocoder=self.geocoder, **kwargs)
+
+    def test_threaded_run_writes_each_batch_with_bulk_update(self):
+        with mock.patch.object(QuerySet, 'bulk_update', autospec=True, side_effect=QuerySet.bulk_update) as bulk_update, \
+                mock.patch.object(Clinic, 'save', side_effect=AssertionError('save() must not be used')):
+            stats = self.pipeline(batch_size=8, workers=4).run()
+
+        self.assertEqual(bulk_update.call_count, 4)  # ceil(30 / 8)
+        self.assertEqual((stats.total, stats.processed), (30, 30))
+        self.assertEqual((stats.success, stats.failed, stats.skipped), (26, 3, 1))
+        self.assertGreater(len(self.geocoder.threads), 1)
+
+        clinic = Clinic.objects.get(name='Clinic 7')
+        self.assertEqual((float(clinic.latitude), float(clinic.longitude)), (40.007, 29.007))
+        self.assertEqual(clinic.geocode_status, GeocodeStatus.DONE)
+        self.assertEqual(Clinic.objects.get(name='Clinic 20').geocode_status, GeocodeStatus.FAILED)
+        self.assertIsNone(Clinic.objects.get(name='Clinic 5').latitude)
+        self.assertEqual(self.checkpoint.load(), self.clinics[-1].id)
+
+    def test_resume_continues_after_the_checkpoint(self):
+        def crash_after_first_batch(stats):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.pipeline(batch_size=12, workers=3, on_batch=crash_after_first_batch).run()
+        self.assertEqual(self.checkpoint.load(), self.clinics[11].id)
+        # 12 read: clinic 5 has no address, clinic 10 is not found
+        self.assertEqual(Clinic.objects.filter(latitude__isnull=False).count(), 10)
+
+        first_run_calls = list(self.geocoder.calls)
+        stats = self.pipeline(batch_size=12, workers=3).run(start_after=self.checkpoint.load())
+
+        self.assertEqual(stats.total, 18)
+        # Nothing written by the first run is geocoded again
+        self.assertFalse(set(first_run_calls) & set(self.geocoder.calls[len(first_run_calls):]))
+        self.assertEqual(Clinic.objects.filter(geocode_status=GeocodeStatus.DONE).count(), 26)
+
+    def test_limit_stops_early_and_cached_results_skip_the_geocoder(self):
+        GeocodeCache.objects.create(
+            fingerprint=address_fingerprint('1 Main Street', 'Istanbul'),
+            address='1 Main Street', city='Istanbul', latitude=1.5, longitude=2.5, looked_up_at=timezone.now(),
+        )
+        stats = self.pipeline(batch_size=4).run(limit=6)
+
+        self.assertEqual((stats.total, stats.processed, stats.cached), (6, 6, 1))
+        self.assertNotIn('1 Main Street', self.geocoder.calls)
+        self.assertEqual(float(Clinic.objects.get(name='Clinic 1').latitude), 1.5)
+        self.assertEqual(self.checkpoint.load(), self.clinics[5].id)
+
+
+GEONAMES_SAMPLE = "\n".join([
+    "2759794\tAmsterdam\tAmsterdam\t\t52.37403\t4.88969\tP\tPPLC\tNL\t\t07\t\t\t\t741636\t\t13\tEurope/Amsterdam\t2024-01-01",
+    "2618425\tKøbenhavn\tKobenhavn\t\t55.67594\t12.56553\tP\tPPLC\tDK\t\t17\t\t\t\t1153615\t\t14\tEurope/Copenhagen\t2024-01-01",
+    "2745912\tUtrecht\tUtrecht\t\t52.09083\t5.12222\tP\tPPLA\tNL\t\t09\t\t\t\t290529\t\t13\tEurope/Amsterdam\t2024-01-01",
+    "truncated line",
+]) + "\n"
+
+
+class GazetteerTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'cities.csv')
+
+    def fetch(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('cities15000.txt', GEONAMES_SAMPLE)
+        response = mock.Mock(content=archive.getvalue())
+        with mock.patch('requests.get', return_value=response) as get:
+            call_command('fetch_gazetteer', output=self.path, stdout=io.StringIO())
+        get.assert_called_once()
+
+    def test_fetch_writes_a_loadable_gazetteer(self):
+        self.fetch()
+        gazetteer = GazetteerBackend(self.path)
+        self.assertEqual(gazetteer.geocode('', 'Utrecht, NL'), (52.09083, 5.12222))
+        self.assertEqual(gazetteer.geocode('', 'København'), (55.67594, 12.56553))
+        self.assertEqual(gazetteer.geocode('', 'Kobenhavn'), (55.67594, 12.56553))
+        self.assertIsNone(gazetteer.geocode('', 'Atlantis'))
+
+    def test_missing_file_fails_loudly(self):
+        with self.assertRaises(ImproperlyConfigured):
+            GazetteerBackend(self.path)
+        with override_settings(GAZETTEER_FILE=self.path):
+            self.assertEqual([w.id for w in gazetteer_file_check(None)], ['vets.W001'])
+            self.fetch()
+            self.assertEqual(gazetteer_file_check(None), [])
+
+
+@override_settings(GAZETTEER_FILE='/nonexistent/cities.csv')
+class MissingGazetteerTests(VetsTestCase):
+    def street_only(self, street):
+        def get_geocoder(role='street'):
+            return street if role == 'street' else GazetteerBackend()
+        return mock.patch('vets.services.geocoders.get_geocoder', side_effect=get_geocoder)
+
+    def test_street_lookup_falls_back_to_the_street_geocoder(self):
+        street = SimpleNamespace(geocode=lambda address, city=None: None if address else (52.37, 4.89))
+        with self.street_only(street):
+            self.assertEqual(geocode_address('1 Unknown Street', 'Amsterdam', use_cache=False), (52.37, 4.89))
+            self.assertEqual(geocode_address('', 'Amsterdam', use_cache=False), (52.37, 4.89))
+
+    @override_settings(GEOCODE_MODE='deferred')
+    def test_city_only_clinic_is_queued_instead_of_failing(self):
+        clinic = Clinic.objects.create(name='City Vet', slug='city-vet', city='Amsterdam')
+        self.assertEqual(clinic.geocode_status, GeocodeStatus.PENDING)
+        self.assertIsNone(clinic.latitude)
+
+
+class NearbyCursorTests(VetsTestCase):
+    URL = '/en/vets/api/nearby-clinics/'
+    CENTER = (39.9, 32.8)
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(3)
+        make_clinics([(rng.uniform(39.4, 40.4), rng.uniform(32.2, 33.4)) for _ in range(45)])
+        # Equal distances: the cursor must break ties by id
+        make_clinics([(39.95, 32.85)] * 4, prefix='Twin')
+
+    def walk(self, **params):
+        seen, cursor, pages = [], None, 0
+        while True:
+            query = {'lat': self.CENTER[0], 'lng': self.CENTER[1], **params}
+            if cursor:
+                query['cursor'] = cursor
+            data = self.client.get(self.URL, query).json()
+            self.assertTrue(data['success'], data)
+            seen += [clinic['id'] for clinic in data['clinics']]
+            pages += 1
+            cursor = data['next_cursor']
+            if not cursor:
+                return seen, pages
+
+    def expected(self, radius_km):
+        rows = Clinic.objects.values_list('id', 'latitude', 'longitude')
+        return [pk for _, pk in brute_force([(pk, float(lat), float(lng)) for pk, lat, lng in rows],
+                                            *self.CENTER, radius_km)]
+
+    def test_pages_cover_every_clinic_once_in_distance_order(self):
+        seen, pages = self.walk(radius=60, limit=7)
+        self.assertEqual(seen, self.expected(60))
+        self.assertEqual(pages, -(-len(seen) // 7))
+
+    def test_cursor_survives_a_cache_miss(self):
+        first = self.client.get(self.URL, {'lat': 39.9, 'lng': 32.8, 'radius': 60, 'limit': 10}).json()
+        bump_clinic_set_version()
+        second = self.client.get(self.URL, {
+            'lat': 39.9, 'lng': 32.8, 'radius': 60, 'limit': 10, 'cursor': first['next_cursor'],
+        }).json()
+        self.assertFalse(second['cached'])
+        self.assertEqual([c['id'] for c in first['clinics'] + second['clinics']], self.expected(60)[:20])
+
+    def test_malformed_cursor_is_rejected(self):
+        response = self.client.get(self.URL, {'lat': 39.9, 'lng': 32.8, 'limit': 5, 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_limit_is_validated_on_its_own(self):
+        for limit in ('abc', '0', '-3', '2.5'):
+            response = self.client.get(self.URL, {'lat': 39.9, 'lng': 32.8, 'limit': limit})
+            self.assertEqual(
+                (response.status_code, response.json()), (400, {'error': 'Limit must be a positive integer'}), limit
+            )
+        with override_settings(VETS_NEARBY_MAX_LIMIT=5):
+            data = self.client.get(self.URL, {'lat': 39.9, 'lng': 32.8, 'radius': 60, 'limit': 500}).json()
+        self.assertEqual(len(data['clinics']), 5)
+
+
+class PartnerClinicsKeysetTests(VetsTestCase):
+    URL = '/en/vets/clinics/'
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(5)
+        names = [f'{rng.choice("ABCDEFGH")}{rng.randrange(10 ** 6):06d} Vet' for _ in range(30)]
+        Clinic.objects.bulk_create([
+            Clinic(name=name, slug=f'directory-{i}', email_confirmed=True) for i, name in enumerate(names)
+        ])
+        Clinic.objects.create(name='Hidden Vet', slug='hidden', email_confirmed=False)
+        self.expected = list(Clinic.objects.filter(email_confirmed=True).order_by('name', 'id')
+                             .values_list('id', flat=True))
+
+    def page(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_forward_and_backward_walks_cover_the_directory(self):
+        pages, page = [], self.page()
+        while True:
+            pages.append([clinic.id for clinic in page])
+            if not page.has_next():
+                break
+            page = self.page(after=page.next_cursor)
+        self.assertEqual([pk for ids in pages for pk in ids], self.expected)
+        self.assertEqual([len(ids) for ids in pages], [12, 12, 6])
+
+        backwards = []
+        while page.has_previous():
+            page = self.page(before=page.previous_cursor)
+            backwards.insert(0, [clinic.id for clinic in page])
+        self.assertEqual(backwards, pages[:-1])
+
+    def test_pages_do_not_shift_when_earlier_clinics_are_added(self):
+        first = self.page()
+        Clinic.objects.bulk_create([Clinic(name='A000000 New Vet', slug='new-vet', email_confirmed=True)])
+        second = self.page(after=first.next_cursor)
+        self.assertEqual([clinic.id for clinic in second], self.expected[12:24])
+
+    def test_malformed_cursor_is_a_404(self):
+        self.assertEqual(self.client.get(self.URL, {'after': '%%%'}).status_code, 404)
+
+
+class ClinicSearchDocumentTests(VetsTestCase):
+    def setUp(self):
+        super().setUp()
+        clinic = Clinic.objects.create(name='Harbour Vet', slug='harbour', city='Izmir', latitude=38.4, longitude=27.1)
+        VetProfile.objects.create(clinic=clinic, vet_name='Dr Aylin')
+        self.clinic = Clinic.objects.get(pk=clinic.pk)
+
+    def test_unrelated_saves_skip_the_rebuild(self):
+        with mock.patch('vets.services.clinic_search.build_search_document') as build:
+            self.clinic.latitude = 38.5
+            self.clinic.save()
+            self.clinic.save(update_fields=['latitude'])
+        build.assert_not_called()
+
+    def test_source_field_changes_rebuild_the_document(self):
+        self.clinic.name = 'Bay Vet'
+        self.clinic.save()
+        document = Clinic.objects.values_list('search_document', flat=True).get(pk=self.clinic.pk)
+        self.assertIn('bay vet', document.lower())
+        self.assertIn('aylin', document.lower())
+
+        self.clinic.bio = 'Exotic pets'
+        self.clinic.save(update_fields=['bio'])
+        document = Clinic.objects.values_list('search_document', flat=True).get(pk=self.clinic.pk)
+        self.assertIn('exotic', document.lower())
+
+    def test_change_left_out_of_a_partial_save_is_picked_up_later(self):
+        self.clinic.city = 'Bursa'
+        self.clinic.save(update_fields=['latitude'])
+        self.clinic.save()
+        document = Clinic.objects.values_list('search_document', flat=True).get(pk=self.clinic.pk)
+        self.assertIn('bursa', document.lower())
+
+
+class ClinicSpecializationTagTests(VetsTestCase):
+    def setUp(self):
+        super().setUp()
+        clinic = Clinic.objects.create(name='Tag Vet', slug='tag-vet', specializations='Nutrition, Surgery',
+                                       latitude=38.4, longitude=27.1)
+        self.clinic = Clinic.objects.get(pk=clinic.pk)
+
+    def tag_names(self):
+        return sorted(self.clinic.specialization_tags.values_list('name', flat=True))
+
+    def test_new_clinic_gets_its_tags(self):
+        self.assertEqual(self.tag_names(), ['Nutrition', 'Surgery'])
+
+    def test_unrelated_saves_skip_the_tag_sync(self):
+        with mock.patch('vets.services.specializations.sync_specialization_tags') as sync:
+            self.clinic.latitude = 38.5
+            self.clinic.save()
+            self.clinic.specializations = 'Dentistry'
+            self.clinic.save(update_fields=['latitude'])
+        sync.assert_not_called()
+
+    def test_changed_specializations_resync_the_tags(self):
+        self.clinic.specializations = 'Dentistry, Nutrition'
+        self.clinic.save(update_fields=['specializations'])
+        self.assertEqual(self.tag_names(), ['Dentistry', 'Nutrition'])
+
+
+class ClinicReferralStatsTests(VetsTestCase):
+    FIELDS = ('total_referrals', 'new_referrals', 'active_referrals', 'inactive_referrals')
+
+    def setUp(self):
+        super().setUp()
+        self.clinics = make_clinics(random_points(3, seed=7), prefix='Stats')
+
+    def counters(self):
+        return {
+            row['clinic_id']: tuple(row[field] for field in self.FIELDS)
+            for row in ClinicReferralStats.objects.values('clinic_id', *self.FIELDS)
+        }
+
+    def test_signal_counters_match_a_recount(self):
+        rng = random.Random(3)
+        statuses = list(ReferralStatus.values)
+        referred = []
+        for step in range(120):
+            action = rng.random()
+            if action < 0.4 or not referred:
+                referred.append(ReferredUser.objects.create(
+                    clinic=rng.choice(self.clinics), email_capture=f'r{step}@example.com',
+                    status=rng.choice(statuses),
+                ))
+            elif action < 0.7:
+                row = rng.choice(referred)
+                row.status = rng.choice(statuses)
+                row.save()
+            elif action < 0.85:
+                row = ReferredUser.objects.get(pk=rng.choice(referred).pk)
+                row.clinic = rng.choice(self.clinics)
+                row.save()
+            else:
+                row = referred.pop(rng.randrange(len(referred)))
+                ReferredUser.objects.get(pk=row.pk).delete()
+
+        maintained = self.counters()
+        recompute_referral_stats()
+        self.assertEqual(maintained, self.counters())
+        self.assertEqual(sum(counts[0] for counts in maintained.values()), len(referred))
+
+    def test_missing_row_is_rebuilt_on_read(self):
+        clinic = self.clinics[0]
+        ReferredUser.objects.create(clinic=clinic, status=ReferralStatus.ACTIVE)
+        ClinicReferralStats.objects.filter(clinic=clinic).delete()
+        stats = get_referral_stats(clinic)
+        self.assertEqual((stats.total_referrals, stats.active_referrals), (1, 1))
+
+
+class ReferralRollupTests(VetsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clinics = make_clinics(random_points(2, seed=11), prefix='Rollup')
+        self.codes = [ReferralCode.objects.create(clinic=clinic, code=f'rollup-{i}')
+                      for i, clinic in enumerate(self.clinics)]
+        self.start = timezone.now() - timedelta(days=10)
+
+    def at(self, day, hour=12):
+        return mock.patch('django.utils.timezone.now', return_value=self.start + timedelta(days=day, hours=hour))
+
+    def counters(self):
+        return set(ReferralDailyStats.objects.values_list(
+            'clinic_id', 'referral_code_id', 'day', 'visits', 'signups', 'activations'
+        ))
+
+    def test_incremental_runs_match_a_full_rebuild(self):
+        User = get_user_model()
+        with self.at(0):
+            referred = [
+                ReferredUser.objects.create(
+                    clinic=self.clinics[i % 2], referral_code=self.codes[i % 2],
+                    user=User.objects.create_user(f'rollup{i}@example.com', None),
+                )
+                for i in range(6)
+            ]
+            rollup_referral_stats()
+        with self.at(2):
+            for row in referred[:4]:
+                row.status = ReferralStatus.ACTIVE
+                row.save()
+            rollup_referral_stats()
+        with self.at(4):
+            # Later edits must not move the activation day
+            referred[0].referral_code = None
+            referred[0].save()
+            referred[1].status = ReferralStatus.INACTIVE
+            referred[1].save()
+            referred[2].clinic = self.clinics[1]
+            referred[2].save()
+            referred[1].status = ReferralStatus.ACTIVE
+            referred[1].save()
+            rollup_referral_stats()
+            incremental = self.counters()
+            rollup_referral_stats(full=True)
+        self.assertEqual(incremental, self.counters())
+
+        activation_day = timezone.localdate(self.start + timedelta(days=2, hours=12))
+        self.assertEqual(
+            ReferralDailyStats.objects.filter(day=activation_day).aggregate(n=Sum('activations'))['n'], 4
+        )
+        self.assertEqual(ReferralDailyStats.objects.aggregate(n=Sum('signups'))['n'], 6)
+
+    def test_analytics_windows_count_signups(self):
+        ReferralVisit.objects.bulk_create(
+            [ReferralVisit(clinic=self.clinics[0], referral_code=self.codes[0], source='LANDING')] * 3
+        )
+        ReferredUser.objects.create(
+            clinic=self.clinics[0], referral_code=self.codes[0],
+            user=get_user_model().objects.create_user('window@example.com', None),
+        )
+        rollup_referral_stats()
+        self.assertEqual(window_totals(self.clinics[0])[7], {'visits': 3, 'signups': 1, 'activations': 0})
+
+
+@override_settings(VETS_REFERRAL_VISIT_BUFFER_SIZE=50, VETS_REFERRAL_VISIT_FLUSH_INTERVAL=10)
+class ReferralVisitBufferTests(VetsTestCase):
+    def setUp(self):
+        super().setUp()
+        clinic = make_clinics(random_points(1, seed=13), prefix='Visit')[0]
+        self.code = ReferralCode.objects.create(clinic=clinic, code='visit-0')
+        self.addCleanup(flush_referral_visits)
+
+    def test_finished_request_flushes_once_the_interval_passed(self):
+        now = time.monotonic()
+        with mock.patch('vets.services.referral_visits.time.monotonic', return_value=now):
+            record_referral_visit(self.code, 'LANDING')
+            request_finished.send(sender=self.__class__)
+        self.assertEqual((ReferralVisit.objects.count(), pending_referral_visits()), (0, 1))
+
+        with mock.patch('vets.services.referral_visits.time.monotonic', return_value=now + 11):
+            request_finished.send(sender=self.__class__)
+        self.assertEqual((ReferralVisit.objects.count(), pending_referral_visits()), (1, 0))
+
+
+class TrackReferralAPITests(VetsTestCase):
+    URL = '/en/vets/api/track-referral/'
+
+    def setUp(self):
+        super().setUp()
+        self.clinic = make_clinics(random_points(1, seed=17), prefix='Track')[0]
+        self.first = ReferralCode.objects.create(clinic=self.clinic, code='track-first')
+        self.second = ReferralCode.objects.create(clinic=self.clinic, code='track-second')
+        self.user = get_user_model().objects.create_user('tracked@example.com', None)
+
+    def post(self, payload):
+        return self.client.post(self.URL, json.dumps(payload), content_type='application/json')
+
+    def test_user_referred_through_another_code_is_upserted(self):
+        ReferredUser.objects.create(clinic=self.clinic, referral_code=self.first, user=self.user)
+        response = self.post({'email': 'tracked@example.com', 'referral_code': 'track-second'})
+        self.assertEqual(response.status_code, 200)
+        referral = ReferredUser.objects.get(clinic=self.clinic, user=self.user)
+        self.assertEqual((referral.referral_code, referral.status), (self.first, ReferralStatus.ACTIVE))
+
+    def test_repeated_unknown_email_is_captured_once(self):
+        for _ in range(2):
+            self.assertEqual(self.post({'email': 'later@example.com', 'referral_code': 'track-first'}).status_code, 200)
+        self.assertEqual(ReferredUser.objects.filter(email_capture='later@example.com').count(), 1)
+
+    def test_invalid_code_is_a_400(self):
+        response = self.post({'email': 'tracked@example.com', 'referral_code': 'nope'})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid referral code'}))
+
+
+class CityFilterTests(VetsTestCase):
+    def setUp(self):
+        super().setUp()
+        Clinic.objects.bulk_create([
+            Clinic(name=f'{city} Vet', slug=slugify(city), city=city, city_key=normalize_city(city))
+            for city in ('Amsterdam', 'Amstelveen', 'Rotterdam', '')
+        ])
+
+    def cities(self, query, **kwargs):
+        return sorted(Clinic.objects.filter(city_filter(query, **kwargs)).values_list('city', flat=True))
+
+    def test_prefix_and_exact_matches(self):
+        self.assertEqual(self.cities('AMST'), ['Amstelveen', 'Amsterdam'])
+        self.assertEqual(self.cities(' amsterdam ', prefix=False), ['Amsterdam'])
+        self.assertEqual(city_filter('amst').children, [('city_key__istartswith', 'amst')])
+
+    def test_blank_city_matches_nothing(self):
+        for query in ('', '  ', '.,-'):
+            self.assertEqual(self.cities(query), [])
+            self.assertEqual(self.cities(query, prefix=False), [])
+
+
+@override_settings(GEOCODE_NEGATIVE_CACHE_TTL=3600)
+class GeocodeCacheTests(VetsTestCase):
+    def geocoders(self, answer):
+        street = mock.Mock()
+        street.geocode.side_effect = answer
+        city = SimpleNamespace(geocode=lambda address, city=None: None)
+        patcher = mock.patch('vets.services.geocoders.get_geocoder',
+                             side_effect=lambda role='street': street if role == 'street' else city)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return street
+
+    def test_hit_is_reused_for_equivalent_addresses(self):
+        street = self.geocoders(lambda address, city=None: (52.09, 5.12))
+        self.assertEqual(geocode_address('Oudegracht 1', 'Utrecht'), (52.09, 5.12))
+        self.assertEqual(geocode_address('  oudegracht   1 ', 'UTRECHT'), (52.09, 5.12))
+        self.assertEqual(street.geocode.call_count, 1)
+        self.assertTrue(GeocodeCache.objects.get(fingerprint=address_fingerprint('Oudegracht 1', 'Utrecht')).is_hit)
+
+    def test_miss_is_reused_until_it_expires(self):
+        street = self.geocoders(lambda address, city=None: None)
+        self.assertIsNone(geocode_address('Nowhere 1', 'Atlantis'))
+        calls = street.geocode.call_count
+        self.assertIsNone(geocode_address('Nowhere 1', 'Atlantis'))
+        self.assertEqual(street.geocode.call_count, calls)
+
+        GeocodeCache.objects.update(looked_up_at=timezone.now() - timedelta(seconds=3601))
+        self.assertIsNone(get_cached_geocode('Nowhere 1', 'Atlantis'))
+        geocode_address('Nowhere 1', 'Atlantis')
+        self.assertEqual(street.geocode.call_count, 2 * calls)
+
+    def test_service_errors_are_not_cached(self):
+        from geopy.exc import GeocoderServiceError
+
+        def fail(address, city=None):
+            raise GeocoderServiceError('down')
+        self.geocoders(fail)
+        self.assertIsNone(geocode_address('Oudegracht 1', 'Utrecht'))
+        self.assertFalse(GeocodeCache.objects.exists())
+
+
+class NearbyResponseCacheTests(VetsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clinics = make_clinics([(52.37, 4.89), (52.36, 4.90), (52.10, 5.12)], prefix='Nearby')
+
+    def nearby(self, lat=52.371, lng=4.891, radius_km=10):
+        return get_nearby_clinics_data(lat, lng, radius_km)
+
+    def test_requests_in_one_cell_share_the_candidates(self):
+        first = self.nearby()
+        second = self.nearby(52.372, 4.892, radius_km=8)
+        self.assertEqual((first.cached, second.cached), (False, True))
+        self.assertEqual([c['id'] for c in second.clinics], [self.clinics[0].id, self.clinics[1].id])
+        self.assertEqual(get_nearby_cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_clinic_save_invalidates_the_cached_candidates(self):
+        self.nearby()
+        clinic = Clinic.objects.get(pk=self.clinics[1].pk)
+        clinic.name = 'Renamed Vet'
+        clinic.save()
+        result = self.nearby()
+        self.assertFalse(result.cached)
+        self.assertIn('Renamed Vet', [c['name'] for c in result.clinics])
+
+        make_clinics([(52.371, 4.89)], prefix='Late')
+        bump_clinic_set_version()  # bulk_create skips the signals
+        self.assertEqual(len(self.nearby().clinics), 3)
+
+
+@override_settings(VETS_REFERRAL_CODE_CACHE_TTL=300, VETS_REFERRAL_CODE_NEGATIVE_TTL=60)
+class ReferralCodeResolverTests(VetsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clinic = make_clinics(random_points(1, seed=19), prefix='Resolver')[0]
+        self.code = ReferralCode.objects.create(clinic=self.clinic, code='resolver-0')
+        invalidate_referral_codes()
+
+    def at(self, offset):
+        return mock.patch('vets.services.referrals.time.monotonic', return_value=self.now + offset)
+
+    def test_hits_are_served_until_they_expire(self):
+        self.now = time.monotonic()
+        with self.at(0):
+            self.assertEqual(resolve_referral_code('resolver-0'), self.code)
+        with self.at(299), self.assertNumQueries(0):
+            self.assertEqual(resolve_referral_code(' resolver-0 ').clinic, self.clinic)
+        with self.at(301), self.assertNumQueries(1):
+            resolve_referral_code('resolver-0')
+
+    def test_misses_expire_sooner(self):
+        self.now = time.monotonic()
+        with self.at(0):
+            self.assertIsNone(resolve_referral_code('unknown'))
+        with self.at(59), self.assertNumQueries(0):
+            self.assertIsNone(resolve_referral_code('unknown'))
+        with self.at(61), self.assertNumQueries(1):
+            resolve_referral_code('unknown')
+
+    def test_code_and_clinic_changes_drop_cached_entries(self):
+        self.assertIsNone(resolve_referral_code('resolver-new'))
+        ReferralCode.objects.create(clinic=self.clinic, code='resolver-new')
+        self.assertIsNotNone(resolve_referral_code('resolver-new'))
+
+        self.code.is_active = False
+        self.code.save()
+        self.assertIsNone(resolve_referral_code('resolver-0'))
+
+        resolve_referral_code('resolver-new')
+        bump_clinic_set_version()
+        with self.assertNumQueries(1):
+            resolve_referral_code('resolver-new')
+
+
+class UniqueSlugTests(VetsTestCase):
+    def test_next_free_suffix(self):
+        self.assertEqual(slugs.next_free('vet', 50, set()), 'vet')
+        self.assertEqual(slugs.next_free('vet', 50, {'vet', 'vet-2'}), 'vet-3')
+        self.assertEqual(slugs.next_free('x' * 60, 50, {'x' * 50}), 'x' * 42 + '-2')
+
+    def test_colliding_names_get_numbered_slugs(self):
+        Clinic.objects.create(name='Happy Paws Extra', latitude=52.0, longitude=5.0)
+        created = [Clinic.objects.create(name=name, latitude=52.0, longitude=5.0)
+                   for name in ('Happy Paws', 'Happy-Paws', 'Happy Paws!')]
+        self.assertEqual([c.slug for c in created], ['happy-paws', 'happy-paws-2', 'happy-paws-3'])
+        self.assertEqual(slugs.allocate_unique(Clinic, 'slug', ['happy-paws', 'happy-paws']),
+                         ['happy-paws-4', 'happy-paws-5'])
+
+    def test_insert_that_loses_the_race_is_retried(self):
+        Clinic.objects.create(name='Race Vet', latitude=52.0, longitude=5.0)
+        real = slugs.taken_values
+        reads = []
+
+        def stale_first_read(*args, **kwargs):
+            reads.append(args)
+            # The first read misses the row another request just inserted
+            return set() if len(reads) == 1 else real(*args, **kwargs)
+
+        with mock.patch('vets.services.slugs.taken_values', side_effect=stale_first_read):
+            clinic = Clinic.objects.create(name='Race Vet!', latitude=52.0, longitude=5.0)
+        self.assertEqual((clinic.slug, len(reads)), ('race-vet-2', 2))
+
+    def test_unrelated_integrity_errors_are_not_retried(self):
+        clinic = Clinic(name='Broken Vet')
+        save = mock.Mock(side_effect=IntegrityError('other constraint'))
+        with self.assertRaises(IntegrityError):
+            slugs.save_with_unique_value(clinic, 'slug', 'broken-vet', save)
+        save.assert_called_once()
+
+
+class ClinicStateTests(VetsTestCase):
+    def test_save_applies_the_workflow_transitions(self):
+        clinic = Clinic.objects.create(name='Flow Vet', latitude=52.0, longitude=5.0)
+        self.assertFalse(clinic.is_verified)
+        self.assertFalse(clinic.referral_codes.exists())
+
+        clinic = Clinic.objects.get(pk=clinic.pk)
+        clinic.email_confirmed = True
+        clinic.save()
+        self.assertEqual(clinic.referral_codes.filter(is_active=True).count(), 1)
+        self.assertFalse(clinic.is_verified)
+
+        clinic.admin_approved = True
+        clinic.save(update_fields=['admin_approved'])
+        self.assertTrue(Clinic.objects.get(pk=clinic.pk).is_verified)
+        clinic.save()
+        self.assertEqual(clinic.referral_codes.count(), 1)
+
+    def test_approve_and_disapprove_in_bulk(self):
+        pending, coded, unconfirmed = make_clinics(
+            random_points(3, seed=23), prefix='Bulk', admin_approved=False, email_confirmed=True
+        )
+        Clinic.objects.filter(pk=unconfirmed.pk).update(email_confirmed=False)
+        ReferralCode.objects.create(clinic=coded, code='bulk-existing')
+        version = get_clinic_set_version()
+
+        self.assertEqual(approve_clinics(Clinic.objects.filter(name__startswith='Bulk')), 3)
+        verified = dict(Clinic.objects.values_list('pk', 'is_verified'))
+        self.assertEqual([verified[c.pk] for c in (pending, coded, unconfirmed)], [True, True, False])
+        codes = {c.pk: c.referral_codes.count() for c in (pending, coded, unconfirmed)}
+        self.assertEqual(list(codes.values()), [1, 1, 0])
+        self.assertNotEqual(get_clinic_set_version(), version)
+
+        version = get_clinic_set_version()
+        disapprove_clinics(Clinic.objects.filter(pk=pending.pk))
+        clinic = Clinic.objects.get(pk=pending.pk)
+        self.assertEqual((clinic.admin_approved, clinic.is_verified), (False, False))
+        self.assertNotEqual(get_clinic_set_version(), version)
@@ -18,6 +18,7 @@ urlpatterns = [
     path('dashboard/profile/', views.ClinicProfileUpdateView.as_view(), name='clinic_profile_update'),
     path('dashboard/referrals/', views.ClinicReferralsView.as_view(), name='clinic_referrals'),
     path('dashboard/analytics/', views.ClinicAnalyticsView.as_view(), name='clinic_analytics'),
+    path('dashboard/analytics/series/', views.ClinicAnalyticsSeriesAPIView.as_view(), name='clinic_analytics_series_api'),
     
     # Referral handling
     path('ref/<str:code>/', views.ReferralLandingView.as_view(), name='referral_landing'),
@@ -30,7 +31,9 @@ urlpatterns = [
     # Location & Clinic Finder
     path('find/', views.ClinicFinderView.as_view(), name='clinic_finder'),
     path('api/nearby-clinics/', views.NearbyClinicAPIView.as_view(), name='nearby_clinics_api'),
+    path('api/nearby-clinics/cache-stats/', views.NearbyClinicCacheStatsAPIView.as_view(), name='nearby_clinics_cache_stats_api'),
     path('api/clinics-by-city/', views.ClinicsByCityAPIView.as_view(), name='clinics_by_city_api'),
+    path('api/specializations/facets/', views.SpecializationFacetsAPIView.as_view(), name='specialization_facets_api'),
     path('api/location/ip/', views.IPLocationAPIView.as_view(), name='ip_location_api'),
     path('admin/clinic/<int:clinic_id>/nearby-users/', views.ClinicNearbyUsersReportView.as_view(), name='clinic_nearby_users_report'),
 ]
\ No newline at end of file
@@ -1,14 +1,18 @@
+import hashlib
 import secrets
 import string
-from math import radians, cos, sin, asin, sqrt
-from typing import Tuple, Optional
+import unicodedata
+from datetime import timedelta
+from math import radians, degrees, cos, sin, asin, sqrt
+from typing import List, Tuple, Optional
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.contrib.sites.shortcuts import get_current_site
 from django.utils import timezone
 from django.conf import settings
-from .models import Clinic
+from django.db import connection
+from .models import Clinic, GeocodeCache
 
 
 def generate_email_confirmation_token():
@@ -132,6 +136,10 @@ def confirm_clinic_email(clinic, token):
 
 # ========== Location & Geocoding Utilities ==========
 
+# Mean radius of the earth in kilometers
+EARTH_RADIUS_KM = 6371
+
+
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     Calculate the great circle distance between two points 
@@ -147,13 +155,63 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
     c = 2 * asin(sqrt(a))
     
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
+    return c * EARTH_RADIUS_KM
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> List[Tuple[float, float, float, float]]:
+    """
+    Compute the lat/lng bounding box(es) enclosing a circle of radius_km.
+
+    Returns a list of (min_lat, max_lat, min_lng, max_lng) tuples. Normally
+    there is a single box; a circle crossing the antimeridian is split into
+    two boxes, and a circle reaching a pole covers every longitude.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - degrees(angular)
+    max_lat = latitude + degrees(angular)
+
+    # Circle contains a pole: every longitude is inside the band
+    if min_lat <= -90 or max_lat >= 90:
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+
+    ratio = sin(angular) / cos(radians(latitude))
+    if ratio >= 1:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    delta_lng = degrees(asin(ratio))
+    min_lng = longitude - delta_lng
+    max_lng = longitude + delta_lng
+
+    # Split the box when it wraps around the antimeridian
+    if min_lng < -180:
+        return [
+            (min_lat, max_lat, min_lng + 360, 180.0),
+            (min_lat, max_lat, -180.0, max_lng),
+        ]
+    if max_lng > 180:
+        return [
+            (min_lat, max_lat, min_lng, 180.0),
+            (min_lat, max_lat, -180.0, max_lng - 360),
+        ]
+    return [(min_lat, max_lat, min_lng, max_lng)]
+
+
+def bounding_box_q(latitude: float, longitude: float, radius_km: float):
+    """Build a Q filter over Clinic.latitude/longitude for the radius bounding box."""
+    from django.db.models import Q
+
+    query = Q()
+    for min_lat, max_lat, min_lng, max_lng in bounding_box(latitude, longitude, radius_km):
+        query |= Q(
+            latitude__gte=min_lat,
+            latitude__lte=max_lat,
+            longitude__gte=min_lng,
+            longitude__lte=max_lng,
+        )
+    return query
 
 
-def get_clinics_within_radius(latitude: float, longitude: float, radius_km: float = 50):
+def get_clinics_within_radius(latitude: float, longitude: float, radius_km: float = 50,
+                              use_bbox: bool = True, use_index: bool = False):
     """
     Get all clinics within a certain radius of given coordinates.
     Uses Haversine formula for distance calculation.
@@ -162,12 +220,20 @@ def get_clinics_within_radius(latitude: float, longitude: float, radius_km: floa
         latitude: User's latitude
         longitude: User's longitude
         radius_km: Search radius in kilometers (default: 50)
+        use_bbox: Prefilter candidates in SQL with a lat/lng bounding box
+            before running the exact Haversine check (default: True)
+        use_index: Answer from the per-worker in-memory clinic index and
+            only fetch matching rows by primary key instead (default: False;
+            the nearby API reaches the index through nearby_cache)
     
     Returns:
-        QuerySet of clinics with distance annotation, ordered by distance
+        List of clinics with distance attribute, ordered by distance
     """
-    from django.db.models import F
-    
+    if use_index:
+        from .services.clinic_index import get_clinic_index, hydrate_clinics
+        matches = get_clinic_index().within_radius(latitude, longitude, radius_km)
+        return hydrate_clinics(matches)
+
     # Get all clinics with coordinates that are active
     clinics = Clinic.objects.filter(
         latitude__isnull=False,
@@ -175,6 +241,8 @@ def get_clinics_within_radius(latitude: float, longitude: float, radius_km: floa
         email_confirmed=True,
         admin_approved=True
     )
+    if use_bbox:
+        clinics = clinics.filter(bounding_box_q(latitude, longitude, radius_km))
     
     # Calculate distance for each clinic
     clinics_with_distance = []
@@ -194,51 +262,123 @@ def get_clinics_within_radius(latitude: float, longitude: float, radius_km: floa
     return clinics_with_distance
 
 
-def geocode_address(address: str, city: str = None) -> Optional[Tuple[float, float]]:
+def get_nearest_clinics(latitude: float, longitude: float, k: int = 10, max_radius_km: Optional[float] = None):
+    """
+    Get the k active clinics nearest to the given coordinates, answered from
+    the in-memory clinic index.
+
+    Returns:
+        List of at most k clinics with distance attribute, ordered by distance
+    """
+    from .services.clinic_index import get_clinic_index, hydrate_clinics
+    matches = get_clinic_index().nearest(latitude, longitude, k, max_radius_km)
+    return hydrate_clinics(matches)
+
+
+def normalize_address(value: Optional[str]) -> str:
+    """Casefold, strip accents and collapse whitespace so equivalent addresses match."""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return ' '.join(value.casefold().replace(',', ' ').split())
+
+
+def normalize_city(value: Optional[str]) -> str:
+    """Lookup key stored in Clinic.city_key; "  São  Paulo " -> "sao paulo"."""
+    return normalize_address(value)[:80]
+
+
+def address_fingerprint(address: Optional[str], city: Optional[str] = None) -> str:
+    """Stable cache key for an address+city pair."""
+    raw = f"{normalize_address(address)}|{normalize_address(city)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def get_cached_geocode(address: str, city: str = None) -> Optional[GeocodeCache]:
+    """
+    Return the usable GeocodeCache entry for an address: a hit, or a miss
+    younger than GEOCODE_NEGATIVE_CACHE_TTL seconds (default: 7 days).
+    Returns None when the geocoder has to be queried.
     """
-    Convert an address to latitude/longitude coordinates using OpenStreetMap Nominatim.
+    cached = GeocodeCache.objects.filter(fingerprint=address_fingerprint(address, city)).first()
+    if cached is None or cached.is_hit:
+        return cached
+    negative_ttl = getattr(settings, 'GEOCODE_NEGATIVE_CACHE_TTL', 7 * 24 * 3600)
+    if timezone.now() - cached.looked_up_at < timedelta(seconds=negative_ttl):
+        return cached
+    return None
+
+
+def geocode_address(address: str, city: str = None, use_cache: bool = True,
+                    precision: str = 'street') -> Optional[Tuple[float, float]]:
+    """
+    Convert an address to latitude/longitude coordinates.
+    
+    City-level requests (precision='city', or no street address) are answered
+    by the offline CITY_GEOCODER_BACKEND. Street-level requests go to
+    GEOCODER_BACKEND (OpenStreetMap Nominatim); if the full address is not
+    found, the city is tried offline first and only then on Nominatim.
+    
+    Street-level results are stored in GeocodeCache, keyed by a normalized
+    address+city fingerprint. Hits are reused forever; misses are reused until
+    they are older than GEOCODE_NEGATIVE_CACHE_TTL. Service errors are not cached.
     
     Args:
         address: Street address
         city: City name
+        use_cache: Consult GeocodeCache before querying Nominatim (default: True)
+        precision: 'street' or 'city' (default: 'street')
     
     Returns:
         Tuple of (latitude, longitude) or None if geocoding fails
     """
+    from .services.geocoders import get_city_geocoder, get_geocoder
+    
+    if precision == 'city' or not address:
+        city_geocoder = get_city_geocoder()
+        coords = city_geocoder.geocode('', city or address) if city_geocoder else None
+        if coords:
+            return coords
+    
+    if use_cache:
+        cached = get_cached_geocode(address, city)
+        if cached:
+            return cached.coords
+    
+    from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+    
+    street_geocoder = get_geocoder('street')
     try:
-        from geopy.geocoders import Nominatim
-        from geopy.exc import GeocoderTimedOut, GeocoderServiceError
-        
-        # Create geolocator with user agent
-        geolocator = Nominatim(user_agent="fammo_veterinary_app", timeout=10)
-        
-        # Build full address
-        full_address = f"{address}, {city}" if city else address
-        
-        # Geocode the address
-        location = geolocator.geocode(full_address)
-        
-        if location:
-            return (location.latitude, location.longitude)
-        else:
+        coords = street_geocoder.geocode(address, city)
+        if not coords and city and address:
             # Try with just city if full address failed
-            if city:
-                location = geolocator.geocode(city)
-                if location:
-                    return (location.latitude, location.longitude)
-        
+            city_geocoder = get_city_geocoder()
+            coords = (city_geocoder and city_geocoder.geocode('', city)) or street_geocoder.geocode('', city)
     except (GeocoderTimedOut, GeocoderServiceError) as e:
         print(f"Geocoding service error: {e}")
+        return None
     except Exception as e:
         print(f"Geocoding error: {e}")
+        return None
     
-    return None
+    GeocodeCache.objects.update_or_create(
+        fingerprint=address_fingerprint(address, city),
+        defaults={
+            'address': (address or '')[:220],
+            'city': (city or '')[:80],
+            'latitude': round(coords[0], 6) if coords else None,
+            'longitude': round(coords[1], 6) if coords else None,
+            'looked_up_at': timezone.now(),
+        },
+    )
+    return coords
 
 
 def get_location_from_ip(ip_address: str) -> Optional[dict]:
     """
-    Get approximate location from IP address.
-    This is a placeholder - integrate with IP geolocation service.
+    Get approximate location from IP address using the shared MaxMind
+    GeoLite2 City reader (see core.geoip).
     
     Args:
         ip_address: User's IP address
@@ -246,28 +386,17 @@ def get_location_from_ip(ip_address: str) -> Optional[dict]:
     Returns:
         Dictionary with latitude, longitude, city, country or None
     """
-    # TODO: Implement IP geolocation
-    # Options:
-    # 1. MaxMind GeoIP2 (you already have GeoLite2-Country.mmdb)
-    # 2. ip-api.com (free tier available)
-    # 3. ipinfo.io
-    
-    try:
-        # Example using MaxMind GeoLite2:
-        # import geoip2.database
-        # reader = geoip2.database.Reader('GeoLite2-City.mmdb')
-        # response = reader.city(ip_address)
-        # return {
-        #     'latitude': response.location.latitude,
-        #     'longitude': response.location.longitude,
-        #     'city': response.city.name,
-        #     'country': response.country.name
-        # }
-        pass
-    except Exception as e:
-        print(f"IP geolocation error: {e}")
+    from core.geoip import lookup_ip
     
-    return None
+    location = lookup_ip(ip_address)
+    if not location or location['latitude'] is None or location['longitude'] is None:
+        return None
+    return {
+        'latitude': location['latitude'],
+        'longitude': location['longitude'],
+        'city': location['city'],
+        'country': location['country'],
+    }
 
 
 def get_client_ip(request) -> str:
@@ -281,3 +410,11 @@ def get_client_ip(request) -> str:
     else:
         ip = request.META.get('REMOTE_ADDR')
     return ip
+
+
+def upsert_unique_fields(*fields: str) -> Optional[List[str]]:
+    """
+    `unique_fields` for bulk_create(update_conflicts=True): PostgreSQL and
+    SQLite need the conflict target, MySQL (ON DUPLICATE KEY UPDATE) rejects it.
+    """
+    return list(fields) if connection.features.supports_update_conflicts_with_target else None
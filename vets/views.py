@@ -7,26 +7,34 @@ from django.views.generic import (
     CreateView, DetailView, ListView, UpdateView, 
     TemplateView, View
 )
-from django.db.models import Q, Count
+from django.conf import settings
+from django.core.cache import cache
 from django.http import JsonResponse, Http404
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from django.core.paginator import Paginator
-from datetime import datetime, timedelta
+import hashlib
 import json
 
-from .models import Clinic, VetProfile, ReferralCode, ReferredUser, ReferralStatus
+from .models import Clinic, VetProfile, ReferralCode, ReferralVisitSource
+from .services.cities import city_filter, resolve_city_centroid
+from .services.clinic_search import search_clinic_ids, search_clinics
+from .services.specializations import filter_by_specializations, get_specialization_facets
+from .services.clinic_index import get_clinic_set_version
+from .services.pagination import CountedPaginator, KeysetPage, keyset_paginate
+from .services.referral_stats import get_referral_stats
+from .services.referral_rollups import code_performance, daily_series, get_rollup_watermark, window_totals
+from .services.referral_visits import record_referral_visit
+from .services.referrals import resolve_referral_code, track_referral_conversions
 from .forms import (
     ClinicRegistrationForm, ClinicProfileForm, VetProfileForm, 
     ReferralCodeForm, ClinicSearchForm
 )
 from .utils import (
     send_clinic_confirmation_email, send_admin_notification_email,
-    confirm_clinic_email, is_confirmation_token_valid
+    confirm_clinic_email, is_confirmation_token_valid, normalize_city
 )
 from django.contrib.auth.decorators import user_passes_test
 from django.utils.decorators import method_decorator
-from userapp.models import Profile
 
 User = get_user_model()
 
@@ -130,36 +138,91 @@ class PartnerClinicsListView(ListView):
     template_name = 'vets/partner_clinics.html'
     context_object_name = 'clinics'
     paginate_by = 12
+    paginator_class = CountedPaginator
     
     def get_queryset(self):
         # Show clinics that have confirmed email (public listing)
         # Badge will only show for admin_approved clinics
         queryset = Clinic.objects.filter(
             email_confirmed=True
-        ).order_by('name')
+        ).order_by('name', 'id').prefetch_related('specialization_tags').with_active_referral_code()
         
         # Handle search within email-confirmed clinics
-        form = ClinicSearchForm(self.request.GET)
-        if form.is_valid():
-            search = form.cleaned_data.get('search')
-            city = form.cleaned_data.get('city')
-            
-            if search:
-                queryset = queryset.filter(
-                    Q(name__icontains=search) |
-                    Q(city__icontains=search) |
-                    Q(specializations__icontains=search)
-                )
+        self.search_form = ClinicSearchForm(self.request.GET)
+        if self.search_form.is_valid():
+            search = self.search_form.cleaned_data.get('search')
+            city = self.search_form.cleaned_data.get('city')
             
             if city:
-                queryset = queryset.filter(city__icontains=city)
+                queryset = queryset.filter(city_filter(city))
+            
+            selected = self.request.GET.getlist('specialization')
+            if selected:
+                queryset = filter_by_specializations(queryset, selected)
+            
+            if search:
+                # Ranked full-text search; results are ordered by relevance
+                results = search_clinics(queryset, search)
+                self.total_clinics = len(results)
+                return results
         
+        self.total_clinics = self.get_total(queryset)
         return queryset
     
+    def get_total(self, queryset):
+        """COUNT(*) for the current filters, cached per clinic-set version and filter signature"""
+        params = self.request.GET
+        signature = '|'.join([
+            normalize_city(params.get('city', '')),
+            ','.join(sorted(set(params.getlist('specialization')))),
+        ])
+        key = f"vets:directory_count:{get_clinic_set_version()}:{hashlib.sha1(signature.encode()).hexdigest()}"
+        return cache.get_or_set(key, queryset.count, timeout=getattr(settings, 'VETS_FACET_CACHE_TIMEOUT', 600))
+    
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return self.paginator_class(
+            queryset, per_page, count=self.total_clinics, orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page, **kwargs
+        )
+    
+    def paginate_queryset(self, queryset, page_size):
+        # Search results (relevance order) and legacy ?page= links use numbered pages;
+        # the directory itself is paged by (name, id) cursors
+        if isinstance(queryset, list) or self.request.GET.get(self.page_kwarg):
+            return super().paginate_queryset(queryset, page_size)
+        try:
+            page = keyset_paginate(
+                queryset, page_size,
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except ValueError:
+            raise Http404('Invalid page cursor')
+        return (None, page, page.object_list, page.has_other_pages())
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['search_form'] = ClinicSearchForm(self.request.GET)
-        context['total_clinics'] = self.get_queryset().count()
+        context['search_form'] = self.search_form
+        context['total_clinics'] = self.total_clinics
+        context['keyset_paginated'] = isinstance(context['page_obj'], KeysetPage)
+        
+        # Query string of the current filters, for pagination and facet links
+        params = self.request.GET.copy()
+        for key in (self.page_kwarg, 'after', 'before'):
+            params.pop(key, None)
+        context['filter_query'] = params.urlencode()
+        
+        # Specialization facets; each links to the listing with that tag toggled
+        selected = self.request.GET.getlist('specialization')
+        facets = []
+        for facet in get_specialization_facets(self.request.GET.get('city', ''), selected):
+            toggled = params.copy()
+            if facet['selected']:
+                toggled.setlist('specialization', [slug for slug in selected if slug != facet['slug']])
+            else:
+                toggled.setlist('specialization', selected + [facet['slug']])
+            facets.append({**facet, 'query': toggled.urlencode()})
+        context['specialization_facets'] = facets
         return context
 
 
@@ -175,7 +238,7 @@ class ClinicDetailView(DetailView):
         """Show clinics that have confirmed email"""
         return Clinic.objects.filter(
             email_confirmed=True
-        )
+        ).prefetch_related('specialization_tags').with_active_referral_code()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -203,7 +266,7 @@ class ClinicOwnerRequiredMixin(LoginRequiredMixin):
             return self.handle_no_permission()
         
         try:
-            self.clinic = request.user.owned_clinics.first()
+            self.clinic = request.user.owned_clinics.with_active_referral_code().first()
             if not self.clinic:
                 messages.error(request, "You don't have a registered clinic.")
                 return redirect('vets:clinic_register')
@@ -222,15 +285,12 @@ class ClinicDashboardView(ClinicOwnerRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         clinic = self.clinic
         
-        # Basic stats
+        # Basic stats (denormalized counters, one row)
+        stats = get_referral_stats(clinic)
         context['clinic'] = clinic
-        context['total_referrals'] = clinic.referred_users.count()
-        context['active_referrals'] = clinic.referred_users.filter(
-            status=ReferralStatus.ACTIVE
-        ).count()
-        context['new_referrals'] = clinic.referred_users.filter(
-            status=ReferralStatus.NEW
-        ).count()
+        context['total_referrals'] = stats.total_referrals
+        context['active_referrals'] = stats.active_referrals
+        context['new_referrals'] = stats.new_referrals
         
         # Verification status
         context['verification_status'] = {
@@ -314,22 +374,19 @@ class ClinicReferralsView(ClinicOwnerRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         clinic = self.clinic
         
-        # Referral statistics
+        # Referral statistics (denormalized counters, one row)
+        stats = get_referral_stats(clinic)
         context['clinic'] = clinic
-        context['total_referrals'] = clinic.referred_users.count()
-        context['new_referrals'] = clinic.referred_users.filter(
-            status=ReferralStatus.NEW
-        ).count()
-        context['active_referrals'] = clinic.referred_users.filter(
-            status=ReferralStatus.ACTIVE
-        ).count()
-        
-        # Referrals list with pagination
+        context['total_referrals'] = stats.total_referrals
+        context['new_referrals'] = stats.new_referrals
+        context['active_referrals'] = stats.active_referrals
+        
+        # Referrals list with pagination; the total is already known
         referrals = clinic.referred_users.select_related(
             'user', 'referral_code'
         ).order_by('-created_at')
         
-        paginator = Paginator(referrals, 20)
+        paginator = CountedPaginator(referrals, 20, count=stats.total_referrals)
         page_number = self.request.GET.get('page')
         context['referrals'] = paginator.get_page(page_number)
         
@@ -374,54 +431,50 @@ class ClinicAnalyticsView(ClinicOwnerRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         clinic = self.clinic
         
-        # Time-based analytics
-        now = datetime.now()
-        last_30_days = now - timedelta(days=30)
-        last_7_days = now - timedelta(days=7)
-        
         context['clinic'] = clinic
         
-        # Referral statistics
+        # Totals from the counters row, time windows from the daily rollups
+        referral_stats = get_referral_stats(clinic)
+        windows = window_totals(clinic, days=(7, 30))
         context['stats'] = {
-            'total_referrals': clinic.referred_users.count(),
-            'referrals_30_days': clinic.referred_users.filter(
-                created_at__gte=last_30_days
-            ).count(),
-            'referrals_7_days': clinic.referred_users.filter(
-                created_at__gte=last_7_days
-            ).count(),
-            'conversion_rate': self._calculate_conversion_rate(clinic),
+            'total_referrals': referral_stats.total_referrals,
+            'referrals_30_days': windows[30]['signups'],
+            'referrals_7_days': windows[7]['signups'],
+            'conversion_rate': referral_stats.conversion_rate,
         }
         
         # Referral code performance
-        code_stats = []
-        for code in clinic.referral_codes.all():
-            referrals_count = code.referreduser_set.count()
-            code_stats.append({
-                'code': code.code,
-                'referrals': referrals_count,
-                'is_active': code.is_active,
-            })
-        
-        context['code_stats'] = sorted(
-            code_stats, 
-            key=lambda x: x['referrals'], 
-            reverse=True
-        )
+        context['code_stats'] = [
+            {**row, 'referrals': row['signups']} for row in code_performance(clinic)
+        ]
+        context['rollup_updated_at'] = get_rollup_watermark()
         
         return context
+
+
+class ClinicAnalyticsSeriesAPIView(ClinicOwnerRequiredMixin, View):
+    """JSON time series of daily referral activity for the analytics charts"""
     
-    def _calculate_conversion_rate(self, clinic):
-        """Calculate conversion rate from referrals to active users"""
-        total_referrals = clinic.referred_users.count()
-        if total_referrals == 0:
-            return 0
-        
-        active_users = clinic.referred_users.filter(
-            status=ReferralStatus.ACTIVE
-        ).count()
-        
-        return round((active_users / total_referrals) * 100, 1)
+    def get(self, request, *args, **kwargs):
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            return JsonResponse({
+                'error': 'Invalid number of days'
+            }, status=400)
+        days = min(max(days, 1), 365)
+        code = request.GET.get('code') or None
+        
+        return JsonResponse({
+            'success': True,
+            'series': daily_series(self.clinic, days=days, code=code),
+            'codes': code_performance(self.clinic),
+            'updated_at': get_rollup_watermark(),
+            'search_params': {
+                'days': days,
+                'code': code,
+            }
+        })
 
 
 class ReferralLandingView(TemplateView):
@@ -432,76 +485,48 @@ class ReferralLandingView(TemplateView):
         context = super().get_context_data(**kwargs)
         code = kwargs.get('code')
         
-        try:
-            referral_code = ReferralCode.objects.select_related('clinic').get(
-                code=code,
-                is_active=True
-            )
-            
-            # Check if the clinic has confirmed their email
-            # No need to wait for admin approval to start accepting referrals
-            clinic = referral_code.clinic
-            if not clinic.email_confirmed:
-                raise Http404("This clinic is not currently accepting referrals")
-            
-            context['referral_code'] = referral_code
-            context['clinic'] = clinic
-            
-            # Store referral code in session for later use
-            self.request.session['referral_code'] = code
-            
-        except ReferralCode.DoesNotExist:
+        referral_code = resolve_referral_code(code)
+        if referral_code is None:
             raise Http404("Referral code not found or inactive")
         
+        # Check if the clinic has confirmed their email
+        # No need to wait for admin approval to start accepting referrals
+        clinic = referral_code.clinic
+        if not clinic.email_confirmed:
+            raise Http404("This clinic is not currently accepting referrals")
+        
+        context['referral_code'] = referral_code
+        context['clinic'] = clinic
+        
+        # Store referral code in session for later use
+        self.request.session['referral_code'] = code
+        record_referral_visit(referral_code, ReferralVisitSource.LANDING)
+        
         return context
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class TrackReferralAPIView(View):
-    """API endpoint to track referral conversions"""
+    """
+    API endpoint to track referral conversions.
+    
+    Accepts one {"email", "referral_code"} object, or a batch as a JSON array
+    or {"conversions": [...]} (up to VETS_REFERRAL_BATCH_MAX_SIZE items),
+    answered with per-item results.
+    """
     
     def post(self, request, *args, **kwargs):
         try:
             data = json.loads(request.body)
-            email = data.get('email')
-            referral_code = data.get('referral_code')
-            
-            if not email or not referral_code:
-                return JsonResponse({'error': 'Missing required fields'}, status=400)
-            
-            # Get referral code object
-            try:
-                ref_code_obj = ReferralCode.objects.get(
-                    code=referral_code,
-                    is_active=True
-                )
-            except ReferralCode.DoesNotExist:
-                return JsonResponse({'error': 'Invalid referral code'}, status=400)
+            if isinstance(data, dict) and 'conversions' in data:
+                data = data['conversions']
+            if isinstance(data, list):
+                return self.post_batch(data)
             
-            # Check if user exists
-            try:
-                user = User.objects.get(email=email)
-                user_exists = True
-            except User.DoesNotExist:
-                user = None
-                user_exists = False
-            
-            # Create or update referred user record
-            referred_user, created = ReferredUser.objects.get_or_create(
-                clinic=ref_code_obj.clinic,
-                referral_code=ref_code_obj,
-                user=user,
-                defaults={
-                    'email_capture': email if not user_exists else '',
-                    'status': ReferralStatus.ACTIVE if user_exists else ReferralStatus.NEW
-                }
-            )
-            
-            if not created and user_exists and not referred_user.user:
-                # Update existing record with user
-                referred_user.user = user
-                referred_user.status = ReferralStatus.ACTIVE
-                referred_user.save()
+            # A batch of one: the same (clinic, user) upsert as the batch path
+            result = track_referral_conversions([data])[0]
+            if not result['success']:
+                return JsonResponse({'error': result['error']}, status=400)
             
             return JsonResponse({
                 'success': True,
@@ -512,6 +537,22 @@ class TrackReferralAPIView(View):
             return JsonResponse({'error': 'Invalid JSON'}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
+    
+    def post_batch(self, conversions):
+        max_size = getattr(settings, 'VETS_REFERRAL_BATCH_MAX_SIZE', 500)
+        if not conversions:
+            return JsonResponse({'error': 'Empty batch'}, status=400)
+        if len(conversions) > max_size:
+            return JsonResponse({'error': f'Batch too large (max {max_size})'}, status=400)
+        
+        results = track_referral_conversions(conversions)
+        tracked = sum(1 for result in results if result['success'])
+        return JsonResponse({
+            'success': True,
+            'tracked': tracked,
+            'failed': len(results) - tracked,
+            'results': results,
+        })
 
 
 def clinic_terms_and_conditions_view(request):
@@ -539,7 +580,11 @@ class NearbyClinicAPIView(View):
             # Get parameters
             lat = request.GET.get('lat')
             lng = request.GET.get('lng')
-            radius = request.GET.get('radius', 50)  # Default 50km
+            radius = request.GET.get('radius')
+            limit = request.GET.get('limit') or request.GET.get('k')
+            cursor = request.GET.get('cursor') or None
+            fields = request.GET.get('fields')
+            query = request.GET.get('q', '').strip()
             
             if not lat or not lng:
                 return JsonResponse({
@@ -550,51 +595,75 @@ class NearbyClinicAPIView(View):
             try:
                 latitude = float(lat)
                 longitude = float(lng)
-                radius_km = float(radius)
+                radius_km = float(radius) if radius else None
             except ValueError:
                 return JsonResponse({
                     'error': 'Invalid coordinate format'
                 }, status=400)
             
+            # Page size: a positive integer, capped at VETS_NEARBY_MAX_LIMIT
+            if limit:
+                try:
+                    limit = int(limit)
+                except ValueError:
+                    limit = 0
+                if limit < 1:
+                    return JsonResponse({
+                        'error': 'Limit must be a positive integer'
+                    }, status=400)
+                limit = min(limit, getattr(settings, 'VETS_NEARBY_MAX_LIMIT', 100))
+            else:
+                limit = None
+            
             # Validate coordinates
             if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
                 return JsonResponse({
                     'error': 'Invalid coordinates'
                 }, status=400)
             
-            # Get nearby clinics
-            from .utils import get_clinics_within_radius
-            clinics = get_clinics_within_radius(latitude, longitude, radius_km)
+            from .services.nearby_cache import PUBLIC_FIELDS, get_nearby_clinics_data
             
-            # Serialize clinic data
-            clinic_data = []
-            for clinic in clinics:
-                clinic_data.append({
-                    'id': clinic.id,
-                    'name': clinic.name,
-                    'slug': clinic.slug,
-                    'city': clinic.city,
-                    'address': clinic.address,
-                    'phone': clinic.phone,
-                    'email': clinic.email,
-                    'website': clinic.website,
-                    'working_hours': clinic.working_hours,
-                    'specializations': clinic.specializations,
-                    'latitude': float(clinic.latitude) if clinic.latitude else None,
-                    'longitude': float(clinic.longitude) if clinic.longitude else None,
-                    'distance': clinic.distance,
-                    'is_verified': clinic.is_verified,
-                    'logo': clinic.logo.url if clinic.logo else None,
-                })
+            # Clamp radius and page size; k-nearest without a radius searches the max radius
+            max_radius = getattr(settings, 'VETS_NEARBY_MAX_RADIUS_KM', 100)
+            if radius_km is None:
+                radius_km = max_radius if limit else 50  # Default 50km
+            radius_km = min(max(radius_km, 0), max_radius)
+            
+            if fields:
+                fields = [f.strip() for f in fields.split(',') if f.strip()]
+                unknown = sorted(set(fields) - PUBLIC_FIELDS)
+                if unknown:
+                    return JsonResponse({
+                        'error': f"Unknown fields: {', '.join(unknown)}"
+                    }, status=400)
+            
+            # Optional text filter: keep search matches, still ordered by distance
+            clinic_ids = None
+            if query:
+                from .services.clinic_index import active_clinics
+                clinic_ids = set(search_clinic_ids(active_clinics(), query))
+            
+            # Get nearby clinics (serialized), served from the grid cache when possible
+            try:
+                result = get_nearby_clinics_data(
+                    latitude, longitude, radius_km, limit=limit, cursor=cursor, fields=fields,
+                    clinic_ids=clinic_ids,
+                )
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
             
             return JsonResponse({
                 'success': True,
-                'count': len(clinic_data),
-                'clinics': clinic_data,
+                'count': len(result.clinics),
+                'clinics': result.clinics,
+                'next_cursor': result.next_cursor,
+                'cached': result.cached,
                 'search_params': {
                     'latitude': latitude,
                     'longitude': longitude,
-                    'radius_km': radius_km
+                    'radius_km': radius_km,
+                    'limit': limit,
+                    'q': query,
                 }
             })
             
@@ -604,45 +673,77 @@ class NearbyClinicAPIView(View):
             }, status=500)
 
 
+@method_decorator(user_passes_test(lambda u: u.is_staff or u.is_superuser), name='dispatch')
+class NearbyClinicCacheStatsAPIView(View):
+    """Admin-only: hit/miss counters of the nearby clinics response cache"""
+    
+    def get(self, request, *args, **kwargs):
+        from .services.nearby_cache import get_nearby_cache_stats
+        return JsonResponse({
+            'success': True,
+            'stats': get_nearby_cache_stats(),
+        })
+
+
 class ClinicsByCityAPIView(View):
     """API endpoint to find clinics by city name"""
     
     def get(self, request, *args, **kwargs):
         try:
             city = request.GET.get('city', '').strip()
-            radius = request.GET.get('radius', 10)
+            radius = request.GET.get('radius')
+            exact = request.GET.get('match') == 'exact'
+            query = request.GET.get('q', '').strip()
             
             if not city:
                 return JsonResponse({
                     'error': 'City name is required'
                 }, status=400)
             
-            # Search for clinics in the city
+            # City + radius: resolve the city center once and run the spatial query
+            if radius:
+                try:
+                    radius_km = float(radius)
+                except ValueError:
+                    return JsonResponse({
+                        'error': 'Invalid radius'
+                    }, status=400)
+                radius_km = min(max(radius_km, 0), getattr(settings, 'VETS_NEARBY_MAX_RADIUS_KM', 100))
+                
+                centroid = resolve_city_centroid(city)
+                if centroid:
+                    from .services.clinic_index import active_clinics
+                    from .services.nearby_cache import get_nearby_clinics_data
+                    clinic_ids = set(search_clinic_ids(active_clinics(), query)) if query else None
+                    result = get_nearby_clinics_data(centroid[0], centroid[1], radius_km, clinic_ids=clinic_ids)
+                    return JsonResponse({
+                        'success': True,
+                        'count': len(result.clinics),
+                        'clinics': result.clinics,
+                        'cached': result.cached,
+                        'search_params': {
+                            'city': city,
+                            'latitude': centroid[0],
+                            'longitude': centroid[1],
+                            'radius_km': radius_km,
+                            'q': query,
+                        }
+                    })
+                # Unknown city: fall back to matching the name
+            
+            # Search for clinics in the city (indexed exact/prefix match on city_key)
             clinics = Clinic.objects.filter(
-                city__icontains=city,
+                city_filter(city, prefix=not exact),
                 email_confirmed=True,
                 admin_approved=True
             ).order_by('name')
+            if query:
+                # Most relevant first
+                clinics = search_clinics(clinics, query)
             
             # Serialize clinic data
-            clinic_data = []
-            for clinic in clinics:
-                clinic_data.append({
-                    'id': clinic.id,
-                    'name': clinic.name,
-                    'slug': clinic.slug,
-                    'city': clinic.city,
-                    'address': clinic.address,
-                    'phone': clinic.phone,
-                    'email': clinic.email,
-                    'website': clinic.website,
-                    'working_hours': clinic.working_hours,
-                    'specializations': clinic.specializations,
-                    'latitude': float(clinic.latitude) if clinic.latitude else None,
-                    'longitude': float(clinic.longitude) if clinic.longitude else None,
-                    'is_verified': clinic.is_verified,
-                    'logo': clinic.logo.url if clinic.logo else None,
-                })
+            from .services.nearby_cache import serialize_clinic
+            clinic_data = [serialize_clinic(clinic) for clinic in clinics]
             
             return JsonResponse({
                 'success': True,
@@ -650,6 +751,33 @@ class ClinicsByCityAPIView(View):
                 'clinics': clinic_data,
                 'search_params': {
                     'city': city,
+                    'match': 'exact' if exact else 'prefix',
+                    'q': query,
+                }
+            })
+            
+        except Exception as e:
+            return JsonResponse({
+                'error': f'Server error: {str(e)}'
+            }, status=500)
+
+
+class SpecializationFacetsAPIView(View):
+    """API endpoint with per-specialization clinic counts for the public directory"""
+    
+    def get(self, request, *args, **kwargs):
+        try:
+            city = request.GET.get('city', '').strip()
+            selected = request.GET.getlist('specialization')
+            
+            facets = get_specialization_facets(city, selected)
+            
+            return JsonResponse({
+                'success': True,
+                'facets': facets,
+                'search_params': {
+                    'city': city,
+                    'specialization': selected,
                 }
             })
             
@@ -705,32 +833,11 @@ class ClinicNearbyUsersReportView(TemplateView):
 
         users = []
         if clinic.latitude is not None and clinic.longitude is not None:
-            from .utils import haversine_distance
-            # Only profiles with consent and coordinates
-            qs = Profile.objects.filter(
-                location_consent=True,
-                latitude__isnull=False,
-                longitude__isnull=False,
-            ).select_related('user')
-            for prof in qs:
-                try:
-                    dist = haversine_distance(
-                        float(clinic.latitude), float(clinic.longitude),
-                        float(prof.latitude), float(prof.longitude)
-                    )
-                except Exception:
-                    continue
-                if dist <= radius_km:
-                    users.append({
-                        'profile': prof,
-                        'email': getattr(prof.user, 'email', ''),
-                        'first_name': prof.first_name,
-                        'last_name': prof.last_name,
-                        'city': prof.city,
-                        'distance_km': round(dist, 1),
-                        'location_updated_at': prof.location_updated_at,
-                    })
-            users.sort(key=lambda x: x['distance_km'])
+            from .services.distances import profiles_within_radius
+            # Only profiles with consent and coordinates, distances computed in one vectorized pass
+            users = profiles_within_radius(
+                float(clinic.latitude), float(clinic.longitude), radius_km
+            )
 
         context.update({
             'clinic': clinic,